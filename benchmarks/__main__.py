@@ -0,0 +1,305 @@
+"""
+Throughput, latency percentiles and peak memory of the main client calls
+
+Each scenario runs sequentially, from a pool of threads sharing one DiscourseClient and
+concurrently on one AsyncDiscourseClient, against the fake forum in benchmarks.forum::
+
+    python -m benchmarks --latency 0.005 --output results.json
+    python -m benchmarks --quick --compare results.json
+
+Results are written as JSON, to stdout unless --output is given. With --compare, any
+scenario whose throughput fell by more than --threshold percent against an earlier
+result file is reported and the exit status is 1.
+
+Latencies are per HTTP request. Every scenario runs twice, once for the timings and once
+under tracemalloc for the peak memory, as tracing slows Python down considerably.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from pydiscourse import jsonlib
+from pydiscourse.client import DiscourseClient
+from pydiscourse.metrics import perf_counter
+
+from benchmarks import conditional_get, models, request_overhead, sso
+from benchmarks.forum import POSTS_PER_CHUNK, TOPICS_PER_PAGE, USERS_PER_PAGE
+
+try:
+    import asyncio
+    from pydiscourse.async_client import AsyncDiscourseClient
+except ImportError:
+    AsyncDiscourseClient = None
+
+
+FULL = {'topics': 3000, 'users': 5000, 'posts': 2000, 'lookups': 1000}
+QUICK = {'topics': 600, 'users': 1000, 'posts': 400, 'lookups': 200}
+
+
+class Forum(object):
+    """ benchmarks.forum running in a child process """
+    def __init__(self, latency, topics, users, posts):
+        self.topics = topics
+        self.users = users
+        self.posts = posts
+        self._process = subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.forum', '--latency', str(latency), '--topics', str(topics),
+             '--users', str(users), '--posts', str(posts)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.url = self._process.stdout.readline().decode('ascii').strip()
+
+    def close(self):
+        self._process.stdin.close()
+        self._process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _pages(items, per_page):
+    return (items + per_page - 1) // per_page
+
+
+# Each scenario takes the forum, the options and a list to append request latencies to,
+# and returns the number of items it received.
+
+def _client(forum, options, latencies):
+    client = DiscourseClient(forum.url, 'system', 'key', pool_maxsize=options.workers)
+    client.after_request.append(lambda event: latencies.append(event.total))
+    return client
+
+
+def user_lookup_sequential(forum, options, latencies):
+    with _client(forum, options, latencies) as client:
+        for i in range(1, options.lookups + 1):
+            client.user('user{0}'.format(i))
+    return options.lookups
+
+
+def user_lookup_threaded(forum, options, latencies):
+    names = ['user{0}'.format(i) for i in range(1, options.lookups + 1)]
+    with _client(forum, options, latencies) as client:
+        with ThreadPoolExecutor(options.workers) as pool:
+            return len(list(pool.map(client.user, names)))
+
+
+def latest_topics_sequential(forum, options, latencies):
+    with _client(forum, options, latencies) as client:
+        return sum(1 for _ in client.iter_latest_topics())
+
+
+def latest_topics_threaded(forum, options, latencies):
+    with _client(forum, options, latencies) as client:
+        return sum(1 for _ in client.iter_latest_topics(prefetch=True))
+
+
+def user_list_sequential(forum, options, latencies):
+    with _client(forum, options, latencies) as client:
+        return sum(1 for _ in client.iter_users())
+
+
+def user_list_threaded(forum, options, latencies):
+    with _client(forum, options, latencies) as client:
+        return sum(1 for _ in client.iter_users(prefetch=True))
+
+
+def topic_stream_sequential(forum, options, latencies):
+    with _client(forum, options, latencies) as client:
+        return sum(1 for _ in client.fetch_topic_stream(1, chunk_size=POSTS_PER_CHUNK, workers=1))
+
+
+def topic_stream_threaded(forum, options, latencies):
+    with _client(forum, options, latencies) as client:
+        return sum(1 for _ in client.fetch_topic_stream(1, chunk_size=POSTS_PER_CHUNK, workers=options.workers))
+
+
+def _run_async(forum, options, latencies, calls):
+    """ Await calls(client) one by one with up to options.workers in flight, returns the results """
+    async def timed(semaphore, call):
+        async with semaphore:
+            start = perf_counter()
+            result = await call
+            latencies.append(perf_counter() - start)
+            return result
+
+    async def main():
+        semaphore = asyncio.Semaphore(options.workers)
+        async with AsyncDiscourseClient(forum.url, 'system', 'key', limit=options.workers) as client:
+            return await asyncio.gather(*[timed(semaphore, call) for call in calls(client)])
+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(main())
+    finally:
+        loop.close()
+
+
+def user_lookup_async(forum, options, latencies):
+    return len(_run_async(forum, options, latencies, lambda client: [
+        client.user('user{0}'.format(i)) for i in range(1, options.lookups + 1)]))
+
+
+def latest_topics_async(forum, options, latencies):
+    # with the page count known up front every page can be requested at once
+    pages = _run_async(forum, options, latencies, lambda client: [
+        client.latest_topics(page=page) for page in range(_pages(forum.topics, TOPICS_PER_PAGE))])
+    return sum(len(page['topic_list']['topics']) for page in pages)
+
+
+def user_list_async(forum, options, latencies):
+    pages = _run_async(forum, options, latencies, lambda client: [
+        client.users(page=page) for page in range(1, _pages(forum.users, USERS_PER_PAGE) + 1)])
+    return sum(len(page) for page in pages)
+
+
+def topic_stream_async(forum, options, latencies):
+    topic = _run_async(forum, options, latencies, lambda client: [client._get('/t/1.json')])[0]
+    stream = topic['post_stream']['stream'][POSTS_PER_CHUNK:]
+    chunks = _run_async(forum, options, latencies, lambda client: [
+        client.posts(1, stream[n:n + POSTS_PER_CHUNK]) for n in range(0, len(stream), POSTS_PER_CHUNK)])
+    return len(topic['post_stream']['posts']) + sum(len(c['post_stream']['posts']) for c in chunks)
+
+
+SCENARIOS = [
+    ('user_lookup', user_lookup_sequential, user_lookup_threaded, user_lookup_async),
+    ('latest_topics', latest_topics_sequential, latest_topics_threaded, latest_topics_async),
+    ('user_list', user_list_sequential, user_list_threaded, user_list_async),
+    ('topic_stream', topic_stream_sequential, topic_stream_threaded, topic_stream_async),
+]
+
+
+def percentile(ordered, p):
+    """ Nearest rank percentile of a sorted list """
+    if not ordered:
+        return None
+    rank = max(int(round(p / 100.0 * len(ordered))), 1)
+    return ordered[rank - 1]
+
+
+def measure(scenario, forum, options):
+    latencies = []
+    start = perf_counter()
+    items = scenario(forum, options, latencies)
+    elapsed = perf_counter() - start
+
+    tracemalloc.start()
+    try:
+        scenario(forum, options, [])
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'items': items,
+        'seconds': round(elapsed, 4),
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'items_per_second': round(items / elapsed, 1),
+        'latency_ms': dict((name, round(percentile(latencies, p) * 1000, 3))
+                           for name, p in (('p50', 50), ('p95', 95), ('p99', 99), ('max', 100))),
+        'peak_memory_kb': peak // 1024,
+    }
+
+
+def micro():
+    return {
+        'request_overhead': [request_overhead.run(topics, number) for topics, number in ((1, 2000), (30, 1000))],
+        'conditional_get': [conditional_get.run(None), conditional_get.run(conditional_get.ConditionalCache())],
+        'sso': sso.run(),
+        'models': models.run(10000),
+    }
+
+
+def compare(results, baseline, threshold):
+    """ The scenarios whose throughput dropped by more than threshold percent """
+    before = dict(((s['scenario'], s['mode']), s) for s in baseline['scenarios'])
+    regressions = []
+    for result in results['scenarios']:
+        old = before.get((result['scenario'], result['mode']))
+        if old is None or not old['items_per_second']:
+            continue
+        change = (result['items_per_second'] / old['items_per_second'] - 1) * 100
+        if change < -threshold:
+            regressions.append('{0} {1}: {2:.1f} -> {3:.1f} items/s ({4:+.1f}%)'.format(
+                result['scenario'], result['mode'], old['items_per_second'], result['items_per_second'], change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--latency', type=float, default=0.005, help='seconds the forum waits before responding')
+    parser.add_argument('--workers', type=int, default=8, help='threads or async requests in flight')
+    parser.add_argument('--quick', action='store_true', help='smaller fixtures, for a fast check')
+    parser.add_argument('--scenario', action='append', choices=[s[0] for s in SCENARIOS],
+                        help='run only this scenario, may be repeated')
+    parser.add_argument('--mode', action='append', choices=['sequential', 'threaded', 'async'],
+                        help='run only this mode, may be repeated')
+    parser.add_argument('--no-micro', dest='micro', action='store_false',
+                        help='skip the request_overhead, conditional_get, sso and models benchmarks')
+    parser.add_argument('--output', help='file to write the JSON results to')
+    parser.add_argument('--compare', help='earlier JSON results to check for throughput regressions')
+    parser.add_argument('--threshold', type=float, default=10, help='percent drop reported by --compare')
+    options = parser.parse_args(argv)
+
+    sizes = QUICK if options.quick else FULL
+    options.lookups = sizes['lookups']
+    modes = options.mode or ['sequential', 'threaded', 'async']
+    if AsyncDiscourseClient is None and 'async' in modes:
+        sys.stderr.write('aiohttp is not installed, skipping async runs\n')
+        modes = [m for m in modes if m != 'async']
+
+    results = {
+        'environment': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'json_backend': jsonlib.backend,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        },
+        'settings': dict(sizes, latency=options.latency, workers=options.workers),
+        'scenarios': [],
+    }
+
+    with Forum(options.latency, sizes['topics'], sizes['users'], sizes['posts']) as forum:
+        for name, sequential, threaded, async_ in SCENARIOS:
+            if options.scenario and name not in options.scenario:
+                continue
+            for mode, scenario in zip(['sequential', 'threaded', 'async'], [sequential, threaded, async_]):
+                if mode not in modes:
+                    continue
+                result = dict(scenario=name, mode=mode, **measure(scenario, forum, options))
+                sys.stderr.write('{scenario:>14} {mode:>10} {items_per_second:>10} items/s {requests_per_second:>8} '
+                                 'req/s  p95 {latency_ms[p95]}ms  peak {peak_memory_kb}kB\n'.format(**result))
+                results['scenarios'].append(result)
+
+    if options.micro:
+        results['micro'] = micro()
+
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if options.compare:
+        with open(options.compare) as f:
+            regressions = compare(results, json.load(f), options.threshold)
+        for line in regressions:
+            sys.stderr.write('regression: ' + line + '\n')
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,62 @@
+"""
+Bytes and CPU saved by ConditionalCache when polling an unchanged listing
+
+    python -m benchmarks.conditional_get
+"""
+import json
+import time
+
+from pydiscourse.cache import ConditionalCache
+from pydiscourse.client import DiscourseClient
+from tests.stubserver import StubServer
+
+
+POLLS = 50
+TOPICS = 1000
+
+
+def latest_route():
+    body = json.dumps({'topic_list': {'topics': [
+        {'id': i, 'title': 'Topic number {0}'.format(i), 'excerpt': 'x' * 200, 'posters': [{'user_id': i}]}
+        for i in range(TOPICS)
+    ]}}).encode('utf-8')
+    etag = '"static"'
+
+    def latest(request):
+        if request.headers.get('If-None-Match') == etag:
+            return (304, {'ETag': etag}, b'')
+        return (200, {'ETag': etag, 'Content-Type': 'application/json; charset=utf-8'}, body)
+
+    return latest
+
+
+def run(conditional):
+    received = [0]
+
+    def count(response, *args, **kwargs):
+        received[0] += len(response.content)
+
+    with StubServer({'/latest.json': latest_route()}) as server:
+        with DiscourseClient(server.url, 'system', 'key', conditional=conditional) as client:
+            client.session.hooks['response'].append(count)
+            start, cpu = time.time(), time.thread_time()
+            for _ in range(POLLS):
+                client.latest_topics()
+            elapsed, cpu = time.time() - start, time.thread_time() - cpu
+
+    return {
+        'conditional': conditional is not None,
+        'polls': POLLS,
+        'bytes_received': received[0],
+        'client_cpu_ms_per_poll': round(cpu / POLLS * 1000, 3),
+        'ms_per_poll': round(elapsed / POLLS * 1000, 3),
+    }
+
+
+def main():
+    print(run(None))
+    print(run(ConditionalCache()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""
+A fake Discourse forum served by the test StubServer, with realistically sized fixtures
+
+    forum = FakeForum(topics=3000, users=5000, posts_per_topic=2000)
+    with forum.serve(latency=0.005) as server:
+        client = DiscourseClient(server.url, 'system', 'key')
+
+Responses that don't depend on the query string are encoded up front. The benchmark
+runner serves the forum from a separate process, so that neither the server's threads
+nor its allocations are counted against the client::
+
+    python -m benchmarks.forum --latency 0.005   # prints the URL, serves until stdin closes
+"""
+import argparse
+import json
+import sys
+
+from pydiscourse.client import JSON_CONTENT
+from tests.stubserver import StubServer
+
+
+TOPICS_PER_PAGE = 30
+USERS_PER_PAGE = 100
+POSTS_PER_CHUNK = 20
+BIO = 'Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * 4
+COOKED = '<p>' + 'Sed ut perspiciatis unde omnis iste natus error sit voluptatem. ' * 8 + '</p>'
+
+
+def _encode(document):
+    return (200, {'Content-Type': JSON_CONTENT}, json.dumps(document).encode('utf-8'))
+
+
+def _page(request):
+    try:
+        return int(request.query.get('page', ['0'])[0])
+    except ValueError:
+        return 0
+
+
+class FakeForum(object):
+    def __init__(self, topics=3000, users=5000, posts_per_topic=2000, categories=50):
+        self.topics = [self._topic(i) for i in range(1, topics + 1)]
+        self.users = [self._user(i) for i in range(1, users + 1)]
+        self.categories = [{'id': i, 'name': 'Category {0}'.format(i), 'slug': 'category-{0}'.format(i),
+                            'color': 'FFFFFF', 'topic_count': topics // categories}
+                           for i in range(1, categories + 1)]
+        self.posts_per_topic = posts_per_topic
+
+        self._latest = self._paginate_topics()
+        self._user_pages = [_encode(self.users[i:i + USERS_PER_PAGE])
+                            for i in range(0, len(self.users), USERS_PER_PAGE)]
+        self._user_details = dict((u['username'], _encode({'user': u})) for u in self.users)
+        self._categories = _encode({'category_list': {'categories': self.categories}})
+
+    def _topic(self, i):
+        return {
+            'id': i, 'title': 'Topic number {0} about something'.format(i), 'slug': 'topic-{0}'.format(i),
+            'posts_count': 20, 'reply_count': 19, 'highest_post_number': 20, 'category_id': i % 50 + 1,
+            'created_at': '2014-04-01T12:00:00.000Z', 'bumped_at': '2014-04-02T12:00:00.000Z',
+            'excerpt': BIO, 'views': i * 3, 'like_count': i % 17, 'pinned': False, 'closed': False,
+            'posters': [{'extras': None, 'description': 'Original Poster', 'user_id': i % 100 + 1}],
+        }
+
+    def _user(self, i):
+        return {
+            'id': i, 'username': 'user{0}'.format(i), 'name': 'User {0}'.format(i),
+            'email': 'user{0}@example.com'.format(i), 'trust_level': i % 5, 'active': True,
+            'created_at': '2014-04-01T12:00:00.000Z', 'bio_raw': BIO, 'post_count': i % 300,
+            'avatar_template': '/user_avatar/localhost/user{0}/{{size}}/1.png'.format(i),
+        }
+
+    def _post(self, topic_id, post_id):
+        return {
+            'id': post_id, 'topic_id': topic_id, 'post_number': post_id - topic_id * 100000,
+            'username': 'user{0}'.format(post_id % 100 + 1), 'cooked': COOKED,
+            'created_at': '2014-04-01T12:00:00.000Z', 'reply_count': 0, 'reads': 12, 'score': 1.5,
+        }
+
+    def _paginate_topics(self):
+        pages = []
+        for n, start in enumerate(range(0, len(self.topics), TOPICS_PER_PAGE)):
+            topic_list = {'can_create_topic': True, 'per_page': TOPICS_PER_PAGE,
+                          'topics': self.topics[start:start + TOPICS_PER_PAGE]}
+            if start + TOPICS_PER_PAGE < len(self.topics):
+                topic_list['more_topics_url'] = '/latest?page={0}'.format(n + 1)
+            pages.append(_encode({'users': [], 'topic_list': topic_list}))
+        return pages
+
+    def stream(self, topic_id):
+        return [topic_id * 100000 + n for n in range(1, self.posts_per_topic + 1)]
+
+    def routes(self):
+        empty = _encode({'topic_list': {'topics': []}})
+
+        def latest(request):
+            page = _page(request)
+            return self._latest[page] if page < len(self._latest) else empty
+
+        def users(request):
+            page = _page(request) - 1
+            return self._user_pages[page] if 0 <= page < len(self._user_pages) else _encode([])
+
+        def user(request):
+            username = request.path[len('/users/'):-len('.json')]
+            return self._user_details.get(username) or (404, {'errors': ['not found']})
+
+        def topic(request):
+            topic_id = int(request.path.split('/')[-1][:-len('.json')])
+            stream = self.stream(topic_id)
+            posts = [self._post(topic_id, i) for i in stream[:POSTS_PER_CHUNK]]
+            return _encode({'id': topic_id, 'post_stream': {'stream': stream, 'posts': posts}})
+
+        def posts(request):
+            topic_id = int(request.path.split('/')[2])
+            ids = [int(i) for i in request.query.get('post_ids[]', [])]
+            return _encode({'post_stream': {'posts': [self._post(topic_id, i) for i in ids]}})
+
+        return {
+            '/latest.json': latest,
+            '/admin/users/list/active.json': users,
+            '/users/*.json': user,
+            '/categories.json': lambda request: self._categories,
+            '/t/*/posts.json': posts,
+            '/t/*.json': topic,
+        }
+
+    def serve(self, latency=0):
+        return StubServer(self.routes(), delay=latency)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve a fake Discourse forum until stdin is closed')
+    parser.add_argument('--latency', type=float, default=0, help='seconds to wait before each response')
+    parser.add_argument('--topics', type=int, default=3000)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--posts', type=int, default=2000, help='posts per topic')
+    args = parser.parse_args(argv)
+
+    forum = FakeForum(topics=args.topics, users=args.users, posts_per_topic=args.posts)
+    with forum.serve(args.latency) as server:
+        sys.stdout.write(server.url + '\n')
+        sys.stdout.flush()
+        sys.stdin.read()
+
+
+if __name__ == '__main__':
+    main()
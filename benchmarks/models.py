@@ -0,0 +1,81 @@
+"""
+Memory held by posts and users as decoded dicts and as pydiscourse.models objects
+
+The samples are shaped like the JSON Discourse returns, nested lists and dicts included.
+
+    python -m benchmarks.models
+"""
+import json
+import timeit
+import tracemalloc
+
+from pydiscourse.jsonlib import loads
+from pydiscourse.models import Post, User
+
+
+def post(i):
+    return {
+        'id': i, 'name': 'User {0}'.format(i % 500), 'username': 'user{0}'.format(i % 500),
+        'avatar_template': '/user_avatar/forum.example.com/user{0}/{{size}}/1_2.png'.format(i % 500),
+        'created_at': '2014-04-01T12:00:00.000Z', 'updated_at': '2014-04-01T12:00:00.000Z',
+        'cooked': '<p>{0}</p>'.format('Reply text ' * 20), 'post_number': i % 2000 + 1, 'post_type': 1,
+        'reply_count': 0, 'reply_to_post_number': None, 'quote_count': 0, 'incoming_link_count': 0,
+        'reads': 12, 'score': 2.4, 'yours': False, 'topic_id': i // 2000 + 1, 'topic_slug': 'a-topic',
+        'display_username': 'User {0}'.format(i % 500), 'primary_group_name': None, 'version': 1,
+        'can_edit': False, 'can_delete': False, 'can_recover': False, 'user_title': None,
+        'actions_summary': [{'id': 2, 'count': 1}, {'id': 3, 'can_act': True}],
+        'moderator': False, 'admin': False, 'staff': False, 'user_id': i % 500, 'hidden': False,
+        'trust_level': 1, 'deleted_at': None, 'user_deleted': False, 'edit_reason': None,
+        'can_view_edit_history': True, 'wiki': False,
+    }
+
+
+def user(i):
+    return {
+        'id': i, 'username': 'user{0}'.format(i), 'name': 'User {0}'.format(i),
+        'avatar_template': '/user_avatar/forum.example.com/user{0}/{{size}}/1_2.png'.format(i),
+        'email': 'user{0}@example.com'.format(i), 'active': True, 'admin': False, 'moderator': False,
+        'last_seen_at': '2014-04-01T12:00:00.000Z', 'last_emailed_at': '2014-04-01T12:00:00.000Z',
+        'created_at': '2014-01-01T12:00:00.000Z', 'trust_level': 1, 'title': None, 'post_count': 12,
+        'days_visited': 30, 'time_read': 3600, 'staged': False, 'suspended_at': None,
+        'badges': [{'id': 1, 'name': 'Basic'}], 'groups': [{'id': 10, 'name': 'trust_level_0'}],
+    }
+
+
+def held(make):
+    """ Bytes still allocated after make() returns, the size of what it built """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        kept = make()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del kept
+    return after - before
+
+
+def run(count=50000):
+    results = {}
+    for name, sample, model in (('posts', post, Post), ('users', user, User)):
+        # decoded from JSON like the client does, so strings aren't shared between samples
+        body = json.dumps([sample(i) for i in range(count)])
+        dicts = held(lambda: loads(body))
+        items = loads(body)
+        models = held(lambda: model.many(items))
+        results[name] = {
+            'count': count,
+            'dicts_kb': dicts // 1024,
+            'models_kb': models // 1024,
+            'saved_percent': round((1 - float(models) / dicts) * 100, 1),
+            'model_seconds': round(min(timeit.repeat(lambda: model.many(items), number=1, repeat=3)), 4),
+        }
+    return results
+
+
+def main():
+    print(run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Per request overhead of DiscourseClient, without any network
+
+A transport adapter answers every request with a canned response, so the timings only
+cover parameter handling, the session and the response pipeline. The legacy pipeline,
+which logged repr(response.text) and then called response.json(), is timed for comparison.
+
+    python -m benchmarks.request_overhead
+"""
+import json
+import logging
+import timeit
+
+import requests
+from requests.adapters import BaseAdapter
+
+from pydiscourse import jsonlib
+from pydiscourse.client import DiscourseClient, JSON_CONTENT
+from pydiscourse.metrics import MetricsCollector
+
+
+class CannedAdapter(BaseAdapter):
+    def __init__(self, body):
+        super(CannedAdapter, self).__init__()
+        self.body = body
+
+    def send(self, request, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.headers['content-type'] = JSON_CONTENT
+        response.encoding = 'utf-8'
+        response._content = self.body
+        response.request = request
+        response.url = request.url
+        return response
+
+    def close(self):
+        pass
+
+
+def legacy_handle(response):
+    logging.getLogger('pydiscourse.client').debug('response %s: %s', response.status_code, repr(response.text))
+    return response.json()
+
+
+def body(topics):
+    return json.dumps({'topic_list': {'topics': [
+        {'id': i, 'title': u'Topic ☃ {0}'.format(i), 'excerpt': 'x' * 200} for i in range(topics)
+    ]}}).encode('utf-8')
+
+
+def run(topics, number):
+    client = DiscourseClient('http://stub', 'system', 'key', adapter=CannedAdapter(body(topics)))
+    response = client.session.get('http://stub/latest.json')
+
+    results = {'topics': topics, 'json_backend': jsonlib.backend}
+    results['request_us'] = timeit.timeit(client.latest_topics, number=number) / number * 1e6
+    client.after_request.append(MetricsCollector())
+    results['request_with_metrics_us'] = timeit.timeit(client.latest_topics, number=number) / number * 1e6
+    client.after_request.pop()
+    results['handle_us'] = timeit.timeit(lambda: client._handle_response(response), number=number) / number * 1e6
+    results['legacy_handle_us'] = timeit.timeit(lambda: legacy_handle(response), number=number) / number * 1e6
+    for key, value in results.items():
+        if key.endswith('_us'):
+            results[key] = round(value, 1)
+    return results
+
+
+def main():
+    for topics, number in ((1, 5000), (30, 2000), (1000, 50)):
+        print(run(topics, number))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Logins per second on one core, validating an SSO request and signing the redirect
+
+The legacy path keys a new HMAC for every call, compares signatures with != and splits
+the payload by hand, as sso_validate and sso_redirect_url used to (with the base64 calls
+updated so it runs on Python 3). The last run also rejects replays with a NonceStore.
+
+    python -m benchmarks.sso
+"""
+import base64
+import hashlib
+import hmac
+import timeit
+
+try:  # py3
+    from urllib.parse import unquote, urlencode
+except ImportError:
+    from urllib import unquote, urlencode
+
+from pydiscourse.sso import NonceStore, SSOHandler, sso_redirect_url, sso_validate
+
+
+SECRET = 'd836444a9e4084d5b224a60c208dce14'
+NONCE = 'cb68251eefb5211e58c00ff1395f0c0b'
+
+
+def request(nonce=NONCE):
+    payload = base64.b64encode(urlencode({
+        'nonce': nonce, 'return_sso_url': 'http://discuss.example.com/session/sso_login'}).encode('ascii'))
+    payload = payload.decode('ascii')
+    return payload, hmac.new(SECRET.encode('ascii'), payload.encode('ascii'), hashlib.sha256).hexdigest()
+
+
+def legacy_login(payload, signature):
+    payload = unquote(payload)
+    decoded = base64.b64decode(payload).decode('utf-8')
+    if 'nonce' not in decoded:
+        raise ValueError('Invalid payload..')
+    if hmac.new(SECRET.encode('ascii'), payload.encode('ascii'), hashlib.sha256).hexdigest() != signature:
+        raise ValueError('Payload does not match signature.')
+    nonce = decoded.split('=')[1]
+
+    return_payload = base64.b64encode(urlencode({
+        'nonce': nonce, 'email': 'test@test.com', 'external_id': 12, 'username': 'sam'}).encode('ascii'))
+    h = hmac.new(SECRET.encode('ascii'), return_payload, digestmod=hashlib.sha256)
+    return '/session/sso_login?%s' % urlencode({'sso': return_payload, 'sig': h.hexdigest()})
+
+
+def run(number=20000):
+    payload, signature = request()
+    handler = SSOHandler(SECRET)
+
+    def handler_login():
+        nonce = handler.validate(payload, signature)
+        return handler.redirect_url(nonce, 'test@test.com', 12, 'sam')
+
+    def function_login():
+        nonce = sso_validate(payload, signature, SECRET)
+        return sso_redirect_url(nonce, SECRET, 'test@test.com', 12, 'sam')
+
+    results = {}
+    for name, login in (('legacy', lambda: legacy_login(payload, signature)),
+                        ('functions', function_login), ('handler', handler_login)):
+        seconds = min(timeit.repeat(login, number=number, repeat=3))
+        results[name + '_logins_per_second'] = round(number / seconds)
+
+    # replay protection needs a fresh nonce for every login
+    logins = iter([request('{0:032x}'.format(i)) for i in range(number * 3)])
+    replay_checked = SSOHandler(SECRET, nonces=NonceStore(maxsize=number))
+
+    def replay_checked_login():
+        payload, signature = next(logins)
+        nonce = replay_checked.validate(payload, signature)
+        return replay_checked.redirect_url(nonce, 'test@test.com', 12, 'sam')
+
+    seconds = min(timeit.repeat(replay_checked_login, number=number, repeat=3))
+    results['handler_with_nonces_logins_per_second'] = round(number / seconds)
+    return results
+
+
+def main():
+    print(run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Throughput of DiscourseClient.fetch_topic_stream against a local stub server
+
+    python -m benchmarks.topic_stream
+"""
+import time
+import tracemalloc
+
+from pydiscourse.client import DiscourseClient
+from tests.stubserver import StubServer
+
+
+POSTS = 5000
+LATENCY = 0.01
+BODY = 'x' * 500
+
+
+def routes(stream):
+    def topic(request):
+        return {'post_stream': {'stream': stream, 'posts': []}}
+
+    def posts(request):
+        ids = [int(i) for i in request.query['post_ids[]']]
+        return {'post_stream': {'posts': [{'id': i, 'cooked': BODY} for i in ids]}}
+
+    return {'/t/1.json': topic, '/t/1/posts.json': posts}
+
+
+def run(workers, chunk_size=20):
+    stream = list(range(1, POSTS + 1))
+    with StubServer(routes(stream), delay=LATENCY) as server:
+        with DiscourseClient(server.url, 'system', 'key') as client:
+            tracemalloc.start()
+            start = time.time()
+            count = sum(1 for _ in client.fetch_topic_stream(1, chunk_size=chunk_size, workers=workers))
+            elapsed = time.time() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    return {
+        'workers': workers,
+        'posts': count,
+        'seconds': round(elapsed, 3),
+        'posts_per_second': round(count / elapsed),
+        'peak_kb': peak // 1024,
+    }
+
+
+def main():
+    for workers in (1, 4, 8):
+        print(run(workers))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+An asyncio client for the Discourse API, built on aiohttp
+
+It exposes the same wrappers as DiscourseClient, but every call returns a coroutine
+so a single process can keep many requests in flight::
+
+    async with AsyncDiscourseClient('http://example.com', 'system', API_KEY) as client:
+        users = await asyncio.gather(*[client.user(name) for name in usernames])
+
+Requires Python 3.5+ and aiohttp.
+"""
+import asyncio
+import inspect
+
+import aiohttp
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from pydiscourse.client import BaseDiscourseClient, _call_args
+
+
+class AsyncDiscourseClient(BaseDiscourseClient):
+    """ A non-blocking client for the Discourse API
+
+        limit: maximum number of simultaneous connections
+        limit_per_host: maximum number of simultaneous connections to the forum, 0 for no limit
+        session: an optional pre-configured aiohttp.ClientSession to use instead
+    """
+    def __init__(self, host, api_username, api_key, timeout=None, limit=100, limit_per_host=0,
+                 session=None, log_body_size=1000, auth='query', models=False):
+        super(AsyncDiscourseClient, self).__init__(host, api_username, api_key, timeout=timeout,
+                                                   log_body_size=log_body_size, auth=auth, models=models)
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self._owns_session = session is None
+        self.session = session
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """ Release pooled connections, a session passed in by the caller is left open """
+        if self._owns_session and self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def map(self, method, args, workers=8, **kwargs):
+        """ Like DiscourseClient.map(), with up to workers requests in flight """
+        if not callable(method):
+            method = getattr(self, method)
+        semaphore = asyncio.Semaphore(workers)
+
+        async def call(item):
+            async with semaphore:
+                return await method(*_call_args(item), **kwargs)
+
+        return list(await asyncio.gather(*[call(item) for item in args], return_exceptions=True))
+
+    def _get_session(self):
+        # aiohttp sessions are bound to the running loop, so create ours on first use
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host)
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
+
+    async def _then(self, result, callback):
+        if inspect.isawaitable(result):
+            result = await result
+        value = callback(result)
+        if inspect.isawaitable(value):
+            value = await value
+        return value
+
+    async def _request(self, verb, path, params, data=None):
+        params, headers = self._auth(params)
+        url = self.host + path
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        if data is not None:
+            # with the length given aiohttp sends the body as it is iterated, not chunked
+            headers = dict(headers, **data.headers)
+            headers['Content-Length'] = str(len(data))
+            data = _aiter(data)
+
+        session = self._get_session()
+        async with session.request(verb, url, params=_encode_params(params), headers=headers, data=data,
+                                   allow_redirects=False, timeout=timeout) as resp:
+            content = await resp.read()
+
+        return self._handle_response(_as_response(resp, content))
+
+
+def _encode_params(params):
+    """ aiohttp only accepts string values, expand lists the way requests does """
+    encoded = []
+    for key, value in params.items():
+        values = value if isinstance(value, (list, tuple)) else [value]
+        for v in values:
+            if v is None:
+                continue
+            encoded.append((key, v if isinstance(v, str) else str(v)))
+    return encoded
+
+
+async def _aiter(body):
+    for chunk in body:
+        yield chunk
+
+
+def _as_response(resp, content):
+    """ Wrap an aiohttp response as a requests.Response so response handling is shared """
+    response = requests.Response()
+    response.status_code = resp.status
+    response.reason = resp.reason
+    response.headers = CaseInsensitiveDict(resp.headers)
+    response.url = str(resp.url)
+    response.encoding = resp.charset
+    response._content = content
+    return response
@@ -0,0 +1,246 @@
+"""
+Bulk operations over many users, run on a bounded pool of threads
+
+    specs = ({'name': row.name, 'username': row.login, 'email': row.email,
+              'password': row.password, 'trust_level': 1} for row in rows)
+    for result in provision_users(client, specs, workers=16):
+        if result.error:
+            print(result.username, result.step, result.error)
+
+Avatars are uploaded the same way, streamed from disk, with the users already done
+recorded in a checkpoint file so an interrupted migration carries on where it stopped::
+
+    avatars = ((row.login, '/srv/avatars/{0}.png'.format(row.id)) for row in rows)
+    for result in upload_avatars(client, avatars, workers=16, checkpoint='avatars.done'):
+        print(result.username, result.error or '{0:.0f} kB/s'.format(result.bytes_per_second / 1024))
+
+Moderation calls run over many user ids and return a table of results, one per id,
+after an optional dry run that shows what would be done without sending anything::
+
+    results = bulk_suspend(client, spammer_ids, 365, 'Spam', workers=8)
+    failed = [r for r in results if r.error]
+
+Results are yielded in the order of the input while later users are still being
+processed, so arbitrarily long inputs are handled with bounded memory. Keep workers at
+or below the client's pool_maxsize so every thread gets a pooled connection.
+"""
+import collections
+import copy
+import io
+import os
+import threading
+import time
+
+from pydiscourse.client import _ordered_map
+from pydiscourse.exceptions import DiscourseError
+from pydiscourse.metrics import perf_counter
+from pydiscourse.ratelimit import RateLimiter
+
+
+ProvisionResult = collections.namedtuple('ProvisionResult', 'username user_id step error')
+
+
+ModerationResult = collections.namedtuple('ModerationResult', 'user_id action result error')
+
+
+class UploadResult(collections.namedtuple('UploadResult', 'username path size seconds error')):
+    __slots__ = ()
+
+    @property
+    def bytes_per_second(self):
+        return self.size / self.seconds if self.seconds else None
+
+
+class HoneypotCache(object):
+    """ Share one signup challenge between threads, refreshing it every ttl seconds """
+    def __init__(self, client, ttl=60):
+        self.client = client
+        self.ttl = ttl
+        self._value = None
+        self._fetched = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self._value is None or time.time() - self._fetched > self.ttl:
+                self._value = self.client.honeypot()
+                self._fetched = time.time()
+            return self._value
+
+
+def provision_users(client, specs, workers=8, reuse_honeypot=True, honeypot_ttl=60):
+    """ Create users and apply their settings, yielding a ProvisionResult per spec
+
+    Each spec is a dict of create_user arguments (name, username, email, password and any
+    extra fields) plus these optional steps, applied in order once the user exists:
+
+        trust_level: the trust level to grant
+        avatar_url: passed to update_avatar_from_url
+        preferences: a dict passed to set_preference
+
+    A failure stops the remaining steps for that user only, the result names the step
+    and carries the exception.
+
+        reuse_honeypot: answer every signup with one challenge, refreshed every honeypot_ttl
+        seconds, instead of requesting a challenge per user
+    """
+    honeypot = HoneypotCache(client, honeypot_ttl) if reuse_honeypot else None
+
+    def provision(spec):
+        spec = dict(spec)
+        trust_level = spec.pop('trust_level', None)
+        avatar_url = spec.pop('avatar_url', None)
+        preferences = spec.pop('preferences', None)
+        username = spec['username']
+
+        user_id = None
+        step = 'create_user'
+        try:
+            if honeypot is not None:
+                spec['honeypot'] = honeypot.get()
+            created = client.create_user(**spec)
+            if not created.get('success', True):
+                raise DiscourseError(created.get('message') or 'user not created')
+            user_id = created.get('user_id')
+
+            if trust_level is not None:
+                step = 'trust_level'
+                client.trust_level(user_id, trust_level)
+            if avatar_url:
+                step = 'update_avatar_from_url'
+                client.update_avatar_from_url(username, avatar_url)
+            if preferences:
+                step = 'set_preference'
+                client.set_preference(username, **preferences)
+        except Exception as e:
+            return ProvisionResult(username, user_id, step, e)
+
+        return ProvisionResult(username, user_id, None, None)
+
+    return _ordered_map(provision, specs, workers)
+
+
+class UploadCheckpoint(object):
+    """ The usernames whose uploads finished, appended to a file one per line as they do """
+    def __init__(self, path):
+        self.path = path
+        self._done = set()
+        self._lock = threading.Lock()
+
+        if os.path.exists(path):
+            with io.open(path, 'rb+') as f:
+                end = 0
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        # cut short by a crash, drop it so the next name starts a new line
+                        f.truncate(end)
+                        break
+                    end += len(line)
+                    self._done.add(line[:-1].decode('utf-8'))
+        self._file = io.open(path, 'a', encoding='utf-8')
+
+    def add(self, username):
+        with self._lock:
+            self._done.add(username)
+            self._file.write(username + u'\n')
+            self._file.flush()
+
+    def __contains__(self, username):
+        return username in self._done
+
+    def __len__(self):
+        return len(self._done)
+
+    def close(self):
+        self._file.close()
+
+
+def upload_avatars(client, avatars, workers=8, checkpoint=None):
+    """ Upload avatar images, yielding an UploadResult per user
+
+        avatars: (username, path) pairs, the files are streamed rather than read whole
+        checkpoint: an UploadCheckpoint or the path of one, users it lists are skipped
+            and those uploaded are added to it
+
+    Failed uploads are reported with their exception and left out of the checkpoint, so
+    running again with the same checkpoint retries only those and the users not reached.
+    """
+    owned = checkpoint is not None and not isinstance(checkpoint, UploadCheckpoint)
+    if owned:
+        checkpoint = UploadCheckpoint(checkpoint)
+
+    def upload(avatar):
+        username, path = avatar
+        size = 0
+        start = perf_counter()
+        try:
+            size = os.path.getsize(path)
+            client.update_avatar_image(username, path)
+        except Exception as e:
+            return UploadResult(username, path, size, perf_counter() - start, e)
+
+        if checkpoint is not None:
+            checkpoint.add(username)
+        return UploadResult(username, path, size, perf_counter() - start, None)
+
+    if checkpoint is not None:
+        avatars = (avatar for avatar in avatars if avatar[0] not in checkpoint)
+    try:
+        for result in _ordered_map(upload, avatars, workers):
+            yield result
+    finally:
+        if owned:
+            checkpoint.close()
+
+
+def bulk_suspend(client, user_ids, duration, reason, workers=8, dry_run=False, rate_limiter=None):
+    """ Suspend users for duration days, returns a ModerationResult per id """
+    return _moderate(client, 'suspend', user_ids, lambda client, user_id: client.suspend(user_id, duration, reason),
+                     workers, dry_run, rate_limiter)
+
+
+def bulk_delete_users(client, user_ids, block_email=False, block_ip=False, block_urls=False, workers=8,
+                      dry_run=False, rate_limiter=None):
+    """ Delete users, optionally blocking their email, IP and URLs, returns a ModerationResult per id """
+    flags = {'block_email': block_email, 'block_ip': block_ip, 'block_urls': block_urls}
+    flags = dict((name, 'true' if value else 'false') for name, value in flags.items())
+    return _moderate(client, 'delete_user', user_ids, lambda client, user_id: client.delete_user(user_id, **flags),
+                     workers, dry_run, rate_limiter)
+
+
+def bulk_trust_level(client, user_ids, level, workers=8, dry_run=False, rate_limiter=None):
+    """ Set the trust level of users, returns a ModerationResult per id """
+    return _moderate(client, 'trust_level', user_ids, lambda client, user_id: client.trust_level(user_id, level),
+                     workers, dry_run, rate_limiter)
+
+
+def _moderate(client, action, user_ids, call, workers, dry_run, rate_limiter):
+    """ call(client, user_id) for each distinct id on a pool of workers threads, in the order given
+
+    A failure is recorded in that id's result and the others carry on.
+
+    Discourse limits admin writes per minute, so the calls are paced by rate_limiter,
+    used in place of the client's own. Without one they go through the client's
+    rate_limiter, or if it has none a RateLimiter with Discourse's stock limits, which
+    allows a burst of 10 and then one write a second. Pass a RateLimiter matching your
+    site's limits to go faster, and give the client a RetryPolicy to retry the 429
+    responses that get through anyway.
+    """
+    user_ids = list(collections.OrderedDict.fromkeys(user_ids))
+    if dry_run:
+        return [ModerationResult(user_id, action, None, None) for user_id in user_ids]
+
+    if rate_limiter is None:
+        rate_limiter = client.rate_limiter or RateLimiter()
+    if rate_limiter is not client.rate_limiter:
+        # a copy sharing the session, so the caller's client keeps its limiter
+        client = copy.copy(client)
+        client.rate_limiter = rate_limiter
+
+    def moderate(user_id):
+        try:
+            return ModerationResult(user_id, action, call(client, user_id), None)
+        except Exception as e:
+            return ModerationResult(user_id, action, None, e)
+
+    return list(_ordered_map(moderate, user_ids, workers))
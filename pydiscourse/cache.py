@@ -0,0 +1,289 @@
+"""
+Caching of GET responses for DiscourseClient
+
+    cache = ResponseCache(ttls={'/categories.json': 300, '/users/*': 60})
+    client = DiscourseClient(host, api_username, api_key, cache=cache)
+    client.categories()  # fetched
+    client.categories()  # served from the cache
+    cache.stats()        # {'hits': 1, 'misses': 1, 'size': 1}
+
+Only the endpoints given a lifetime in ttls are cached, unless a default ttl is set.
+
+Writes made through the client invalidate cached reads of the same resource, where a
+resource is the path without its .json suffix: a PUT to /users/bob/preferences/email
+drops /users/bob.json, a POST to /categories drops /categories.json. Anything the
+rule can't see, eg a topic changed by a post edit, can be dropped with invalidate().
+The backends index entries by resource, so a write costs a lookup rather than a scan
+of the cache.
+
+ConditionalCache keeps the ETag and Last-Modified validators of GET responses instead,
+so every read still reaches the server but an unchanged resource comes back as an empty
+304 and the previously decoded payload is reused::
+
+    client = DiscourseClient(host, api_username, api_key, conditional=ConditionalCache())
+"""
+import collections
+import fnmatch
+import pickle
+import sqlite3
+import threading
+import time
+
+try:  # py3
+    from urllib.parse import urlencode
+except ImportError:
+    from urllib import urlencode
+
+
+class MemoryBackend(object):
+    """ An in-process LRU store holding at most maxsize entries """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = collections.OrderedDict()
+        self._resources = {}
+        # resource: keys stored for exactly that resource, and for it or any below it
+        self._exact = collections.defaultdict(set)
+        self._below = collections.defaultdict(set)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is not None:
+                self._data[key] = entry
+            return entry
+
+    def set(self, key, value, expires, resource=None):
+        """ resource: the resource the entry is a read of, see invalidate() """
+        with self._lock:
+            self._remove(key)
+            self._data[key] = (expires, value)
+            if resource is not None:
+                self._resources[key] = resource
+                self._exact[resource].add(key)
+                for path in [resource] + _ancestors(resource):
+                    self._below[path].add(key)
+            while len(self._data) > self.maxsize:
+                self._remove(next(iter(self._data)))
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._remove(key)
+
+    def invalidate(self, resource):
+        """ Drop the entries of resource, of the resources below it and of its ancestors """
+        with self._lock:
+            stale = set(self._below.get(resource, ()))
+            for path in _ancestors(resource):
+                stale.update(self._exact.get(path, ()))
+            for key in stale:
+                self._remove(key)
+
+    def keys(self):
+        with self._lock:
+            return list(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._resources.clear()
+            self._exact.clear()
+            self._below.clear()
+
+    def _remove(self, key):
+        self._data.pop(key, None)
+        resource = self._resources.pop(key, None)
+        if resource is None:
+            return
+        _discard(self._exact, resource, key)
+        for path in [resource] + _ancestors(resource):
+            _discard(self._below, path, key)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DiskBackend(object):
+    """ A SQLite backed LRU store, shared between processes using the same path """
+    def __init__(self, path, maxsize=10000):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('CREATE TABLE IF NOT EXISTS cache '
+                         '(key TEXT PRIMARY KEY, value BLOB, expires REAL, accessed REAL, resource TEXT)')
+        if 'resource' not in [row[1] for row in self._db.execute('PRAGMA table_info(cache)')]:
+            # a cache written by an older version
+            self._db.execute('ALTER TABLE cache ADD COLUMN resource TEXT')
+        self._db.execute('CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS cache_resource ON cache (resource)')
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute('SELECT expires, value FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute('UPDATE cache SET accessed = ? WHERE key = ?', (time.time(), key))
+            return row[0], bytes(row[1])
+
+    def set(self, key, value, expires, resource=None):
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO cache (key, value, expires, accessed, resource) '
+                             'VALUES (?, ?, ?, ?, ?)', (key, sqlite3.Binary(value), expires, time.time(), resource))
+            self._db.execute('DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                             'ORDER BY accessed DESC LIMIT -1 OFFSET ?)', (self.maxsize,))
+
+    def delete(self, keys):
+        with self._lock:
+            self._db.executemany('DELETE FROM cache WHERE key = ?', [(k,) for k in keys])
+
+    def invalidate(self, resource):
+        """ Drop the entries of resource, of the resources below it and of its ancestors """
+        exact = [resource] + _ancestors(resource)
+        # '0' sorts right after '/', so the range holds every resource below this one
+        with self._lock:
+            self._db.execute('DELETE FROM cache WHERE resource IN ({0}) OR (resource > ? AND resource < ?)'
+                             .format(', '.join('?' * len(exact))), exact + [resource + '/', resource + '0'])
+
+    def keys(self):
+        with self._lock:
+            return [row[0] for row in self._db.execute('SELECT key FROM cache')]
+
+    def clear(self):
+        with self._lock:
+            self._db.execute('DELETE FROM cache')
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+    def close(self):
+        self._db.close()
+
+
+class ResponseCache(object):
+    """ Cache decoded GET responses with a per endpoint time to live
+
+        ttl: lifetime in seconds for paths no glob matches, by default 0, so only the
+            endpoints in ttls are cached
+        ttls: {path glob: seconds}, the first matching glob wins, eg {'/t/*': 10}
+        backend: MemoryBackend (the default) or DiskBackend, or any object with the same methods
+    """
+    def __init__(self, ttl=0, ttls=None, backend=None):
+        self.ttl = ttl
+        self.ttls = ttls or {}
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def ttl_for(self, path):
+        for pattern, ttl in self.ttls.items():
+            if fnmatch.fnmatchcase(path, pattern):
+                return ttl
+        return self.ttl
+
+    def get(self, key):
+        entry = self.backend.get(key)
+        if entry is not None and entry[0] > time.time():
+            self._count(hit=True)
+            return True, pickle.loads(entry[1])
+
+        self._count(hit=False)
+        return False, None
+
+    def set(self, key, path, value):
+        ttl = self.ttl_for(path)
+        if ttl > 0:
+            self.backend.set(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), time.time() + ttl,
+                             _resource(path))
+
+    def invalidate(self, path):
+        """ Drop every cached read of the resource at path, its parents and children """
+        self.backend.invalidate(_resource(path))
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.backend)}
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+
+class ConditionalCache(object):
+    """ Remember validators and payloads of GET responses for conditional requests
+
+        backend: MemoryBackend (the default) or DiskBackend, bounding how many URLs are tracked
+    """
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.revalidated = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, key):
+        """ The stored (etag, last_modified, payload) entry for key, or None """
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+        return pickle.loads(entry[1])
+
+    def headers(self, entry):
+        headers = {}
+        if entry is not None:
+            etag, last_modified = entry[:2]
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def payload(self, entry):
+        """ The decoded response stored with entry, after the server answered 304 """
+        with self._lock:
+            self.revalidated += 1
+        return pickle.loads(entry[2])
+
+    def store(self, key, headers, decoded):
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+
+        payload = pickle.dumps(decoded, pickle.HIGHEST_PROTOCOL)
+        entry = pickle.dumps((etag, last_modified, payload), pickle.HIGHEST_PROTOCOL)
+        self.backend.set(key, entry, float('inf'))
+
+
+def cache_key(path, params, api_username):
+    """ Responses depend on who is asking, so the acting user is part of the key """
+    params = dict(params)
+    params.pop('api_key', None)
+    params.setdefault('api_username', api_username)
+    return u'{0}?{1}'.format(path, urlencode(sorted(params.items()), doseq=True))
+
+
+def _resource(path):
+    path = path.split('?', 1)[0]
+    if path.endswith('.json'):
+        path = path[:-5]
+    return path.rstrip('/')
+
+
+def _ancestors(resource):
+    """ /users/bob/summary -> ['/users/bob', '/users'] """
+    parts = resource.split('/')
+    return ['/'.join(parts[:n]) for n in range(len(parts) - 1, 1, -1)]
+
+
+def _discard(index, resource, key):
+    keys = index.get(resource)
+    if keys is not None:
+        keys.discard(key)
+        if not keys:
+            del index[resource]
@@ -0,0 +1,90 @@
+"""
+An in-memory index of a forum's categories, by id, name and slug
+
+DiscourseClient fills one from /categories.json the first time a category has to be
+resolved by name and keeps it up to date as categories are created through it. When
+create_category() is given a parent the index doesn't know, it is reloaded once in case
+the parent was created elsewhere; category() falls back to requesting the name as given.
+"""
+import threading
+
+
+class CategoryIndex(object):
+    """ Look up categories by id, or by name or slug within their parent
+
+    Names and slugs are matched case insensitively, as Discourse does. Lookups don't lock,
+    changes are made to copies of what they might be reading.
+    """
+    def __init__(self, categories=None):
+        self.loaded = False
+        self._lock = threading.Lock()
+        self._by_id = {}
+        self._by_name = {}
+        if categories is not None:
+            self.load(categories)
+
+    def load(self, categories):
+        """ Replace the index with categories, including nested subcategory_list entries """
+        by_id = {}
+        by_name = {}
+        for category in _walk(categories):
+            _insert(by_id, by_name, category)
+        with self._lock:
+            self._by_id = by_id
+            self._by_name = by_name
+            self.loaded = True
+
+    def add(self, category):
+        with self._lock:
+            _insert(self._by_id, self._by_name, category)
+
+    def get(self, category_id):
+        return self._by_id.get(category_id)
+
+    def find(self, name, parent=None):
+        """ The category called name (or with that slug), or None
+
+        parent narrows the search to the children of a category name, slug or id. Without
+        it a top level category is preferred, then any category with a unique match.
+        """
+        candidates = self._by_name.get(_fold(name), [])
+        if parent is not None:
+            parent_category = self.get(parent) or self.find(parent)
+            if parent_category is None:
+                return None
+            candidates = [c for c in candidates if c.get('parent_category_id') == parent_category['id']]
+            return candidates[0] if candidates else None
+
+        top_level = [c for c in candidates if not c.get('parent_category_id')]
+        if top_level:
+            return top_level[0]
+        return candidates[0] if len(candidates) == 1 else None
+
+    def __len__(self):
+        return len(self._by_id)
+
+
+def _fold(name):
+    return name.lower() if hasattr(name, 'lower') else name
+
+
+def _insert(by_id, by_name, category):
+    """ Add category to the maps, replacing rather than changing the lists lookups may be reading """
+    previous = by_id.get(category['id'])
+    if previous is not None:
+        for key, candidates in list(by_name.items()):
+            if previous in candidates:
+                by_name[key] = [c for c in candidates if c is not previous]
+
+    by_id[category['id']] = category
+    for key in set(_fold(category.get(field)) for field in ('name', 'slug') if category.get(field)):
+        by_name[key] = by_name.get(key, []) + [category]
+
+
+def _walk(categories):
+    for category in categories:
+        yield category
+        for subcategory in category.get('subcategory_list') or []:
+            subcategory.setdefault('parent_category_id', category['id'])
+        for subcategory in _walk(category.get('subcategory_list') or []):
+            yield subcategory
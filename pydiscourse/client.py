@@ -1,36 +1,87 @@
 #!/usr/bin/env python
+import collections
 import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+try:  # py3
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from urlparse import urlparse, parse_qs
 
 import requests
 
+from pydiscourse.cache import cache_key
+from pydiscourse.categories import CategoryIndex
 from pydiscourse.exceptions import DiscourseError, DiscourseServerError, DiscourseClientError
+from pydiscourse.jsonlib import loads
+from pydiscourse.models import Category, Post, Topic, User
+from pydiscourse.multipart import MultipartFile
+from pydiscourse.metrics import RequestEvent, TimedHTTPAdapter, connect_time, perf_counter, reset_connect_time
+from pydiscourse.streaming import iter_items
 
 
 log = logging.getLogger('pydiscourse.client')
 
+JSON_CONTENT = 'application/json; charset=utf-8'
+AUTH_MODES = ('query', 'header')
 
-class DiscourseClient(object):
-    """ A basic client for the Discourse API that implements the raw API
+SettingsReport = collections.namedtuple('SettingsReport', 'changed unchanged failed')
 
-    This class will attempt to remain roughly similar to the discourse_api rails API
+
+class BaseDiscourseClient(object):
+    """ The Discourse API wrappers, shared by DiscourseClient and AsyncDiscourseClient
+
+    Subclasses provide the transport by implementing _request. Wrappers that need to
+    post-process a response, or issue a follow up request, chain through _then so the
+    same code works whether _request returns a value or an awaitable.
+
+        auth: 'query' to send the credentials as api_key/api_username parameters, which
+            every Discourse version accepts, or 'header' to send them as Api-Key/Api-Username
+            headers, keeping them out of URLs and logs and letting identical GETs share a URL
+        log_body_size: how much of each response body to show in the debug log
+        models: return users, topics, posts and categories as the compact objects in
+            pydiscourse.models rather than dicts, from every wrapper that reads them and
+            from the iterators. Responses holding a list keep their shape, eg
+            latest_topics()['topic_list']['topics'] is a list of Topic. The responses to
+            writes stay dicts.
     """
-    def __init__(self, host, api_username, api_key, timeout=None):
+    def __init__(self, host, api_username, api_key, timeout=None, log_body_size=1000, auth='query',
+                 models=False):
+        if auth not in AUTH_MODES:
+            raise ValueError('auth must be one of {0}, not {1!r}'.format(', '.join(AUTH_MODES), auth))
         self.host = host
         self.api_username = api_username
         self.api_key = api_key
+        self.auth = auth
         self.timeout = timeout
+        self.log_body_size = log_body_size
+        self.models = models
+        self.category_index = CategoryIndex()
 
     def user(self, username):
-        return self._get('/users/{0}.json'.format(username))['user']
+        return self._then(self._get('/users/{0}.json'.format(username)), lambda r: self._model(User, r['user']))
 
-    def create_user(self, name, username, email, password, **kwargs):
+    def create_user(self, name, username, email, password, honeypot=None, **kwargs):
         """ active='true', to avoid sending activation emails
+
+        honeypot: a response from honeypot() to answer the signup challenge with, a fresh
+        one is requested when not given
         """
-        r = self._get('/users/hp.json')
-        challenge = r['challenge'][::-1]  # reverse challenge, discourse security check
-        confirmations = r['value']
-        return self._post('/users', name=name, username=username, email=email,
-                  password=password, password_confirmation=confirmations, challenge=challenge, **kwargs)
+        def create(r):
+            challenge = r['challenge'][::-1]  # reverse challenge, discourse security check
+            confirmations = r['value']
+            return self._post('/users', name=name, username=username, email=email,
+                      password=password, password_confirmation=confirmations, challenge=challenge, **kwargs)
+
+        if honeypot is not None:
+            return create(honeypot)
+        return self._then(self.honeypot(), create)
+
+    def honeypot(self):
+        """ The signup challenge, it stays valid for a while and can be reused across users """
+        return self._get('/users/hp.json')
 
     def trust_level(self, userid, level):
         return self._put('/admin/users/{0}/trust_level'.format(userid), level=level)
@@ -40,14 +91,18 @@ class DiscourseClient(object):
 
     def list_users(self, type, **kwargs):
         """ optional user search: filter='test@example.com' or filter='scott' """
-        return self._get('/admin/users/list/{0}.json'.format(type), **kwargs)      
+        return self._then(self._get('/admin/users/list/{0}.json'.format(type), **kwargs),
+                          lambda r: self._model(User, r))
 
     def update_avatar_from_url(self, username, url, **kwargs):
         return self._post('/users/{0}/preferences/avatar'.format(username), file=url, **kwargs)
 
     def update_avatar_image(self, username, img, **kwargs):
-        files = {'file': img}
-        return self._post('/users/{0}/preferences/avatar'.format(username), files=files, **kwargs)
+        """ img: the image's path, an open binary file or its bytes (a bytearray on Python 2), files are
+            streamed from disk
+        """
+        return self._request('POST', '/users/{0}/preferences/avatar'.format(username), kwargs,
+                             data=MultipartFile(img))
 
     def toggle_gravatar(self, username, state=True, **kwargs):
         url = '/users/{0}/preferences/avatar/toggle'.format(username)
@@ -91,32 +146,36 @@ class DiscourseClient(object):
         if filter is None:
             filter = 'active'
 
-        return self._get('/admin/users/list/{0}.json'.format(filter), **kwargs)
+        return self._then(self._get('/admin/users/list/{0}.json'.format(filter), **kwargs),
+                          lambda r: self._model(User, r))
 
     def private_messages(self, username=None, **kwargs):
         if username is None:
             username = self.api_username
-        return self._get('/topics/private-messages/{0}.json'.format(username), **kwargs)
+        return self._then(self._get('/topics/private-messages/{0}.json'.format(username), **kwargs), self._topic_list)
 
     def private_messages_unread(self, username=None, **kwargs):
         if username is None:
             username = self.api_username
-        return self._get('/topics/private-messages-unread/{0}.json'.format(username), **kwargs)
+        return self._then(self._get('/topics/private-messages-unread/{0}.json'.format(username), **kwargs), self._topic_list)
 
     def hot_topics(self, **kwargs):
-        return self._get('/hot.json', **kwargs)
+        return self._then(self._get('/hot.json', **kwargs), self._topic_list)
 
     def latest_topics(self, **kwargs):
-        return self._get('/latest.json', **kwargs)
+        return self._then(self._get('/latest.json', **kwargs), self._topic_list)
 
     def new_topics(self, **kwargs):
-        return self._get('/new.json', **kwargs)
+        return self._then(self._get('/new.json', **kwargs), self._topic_list)
 
     def topic(self, slug, topic_id, **kwargs):
-        return self._get('/t/{0}/{1}.json'.format(slug, topic_id), **kwargs)
+        return self._then(self._get('/t/{0}/{1}.json'.format(slug, topic_id), **kwargs),
+                          lambda r: self._model(Topic, r))
 
     def post(self, topic_id, post_id, **kwargs):
-        return self._get('/t/{0}/{1}.json'.format(topic_id, post_id), **kwargs)
+        """ The topic, positioned at the post """
+        return self._then(self._get('/t/{0}/{1}.json'.format(topic_id, post_id), **kwargs),
+                          lambda r: self._model(Topic, r))
 
     def posts(self, topic_id, post_ids=None, **kwargs):
         """ Get a set of posts from a topic
@@ -125,9 +184,9 @@ class DiscourseClient(object):
         """
         if post_ids:
             kwargs['post_ids[]'] = post_ids
-        return self._get('/t/{0}/posts.json'.format(topic_id), **kwargs)
+        return self._then(self._get('/t/{0}/posts.json'.format(topic_id), **kwargs), self._post_stream)
 
-    def topic_timings(self, topic_id, time, timings={}, **kwargs):
+    def topic_timings(self, topic_id, time, timings=None, **kwargs):
         """ Set time spent reading a post
 
         time: overall time for the topic
@@ -137,13 +196,13 @@ class DiscourseClient(object):
         """
         kwargs['topic_id'] = topic_id
         kwargs['topic_time'] = time
-        for post_num, timing in timings.items():
+        for post_num, timing in (timings or {}).items():
             kwargs['timings[{0}]'.format(post_num)] = timing
 
         return self._post('/topics/timings', **kwargs)
 
     def topic_posts(self, topic_id, **kwargs):
-        return self._get('/t/{0}/posts.json'.format(topic_id), **kwargs)
+        return self._then(self._get('/t/{0}/posts.json'.format(topic_id), **kwargs), self._post_stream)
 
     def create_post(self, content, **kwargs):
         """ int: topic_id the topic to reply too
@@ -157,7 +216,7 @@ class DiscourseClient(object):
 
     def topics_by(self, username, **kwargs):
         url = '/topics/created-by/{0}.json'.format(username)
-        return self._get(url, **kwargs)['topic_list']['topics']
+        return self._then(self._get(url, **kwargs), lambda r: self._model(Topic, r['topic_list']['topics']))
 
     def invite_user_to_topic(self, user_email, topic_id):
         kwargs = {
@@ -168,7 +227,13 @@ class DiscourseClient(object):
 
     def search(self, term, **kwargs):
         kwargs['term'] = term
-        return self._get('/search.json', **kwargs)
+
+        def models(r):
+            self._model_at(Post, r, 'posts')
+            self._model_at(Topic, r, 'topics')
+            return self._model_at(User, r, 'users')
+
+        return self._then(self._get('/search.json', **kwargs), models)
 
     def create_category(self, name, color, text_color='FFFFFF', permissions=None, parent=None, **kwargs):
         """ permissions - dict of 'everyone', 'admins', 'moderators', 'staff' with values of
@@ -184,32 +249,73 @@ class DiscourseClient(object):
         for key, value in permissions.items():
             kwargs['permissions[{0}]'.format(key)] = value
 
-        if parent:
-            parent_id = None
-            for category in self.categories():
-                if category['name'] == parent:
-                    parent_id = category['id']
-                    continue
+        if not parent:
+            return self._then(self._post('/categories', **kwargs), self._index_created)
 
-            if not parent_id:
+        def create(category):
+            if category is None:
                 raise DiscourseClientError(u'{0} not found'.format(parent))
-            kwargs['parent_category_id'] = parent_id
+            kwargs['parent_category_id'] = category['id']
+            return self._then(self._post('/categories', **kwargs), self._index_created)
 
-        return self._post('/categories', **kwargs)
+        return self._then(self._find_category(parent, reload=True), create)
 
     def categories(self, **kwargs):
-        return self._get('/categories.json', **kwargs)['category_list']['categories']
+        return self._then(self._get('/categories.json', **kwargs),
+                          lambda r: self._model(Category, r['category_list']['categories']))
 
     def category(self, name, parent=None, **kwargs):
-        if parent:
-            name = u'{0}/{1}'.format(parent, name)
-
-        return self._get(u'/category/{0}.json'.format(name), **kwargs)
+        def fetch(category):
+            path = name if not parent else u'{0}/{1}'.format(parent, name)
+            # names are resolved to slugs when the index knows them
+            if category is not None:
+                path = category['slug']
+                parent_category = self.category_index.get(category.get('parent_category_id'))
+                if parent_category is not None:
+                    path = u'{0}/{1}'.format(parent_category['slug'], path)
+            return self._then(self._get(u'/category/{0}.json'.format(path), **kwargs), self._topic_list)
+
+        return self._then(self._find_category(name, parent), fetch)
 
     def site_settings(self, **kwargs):
-        for setting, value in kwargs.items():
-            setting = setting.replace(' ', '_')
-            self._request('PUT', '/admin/site_settings/{0}'.format(setting), {setting: value})
+        """ Apply settings given as keyword arguments, see sync_site_settings
+
+        Raises the error of the first setting that failed, once the others are sent.
+        """
+        return self._then(self.sync_site_settings(kwargs), _raise_failed)
+
+    def sync_site_settings(self, settings, workers=8):
+        """ Bring the site's settings in line with a dict of them
+
+        The current settings are read with one request and only the settings whose value
+        differs are sent, up to workers at a time, so applying settings that are already
+        in place costs a single GET. True/False are sent as true/false and lists are
+        joined with | as Discourse stores them.
+
+        Returns a SettingsReport: changed maps each setting sent to its (old, new) value,
+        unchanged lists those left alone and failed maps a setting to the exception its
+        update raised. Failures don't stop the other updates.
+        """
+        desired = dict((name.replace(' ', '_'), _setting_value(value)) for name, value in settings.items())
+
+        def apply(r):
+            current = dict((s['setting'], _setting_value(s['value'])) for s in r['site_settings'])
+            changes = sorted(name for name, value in desired.items() if current.get(name) != value)
+            unchanged = sorted(set(desired) - set(changes))
+
+            def put(name):
+                return self._put('/admin/site_settings/{0}'.format(name), **{name: desired[name]})
+
+            def report(results):
+                failed = dict((name, e) for name, e in zip(changes, results) if isinstance(e, Exception))
+                changed = dict((name, (current.get(name), desired[name])) for name in changes if name not in failed)
+                return SettingsReport(changed, unchanged, failed)
+
+            if not changes:
+                return SettingsReport({}, unchanged, {})
+            return self._then(self.map(put, changes, workers=workers), report)
+
+        return self._then(self._get('/admin/site_settings.json'), apply)
 
     def _get(self, path, **kwargs):
         return self._request('GET', path, kwargs)
@@ -223,23 +329,108 @@ class DiscourseClient(object):
     def _delete(self, path, **kwargs):
         return self._request('DELETE', path, kwargs)
 
-    def _request(self, verb, path, params):
+    def _category_index(self):
+        """ The category index, filled from /categories.json on first use """
+        if self.category_index.loaded:
+            return self.category_index
+        return self._load_categories()
+
+    def _load_categories(self):
+        def fill(r):
+            self.category_index.load(r['category_list']['categories'])
+            return self.category_index
+
+        # a reload has to reach the server, not a cached copy of the list
+        cache = getattr(self, 'cache', None)
+        if cache is not None and self.category_index.loaded:
+            cache.invalidate('/categories.json')
+        # the index works on dicts, whatever the client returns
+        return self._then(self._get('/categories.json', include_subcategories='true'), fill)
+
+    def _find_category(self, name, parent=None, reload=False):
+        """ The category called name, or None
+
+        With reload, an index loaded earlier is reloaded once when it doesn't know name, the
+        category may have been created since by someone else.
+        """
+        fresh = not self.category_index.loaded
+
+        def find(index):
+            category = index.find(name, parent)
+            if category is not None or fresh or not reload:
+                return category
+            return self._then(self._load_categories(), lambda index: index.find(name, parent))
+
+        return self._then(self._category_index(), find)
+
+    def _model(self, model, data):
+        """ data, or a list of them, as model objects if the client returns models """
+        if not self.models or data is None:
+            return data
+        if isinstance(data, list):
+            return model.many(data)
+        return model(data)
+
+    def _model_at(self, model, data, *keys):
+        """ data with the value under keys, eg 'topic_list', 'topics', as model objects if the
+        client returns models
+        """
+        if self.models:
+            parent = data
+            for key in keys[:-1]:
+                parent = parent.get(key) or {}
+            if parent.get(keys[-1]) is not None:
+                parent[keys[-1]] = self._model(model, parent[keys[-1]])
+        return data
+
+    def _topic_list(self, r):
+        return self._model_at(Topic, r, 'topic_list', 'topics')
+
+    def _post_stream(self, r):
+        return self._model_at(Post, r, 'post_stream', 'posts')
+
+    def _index_created(self, result):
+        if isinstance(result, dict) and isinstance(result.get('category'), dict):
+            self.category_index.add(result['category'])
+        return result
+
+    def _then(self, result, callback):
+        """ Pass the result of a request on to callback, returning what callback returns """
+        return callback(result)
+
+    def _request(self, verb, path, params, data=None):
+        raise NotImplementedError
+
+    def _auth(self, params):
+        """ The (params, headers) to send, with the credentials added as self.auth says
+
+        An api_username in params acts as that user in either mode. The caller's dict is
+        left alone.
+        """
+        params = dict(params)
+        if self.auth == 'header':
+            username = params.pop('api_username', self.api_username)
+            return params, {'Api-Key': self.api_key, 'Api-Username': username}
+
         params['api_key'] = self.api_key
-        if 'api_username' not in params:
-            params['api_username'] = self.api_username
-        url = self.host + path
+        params.setdefault('api_username', self.api_username)
+        return params, {}
 
-        response = requests.request(verb, url, allow_redirects=False, params=params, timeout=self.timeout)
+    def _handle_response(self, response):
+        """ Check a requests.Response for errors and return the decoded JSON body
 
-        log.debug('response %s: %s', response.status_code, repr(response.text))
+        The body is read and decoded exactly once, and only previewed in the debug log.
+        """
+        content = response.content
+        log.debug('response %s: %s', response.status_code, _Preview(content, self.log_body_size))
         if not response.ok:
             try:
-                msg = u','.join(response.json()['errors'])
+                msg = u','.join(loads(content)['errors'])
             except (ValueError, TypeError, KeyError):
                 if response.reason:
                     msg = response.reason
                 else:
-                    msg = u'{0}: {1}'.format(response.status_code, response.text)
+                    msg = u'{0}: {1}'.format(response.status_code, _text(content))
 
             if 400 <= response.status_code < 500:
                 raise DiscourseClientError(msg, response=response)
@@ -249,18 +440,17 @@ class DiscourseClient(object):
         if response.status_code == 302:
             raise DiscourseError('Unexpected Redirect, invalid api key or host?', response=response)
 
-        json_content = 'application/json; charset=utf-8'
         content_type = response.headers['content-type']
-        if content_type != json_content:
+        if content_type != JSON_CONTENT:
             # some calls return empty html documents
-            if response.content == ' ':
+            if not content.strip():
                 return None
 
             raise DiscourseError('Invalid Response, expecting "{0}" got "{1}"'.format(
-                                 json_content, content_type), response=response)
+                                 JSON_CONTENT, content_type), response=response)
 
         try:
-            decoded = response.json()
+            decoded = loads(content)
         except ValueError:
             raise DiscourseError('failed to decode response', response=response)
 
@@ -271,3 +461,542 @@ class DiscourseClient(object):
             raise DiscourseError(message, response=response)
 
         return decoded
+
+
+class DiscourseClient(BaseDiscourseClient):
+    """ A basic client for the Discourse API that implements the raw API
+
+    This class will attempt to remain roughly similar to the discourse_api rails API
+
+    Requests are sent through a pooled, keep-alive ``requests.Session`` owned by
+    the client, so repeated calls reuse the same connections to the forum.
+
+        pool_connections: number of per-host connection pools to cache
+        pool_maxsize: maximum number of connections kept open per host
+        keep_alive: set to False to close the connection after every request
+        session: an optional pre-configured requests.Session to use instead, it isn't modified
+        adapter: an optional transport adapter mounted for http:// and https:// on the client's
+            own session, mount it on a session passed in yourself
+        rate_limiter: a pydiscourse.ratelimit.RateLimiter pacing requests, shared across threads
+        retry: a pydiscourse.ratelimit.RetryPolicy, retrying 429s and transient server errors
+        cache: a pydiscourse.cache.ResponseCache for GET requests, invalidated by writes
+        conditional: a pydiscourse.cache.ConditionalCache, revalidating GETs with ETag/Last-Modified
+
+    before_request and after_request are lists of callables, see pydiscourse.metrics.
+
+    One client can be shared by any number of threads. They send through the same pooled
+    session, which should have a pool_maxsize of at least the number of threads, or
+    connections beyond it are closed after use rather than kept alive. The client never
+    modifies the arguments it is given, and its caches, rate limiter and category index are
+    locked. Configure it, including the session and the request hooks, before sharing it.
+
+    The client can be used as a context manager to close the pool when done::
+
+        with DiscourseClient(host, api_username, api_key) as client:
+            client.latest_topics()
+    """
+    def __init__(self, host, api_username, api_key, timeout=None, pool_connections=10,
+                 pool_maxsize=10, keep_alive=True, session=None, adapter=None, rate_limiter=None,
+                 retry=None, cache=None, conditional=None, log_body_size=1000, auth='query', models=False):
+        super(DiscourseClient, self).__init__(host, api_username, api_key, timeout=timeout,
+                                              log_body_size=log_body_size, auth=auth, models=models)
+        self.rate_limiter = rate_limiter
+        self.retry = retry
+        self.cache = cache
+        self.conditional = conditional
+        self.before_request = []
+        self.after_request = []
+        self._events = threading.local()
+
+        self.keep_alive = keep_alive
+
+        self._owns_session = session is None
+        if session is None:
+            session = requests.Session()
+            if adapter is None:
+                adapter = TimedHTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        elif adapter is not None:
+            raise ValueError('mount the adapter on the session passed in')
+
+        self.session = session
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """ Release pooled connections, a session passed in by the caller is left open """
+        if self._owns_session:
+            self.session.close()
+
+    def map(self, method, args, workers=8, **kwargs):
+        """ Call method once for each item of args, with up to workers calls in flight
+
+        method: a client method, or its name
+        args: the arguments of each call, a tuple for several positional arguments
+        kwargs: keyword arguments passed to every call
+
+        Returns a list of the results in the order of args. A call that fails has the
+        exception it raised in its place, the other calls carry on::
+
+            users = client.map('user', usernames)
+            topics = client.map(client.topic, [('welcome', 8), ('faq', 9)])
+
+        Keep workers within pool_maxsize to reuse pooled connections.
+        """
+        if not callable(method):
+            method = getattr(self, method)
+
+        def call(item):
+            try:
+                return method(*_call_args(item), **kwargs)
+            except Exception as e:
+                return e
+
+        return list(_ordered_map(call, args, workers))
+
+    def batch(self, workers=8):
+        """ Queue up calls to run concurrently when a with block ends, see Batch """
+        return Batch(self, workers)
+
+    def iter_latest_topics(self, prefetch=False, **kwargs):
+        """ Iterate over every topic in /latest, fetching further pages as needed
+
+        prefetch: download the next page in the background while the current one is consumed
+        """
+        return self._iter_topic_list('/latest.json', prefetch, kwargs)
+
+    def iter_new_topics(self, prefetch=False, **kwargs):
+        return self._iter_topic_list('/new.json', prefetch, kwargs)
+
+    def iter_hot_topics(self, prefetch=False, **kwargs):
+        return self._iter_topic_list('/hot.json', prefetch, kwargs)
+
+    def iter_topics_by(self, username, prefetch=False, **kwargs):
+        return self._iter_topic_list('/topics/created-by/{0}.json'.format(username), prefetch, kwargs)
+
+    def iter_private_messages(self, username=None, prefetch=False, **kwargs):
+        if username is None:
+            username = self.api_username
+        return self._iter_topic_list('/topics/private-messages/{0}.json'.format(username), prefetch, kwargs)
+
+    def iter_users(self, filter=None, prefetch=False, **kwargs):
+        """ Iterate over every user in an admin user list, see users() """
+        if filter is None:
+            filter = 'active'
+        path = '/admin/users/list/{0}.json'.format(filter)
+
+        def fetch(page):
+            users = self._get(path, page=page, **kwargs)
+            return users, page + 1 if users else None
+
+        return self._model_iter(User, _paginate(fetch, 1, prefetch))
+
+    def iter_search(self, term, prefetch=False, **kwargs):
+        """ Iterate over every post matching a search term """
+        def fetch(page):
+            r = self._get('/search.json', term=term, page=page, **kwargs)
+            posts = r.get('posts') or []
+            more = (r.get('grouped_search_result') or {}).get('more_full_page_results')
+            return posts, page + 1 if posts and more else None
+
+        return self._model_iter(Post, _paginate(fetch, 1, prefetch))
+
+    def fetch_topic_stream(self, topic_id, chunk_size=20, workers=4, after=None, **kwargs):
+        """ Iterate over every post in a topic, in stream order
+
+        The post ids listed in the topic's post_stream are requested in chunks of
+        chunk_size, with up to workers requests in flight. Only a bounded number of
+        chunks are held in memory, however long the topic is.
+
+        after: only fetch posts with a greater id, eg the last post seen before
+        """
+        post_stream = self._get('/t/{0}.json'.format(topic_id), **kwargs)['post_stream']
+        # the first few posts come along with the topic
+        loaded = dict((p['id'], p) for p in post_stream.get('posts') or [])
+        stream = post_stream['stream']
+        if after is not None:
+            stream = [i for i in stream if i > after]
+
+        def fetch(ids):
+            missing = [i for i in ids if i not in loaded]
+            if missing:
+                params = dict(kwargs, **{'post_ids[]': missing})
+                posts = self._get('/t/{0}/posts.json'.format(topic_id), **params)['post_stream']['posts']
+                found = dict((p['id'], p) for p in posts)
+            else:
+                found = {}
+            # deleted posts can be in the stream without being returned
+            return [loaded.get(i) or found[i] for i in ids if i in loaded or i in found]
+
+        chunks = (stream[n:n + chunk_size] for n in range(0, len(stream), chunk_size))
+        for posts in _ordered_map(fetch, chunks, workers):
+            for post in posts:
+                yield Post(post) if self.models else post
+
+    def stream_users(self, filter=None, **kwargs):
+        """ Like users(), but decoded incrementally, yielding each user as it arrives """
+        if filter is None:
+            filter = 'active'
+        return self._model_iter(User, self._stream('/admin/users/list/{0}.json'.format(filter), (), kwargs))
+
+    def stream_latest_topics(self, **kwargs):
+        return self._model_iter(Topic, self._stream('/latest.json', ('topic_list', 'topics'), kwargs))
+
+    def stream_topic_posts(self, topic_id, post_ids=None, **kwargs):
+        """ Like posts(), but decoded incrementally, yielding each post as it arrives """
+        if post_ids:
+            kwargs['post_ids[]'] = post_ids
+        return self._model_iter(Post, self._stream('/t/{0}/posts.json'.format(topic_id), ('post_stream', 'posts'), kwargs))
+
+    def _stream(self, path, item_path, params, chunk_size=65536):
+        """ GET path and yield the elements of the JSON array at item_path as they are decoded
+
+        The body is never held in memory as a whole, which also means it isn't logged. The
+        after_request hooks run once the stream is exhausted or closed, with decode covering
+        the time spent iterating.
+        """
+        event = self._begin('GET', path, params)
+        start = perf_counter()
+        response = None
+        try:
+            # only while sending, the caller may make other requests between items
+            self._events.current = event
+            try:
+                response = self._send('GET', path, params, stream=True)
+            finally:
+                self._events.current = None
+
+            log.debug('response %s: streaming', response.status_code)
+            if (not response.ok or response.status_code == 302 or
+                    response.headers.get('content-type') != JSON_CONTENT):
+                # error responses are small, let the usual handling raise
+                self._handle_response(response)
+                return
+
+            try:
+                for item in iter_items(response.iter_content(chunk_size), item_path):
+                    yield item
+            except (ValueError, KeyError):
+                raise DiscourseError('failed to decode response', response=response)
+        except Exception as e:
+            if event is not None:
+                event.error = e
+            raise
+        finally:
+            if response is not None:
+                response.close()
+            if event is not None:
+                self._end(event, start)
+
+    def _iter_topic_list(self, path, prefetch, kwargs):
+        def fetch(page):
+            params = dict(kwargs)
+            if page:
+                params['page'] = page
+            topic_list = self._get(path, **params)['topic_list']
+            next_page = _next_page(topic_list.get('more_topics_url'))
+            if not topic_list['topics'] or next_page is None or next_page <= page:
+                next_page = None
+            return topic_list['topics'], next_page
+
+        return self._model_iter(Topic, _paginate(fetch, 0, prefetch))
+
+    def _model_iter(self, model, items):
+        if not self.models:
+            return items
+        return (model(item) for item in items)
+
+    def _request(self, verb, path, params, data=None):
+        event = self._begin(verb, path, params)
+        if event is None:
+            return self._dispatch(verb, path, params, data)
+
+        self._events.current = event
+        start = perf_counter()
+        try:
+            return self._dispatch(verb, path, params, data)
+        except Exception as e:
+            event.error = e
+            raise
+        finally:
+            self._events.current = None
+            self._end(event, start)
+
+    def _begin(self, verb, path, params):
+        """ Run the before_request hooks, returns the RequestEvent to fill in or None without hooks """
+        if not self.before_request and not self.after_request:
+            return None
+        for hook in self.before_request:
+            hook(verb, path, params)
+        return RequestEvent(verb, path)
+
+    def _end(self, event, start):
+        end = perf_counter()
+        event.total = end - start
+        if event.received is not None:
+            event.decode = end - event.received
+        for hook in self.after_request:
+            hook(event)
+
+    def _dispatch(self, verb, path, params, data=None):
+        if verb != 'GET':
+            try:
+                return self._handle_response(self._send(verb, path, params, data=data))
+            finally:
+                if self.cache is not None:
+                    self.cache.invalidate(path)
+
+        if self.cache is None and self.conditional is None:
+            return self._handle_response(self._send(verb, path, params))
+
+        key = cache_key(path, params, self.api_username)
+        if self.cache is not None:
+            hit, decoded = self.cache.get(key)
+            if hit:
+                return decoded
+
+        if self.conditional is not None:
+            decoded = self._conditional_get(key, path, params)
+        else:
+            decoded = self._handle_response(self._send(verb, path, params))
+
+        if self.cache is not None:
+            self.cache.set(key, path, decoded)
+        return decoded
+
+    def _conditional_get(self, key, path, params):
+        entry = self.conditional.lookup(key)
+        response = self._send('GET', path, params, headers=self.conditional.headers(entry))
+        if response.status_code == 304 and entry is not None:
+            return self.conditional.payload(entry)
+
+        decoded = self._handle_response(response)
+        self.conditional.store(key, response.headers, decoded)
+        return decoded
+
+    def _send(self, verb, path, params, headers=None, stream=False, data=None):
+        """ Send a request, waiting on the rate limiter and retrying as configured
+
+        data is an optional request body such as a MultipartFile, rewound with seek(0) for retries.
+        """
+        params, auth_headers = self._auth(params)
+        if auth_headers:
+            headers = dict(headers or {}, **auth_headers)
+        if data is not None:
+            headers = dict(headers or {}, **data.headers)
+        if not self.keep_alive:
+            # sent per request rather than set on the session, which may be the caller's
+            headers = dict(headers or {}, Connection='close')
+        url = self.host + path
+
+        event = getattr(self._events, 'current', None)
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(verb)
+
+            if event is not None:
+                reset_connect_time()
+                start = perf_counter()
+
+            response = self.session.request(verb, url, allow_redirects=False, params=params, headers=headers,
+                                            data=data, timeout=self.timeout, stream=stream)
+
+            if event is not None:
+                _record(event, response, attempt, perf_counter() - start, stream)
+
+            if self.retry is None or not self.retry.should_retry(verb, response, attempt):
+                return response
+
+            delay = self.retry.delay(response, attempt)
+            log.debug('retrying %s %s in %.2fs after %s', verb, path, delay, response.status_code)
+            # release the connection, which a streamed body still holds
+            response.close()
+            if data is not None:
+                data.seek(0)
+            if response.status_code == 429 and self.rate_limiter is not None:
+                # hold back every thread sharing the limiter, not just this one
+                self.rate_limiter.pause(verb, delay)
+            else:
+                time.sleep(delay)
+            attempt += 1
+
+
+class Batch(object):
+    """ Client calls queued in a with block and run concurrently when it ends
+
+        with client.batch(workers=8) as batch:
+            users = [batch.user(name) for name in usernames]
+            digest = batch.latest_topics()
+        users[0].result()
+
+    Queued calls return a concurrent.futures.Future, completed once the block exits.
+    Afterwards batch.results lists the result of every call in the order they were
+    queued, with the exception raised in place of any that failed. Nothing is sent if
+    the block raises.
+    """
+    def __init__(self, client, workers=8):
+        self.client = client
+        self.workers = workers
+        self.results = None
+        self._calls = []
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+        if name.startswith('_') or not callable(method):
+            raise AttributeError(name)
+
+        def queue(*args, **kwargs):
+            future = Future()
+            self._calls.append((future, method, args, kwargs))
+            return future
+
+        return queue
+
+    def run(self):
+        """ Send the queued calls, returns the results as batch.results """
+        calls, self._calls = self._calls, []
+
+        def call(queued):
+            future, method, args, kwargs = queued
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(method(*args, **kwargs))
+                except Exception as e:
+                    future.set_exception(e)
+            return future
+
+        self.results = [_outcome(future) for future in _ordered_map(call, calls, self.workers)]
+        return self.results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.run()
+        else:
+            for future, _, _, _ in self._calls:
+                future.cancel()
+            self._calls = []
+
+
+def _record(event, response, attempt, elapsed, stream):
+    """ Add an attempt to a RequestEvent, times add up over retries """
+    connect = connect_time()
+    server = max(0.0, response.elapsed.total_seconds() - connect)
+    event.status = response.status_code
+    event.retries = attempt
+    event.connect += connect
+    event.server += server
+    event.transfer += max(0.0, elapsed - connect - server)
+    event.bytes = None if stream else len(response.content)
+    event.received = perf_counter()
+
+
+class _Preview(object):
+    """ Format the start of a response body for logging, only when a record is emitted """
+    def __init__(self, content, size):
+        self.content = content
+        self.size = size
+
+    def __str__(self):
+        preview = repr(_text(self.content[:self.size]))
+        if len(self.content) > self.size:
+            preview += u'... ({0} bytes)'.format(len(self.content))
+        return preview
+
+
+def _text(content):
+    return content.decode('utf-8', 'replace')
+
+
+def _raise_failed(report):
+    if report.failed:
+        raise report.failed[min(report.failed)]
+    return report
+
+
+def _setting_value(value):
+    """ A site setting value as the text Discourse keeps it as """
+    if isinstance(value, bool):
+        return u'true' if value else u'false'
+    if value is None:
+        return u''
+    if isinstance(value, (list, tuple)):
+        return u'|'.join(_setting_value(v) for v in value)
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    return u'{0}'.format(value)
+
+
+def _call_args(item):
+    """ The positional arguments for one call of map(), a tuple is spread out """
+    return item if isinstance(item, tuple) else (item,)
+
+
+def _outcome(future):
+    """ The result of a finished future, or the exception it raised """
+    try:
+        return future.result()
+    except Exception as e:
+        return e
+
+
+def _next_page(more_url):
+    """ The page number of a Discourse more_topics_url, eg /latest?page=2 """
+    if not more_url:
+        return None
+    try:
+        return int(parse_qs(urlparse(more_url).query)['page'][0])
+    except (KeyError, IndexError, ValueError):
+        return None
+
+
+def _paginate(fetch, page, prefetch=False):
+    """ Yield items from consecutive pages, fetch(page) returns (items, next_page or None)
+
+    Only the current page is held in memory, plus the next one when prefetching.
+    """
+    if not prefetch:
+        while page is not None:
+            items, page = fetch(page)
+            for item in items:
+                yield item
+        return
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        future = executor.submit(fetch, page)
+        while future is not None:
+            items, page = future.result()
+            future = executor.submit(fetch, page) if page is not None else None
+            for item in items:
+                yield item
+    finally:
+        executor.shutdown(wait=False)
+
+
+def _ordered_map(func, iterable, workers):
+    """ Like map(), running func on a pool of threads and yielding results in order
+
+    At most 2 * workers calls are pending at any time, so a long iterable is consumed lazily.
+    """
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending = collections.deque()
+    try:
+        for item in iterable:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
@@ -0,0 +1,362 @@
+"""
+Export users, topics and posts to CSV, JSON Lines, Parquet or Arrow files
+
+export() writes any iterable of dicts or pydiscourse.models objects, for instance one of
+the client's iterators, as it is read, so memory use doesn't grow with the size of the
+forum::
+
+    export(client.iter_users(prefetch=True), 'users.parquet')
+    export(client.fetch_topic_stream(topic_id), 'posts.csv', columns=['id', 'username', 'raw'])
+
+The format follows the file extension unless given. CSV and JSON Lines files are
+written a row at a time. Parquet and Arrow files need pyarrow, ``pip install
+pydiscourse[export]``; items are buffered a column at a time, numbers in typed arrays
+that pyarrow uses without copying, and every chunk_size items become a record batch.
+Column types are inferred and widened as later chunks need, unless a pyarrow schema
+is given.
+
+Without columns every key of the first item is exported, or the slotted fields of a
+model, which avoids decoding the rest. Nested values, eg a post's actions_summary, are
+written as JSON text except in JSON Lines files.
+"""
+import array
+import csv
+import io
+import itertools
+import json
+import os
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from pydiscourse.models import Model
+
+try:
+    array.array('q')
+    _INT64 = 'q'
+except ValueError:  # py2 has no long long arrays
+    _INT64 = 'l'
+
+try:  # py2
+    _TYPECODES = {int: _INT64, long: _INT64, float: 'd'}
+    _TEXT = unicode
+except NameError:
+    _TYPECODES = {int: _INT64, float: 'd'}
+    _TEXT = str
+
+_dumps = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False).encode
+
+
+def export(items, path, format=None, columns=None, chunk_size=10000, schema=None):
+    """ Write items to path, returns the number written
+
+        format: 'csv', 'jsonl', 'parquet' or 'arrow', by default from the extension of path
+        columns: the keys to export, in order
+        chunk_size: for Parquet and Arrow files, how many items are buffered before they
+            are written as a record batch
+        schema: for Parquet and Arrow files, a pyarrow.Schema giving the columns and
+            their types instead of inferring them
+    """
+    format = format or _format(path)
+    if format not in WRITERS:
+        raise ValueError('format must be one of {0}, not {1!r}'.format(', '.join(sorted(WRITERS)), format))
+
+    items = iter(items)
+    first = next(items, None)
+
+    if columns is None and schema is not None:
+        columns = schema.names
+    if columns is None and first is not None:
+        columns = list(first._fields if isinstance(first, Model) else first)
+    columns = list(columns or ())
+
+    writer_class = WRITERS[format]
+    if issubclass(writer_class, _ArrowWriter):
+        if schema is not None and schema.names != columns:
+            raise ValueError('the schema must have the columns {0}'.format(', '.join(columns)))
+        writer = writer_class(path, columns, schema, chunk_size)
+    elif schema is not None:
+        raise ValueError('a schema only applies to parquet and arrow files')
+    else:
+        writer = writer_class(path, columns)
+
+    with writer:
+        if first is None:
+            return 0
+        return writer.write(itertools.chain([first], items))
+
+
+class ColumnBuffer(object):
+    """ Items held as one array of values per column
+
+    A column is an array.array of 64 bit integers, or of floats once it meets one, while
+    all its values are numbers and a list from its first other value, None included.
+    """
+    def __init__(self, columns):
+        self.columns = columns
+        self._values = [array.array(_INT64) for _ in columns]
+        self._count = 0
+
+    def append(self, item):
+        get = item.get
+        columns = self._values
+        for i, column in enumerate(self.columns):
+            value = get(column)
+            values = columns[i]
+            if type(values) is list:
+                values.append(value)
+                continue
+            typecode = _TYPECODES.get(type(value))
+            if typecode == values.typecode or (typecode is not None and values.typecode == 'd'):
+                try:
+                    values.append(value)
+                    continue
+                except OverflowError:
+                    typecode = None
+            columns[i] = _widen(values, value, typecode)
+        self._count += 1
+
+    def take(self):
+        """ The buffered values, an array or list per column, emptying the buffer """
+        values, self._values = self._values, [array.array(_INT64) for _ in self.columns]
+        self._count = 0
+        return values
+
+    def __len__(self):
+        return self._count
+
+
+def _widen(values, value, typecode):
+    """ An array of integers with value appended, as floats for a float or else a list """
+    values = array.array('d', values) if typecode == 'd' else values.tolist()
+    values.append(value)
+    return values
+
+
+class _Writer(object):
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = columns
+
+    def write(self, items):
+        """ Write an iterable of items, returns how many were written """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CSVWriter(_Writer):
+    """ UTF-8 CSV with a header row, None as an empty field """
+    def __init__(self, path, columns):
+        super(CSVWriter, self).__init__(path, columns)
+        if _TEXT is str:
+            self._file = io.open(path, 'w', newline='', encoding='utf-8')
+        else:
+            # the py2 csv module writes bytes
+            self._file = open(path, 'wb')
+        self._csv = csv.writer(self._file)
+        self._csv.writerow([_cell(c) for c in columns])
+
+    def write(self, items):
+        columns = self.columns
+        writerow = self._csv.writerow
+        count = 0
+        for count, item in enumerate(items, 1):
+            get = item.get
+            writerow([_cell(get(c)) for c in columns])
+        return count
+
+    def close(self):
+        self._file.close()
+
+
+class JSONLinesWriter(_Writer):
+    """ One JSON object per line, nested values kept as they are """
+    def __init__(self, path, columns):
+        super(JSONLinesWriter, self).__init__(path, columns)
+        self._file = io.open(path, 'w', encoding='utf-8')
+
+    def write(self, items):
+        columns = self.columns
+        write = self._file.write
+        count = 0
+        for count, item in enumerate(items, 1):
+            get = item.get
+            write(_dumps(dict((c, get(c)) for c in columns)) + u'\n')
+        return count
+
+    def close(self):
+        self._file.close()
+
+
+class _ArrowWriter(_Writer):
+    """ Typed record batches, converted chunk by chunk
+
+    The types of every chunk are inferred and unified with those written so far: a
+    column that was all None takes the type of its first values and integers are
+    widened to floats. A file written with the narrower schema is copied over to the
+    wider one, a batch at a time. Values that can't share a type, eg text after
+    numbers, raise a ValueError rather than being converted.
+
+        schema: a pyarrow.Schema to use instead, values that don't convert to it
+            without loss raise pyarrow.ArrowInvalid
+        chunk_size: the number of items in a record batch
+    """
+    def __init__(self, path, columns, schema=None, chunk_size=10000):
+        if pyarrow is None:
+            raise ImportError('pyarrow is needed to write {0} files'.format(self.format))
+        super(_ArrowWriter, self).__init__(path, columns)
+        self.schema = schema
+        self.chunk_size = chunk_size
+        self._fixed = schema is not None
+        self._writer = None
+
+    def write(self, items):
+        buffer = ColumnBuffer(self.columns)
+        count = 0
+        for item in items:
+            buffer.append(item)
+            if len(buffer) >= self.chunk_size:
+                count += self._write_chunk(buffer.take())
+        if len(buffer):
+            count += self._write_chunk(buffer.take())
+        return count
+
+    def _write_chunk(self, values):
+        arrays = [_arrow_array(v) for v in values]
+        if self._fixed:
+            types = [f.type for f in self.schema]
+        else:
+            previous = [f.type for f in self.schema] if self.schema is not None else [a.type for a in arrays]
+            types = [_unify(name, old, a.type) for name, old, a in zip(self.columns, previous, arrays)]
+            schema = pyarrow.schema(list(zip(self.columns, types)))
+            if self.schema is not None and not schema.equals(self.schema):
+                self._widen(schema)
+            self.schema = schema
+
+        if self._writer is None:
+            self._writer = self._open(self.path)
+        batch = pyarrow.RecordBatch.from_arrays([a.cast(t) for a, t in zip(arrays, types)], schema=self.schema)
+        self._write(batch)
+        return batch.num_rows
+
+    def _widen(self, schema):
+        """ Rewrite what was written so far with schema """
+        self._writer.close()
+        old = self.path + '.narrow'
+        os.rename(self.path, old)
+        self.schema = schema
+        self._writer = self._open(self.path)
+        try:
+            for batch in self._batches(old):
+                self._write(pyarrow.RecordBatch.from_arrays(
+                    [c.cast(f.type) for c, f in zip(batch.columns, schema)], schema=schema))
+        finally:
+            os.remove(old)
+
+    def close(self):
+        if self._writer is None and self.columns:
+            # nothing was written, leave a valid empty file
+            if self.schema is None:
+                self.schema = pyarrow.schema([(name, pyarrow.string()) for name in self.columns])
+            self._writer = self._open(self.path)
+        if self._writer is not None:
+            self._writer.close()
+
+
+def _unify(column, old, new):
+    """ The type holding values of both types, raises ValueError if there's none """
+    types = pyarrow.types
+    if old.equals(new) or types.is_null(new):
+        return old
+    if types.is_null(old):
+        return new
+    if (types.is_integer(old) or types.is_floating(old)) and (types.is_integer(new) or types.is_floating(new)):
+        return pyarrow.float64() if types.is_floating(old) or types.is_floating(new) else pyarrow.int64()
+    raise ValueError('column {0} has {1} values after {2} ones, pass a schema to export()'.format(column, new, old))
+
+
+class ParquetWriter(_ArrowWriter):
+    """ A Parquet file with a row group per chunk """
+    format = 'parquet'
+
+    def _open(self, path):
+        return pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def _write(self, batch):
+        self._writer.write_table(pyarrow.Table.from_batches([batch]))
+
+    def _batches(self, path):
+        return pyarrow.parquet.ParquetFile(path).iter_batches()
+
+
+class ArrowWriter(_ArrowWriter):
+    """ An Arrow IPC (Feather v2) file with a record batch per chunk """
+    format = 'arrow'
+
+    def _open(self, path):
+        return pyarrow.ipc.new_file(path, self.schema)
+
+    def _write(self, batch):
+        self._writer.write_batch(batch)
+
+    def _batches(self, path):
+        with pyarrow.memory_map(path) as source:
+            reader = pyarrow.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i)
+
+
+WRITERS = {
+    'csv': CSVWriter,
+    'jsonl': JSONLinesWriter,
+    'parquet': ParquetWriter,
+    'arrow': ArrowWriter,
+}
+
+_EXTENSIONS = {
+    'csv': 'csv',
+    'jsonl': 'jsonl',
+    'ndjson': 'jsonl',
+    'parquet': 'parquet',
+    'arrow': 'arrow',
+    'feather': 'arrow',
+}
+
+
+def _format(path):
+    extension = path.rsplit('.', 1)[-1].lower() if '.' in path else ''
+    return _EXTENSIONS.get(extension, extension)
+
+
+def _cell(value):
+    """ value as written to a CSV field, nested values as JSON text """
+    if isinstance(value, (dict, list)):
+        value = _dumps(value)
+    if _TEXT is not str and isinstance(value, _TEXT):
+        return value.encode('utf-8')
+    return value
+
+
+def _arrow_array(values):
+    """ A column of a ColumnBuffer as a pyarrow.Array, typed arrays without a copy """
+    if isinstance(values, array.array):
+        if values.typecode == 'd':
+            kind = pyarrow.float64()
+        else:
+            kind = pyarrow.int64() if values.itemsize == 8 else pyarrow.int32()
+        return pyarrow.Array.from_buffers(kind, len(values), [None, pyarrow.py_buffer(values)])
+    if any(isinstance(v, (dict, list)) for v in values):
+        values = [_dumps(v) if isinstance(v, (dict, list)) else v for v in values]
+    return pyarrow.array(values)
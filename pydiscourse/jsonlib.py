@@ -0,0 +1,33 @@
+"""
+JSON decoding from raw response bytes, using orjson or ujson when they are installed
+
+    from pydiscourse.jsonlib import loads, backend
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def _stdlib_loads(data):
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    return json.loads(data)
+
+
+if orjson is not None:
+    backend = 'orjson'
+    loads = orjson.loads
+elif ujson is not None:
+    backend = 'ujson'
+    loads = ujson.loads
+else:
+    backend = 'json'
+    loads = _stdlib_loads
@@ -55,6 +55,8 @@ def main():
     op = optparse.OptionParser()
     op.add_option('--host', default='http://localhost:4000')
     op.add_option('--api-user', default='system')
+    op.add_option('--auth', type='choice', choices=['query', 'header'], default='query',
+                  help='send the API key as query parameters or as headers')
     op.add_option('-v', '--verbose', action='store_true')
 
     options, args = op.parse_args()
@@ -65,7 +67,7 @@ def main():
     if not api_key:
         op.error('please set DISCOURSE_API_KEY')
 
-    client = DiscourseClient(options.host, options.api_user, api_key)
+    client = DiscourseClient(options.host, options.api_user, api_key, auth=options.auth)
 
     if options.verbose:
         logging.basicConfig()
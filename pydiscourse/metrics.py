@@ -0,0 +1,232 @@
+"""
+Instrumentation of DiscourseClient requests
+
+Callables in client.before_request are called with (verb, path, params) before a request
+is made, those in client.after_request with a RequestEvent once it has completed::
+
+    metrics = MetricsCollector()
+    client.after_request.append(metrics)
+    ...
+    metrics.snapshot()       # {'GET /t/{id}/posts.json': {'count': 12, 'p50': 0.041, ...}}
+    metrics.to_prometheus()  # text exposition format
+
+With no callables registered the client skips all of the bookkeeping.
+"""
+import bisect
+import re
+import threading
+import time
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+try:  # py3
+    perf_counter = time.perf_counter
+except AttributeError:
+    perf_counter = time.time
+
+
+class RequestEvent(object):
+    """ What happened during one client call, times are in seconds
+
+        template: the path with ids and names replaced, eg /t/{id}/posts.json
+        status: the HTTP status of the last attempt, None when served from a cache
+        bytes: size of the response body
+        retries: how many times the request was retried
+        connect: time spent opening new connections, 0 when a pooled one was reused
+        server: time from sending the request to receiving the response headers
+        transfer: time spent downloading the response body
+        decode: time spent in the client after the body arrived, checking and decoding it
+        total: wall time of the whole call, including rate limiting and retry backoff
+        received: perf_counter() when the last response body arrived, None if nothing was sent
+        error: the exception raised, if any
+
+    connect, server and transfer add up over all attempts of a retried request.
+    """
+    __slots__ = ('verb', 'path', 'template', 'status', 'bytes', 'retries', 'connect', 'server',
+                 'transfer', 'decode', 'total', 'received', 'error')
+
+    def __init__(self, verb, path):
+        self.verb = verb
+        self.path = path
+        self.template = template(path)
+        self.status = None
+        self.bytes = 0
+        self.retries = 0
+        self.connect = 0.0
+        self.server = 0.0
+        self.transfer = 0.0
+        self.decode = 0.0
+        self.total = 0.0
+        self.received = None
+        self.error = None
+
+    @property
+    def endpoint(self):
+        return u'{0} {1}'.format(self.verb, self.template)
+
+    def __repr__(self):
+        return '<RequestEvent {0} {1} {2:.3f}s>'.format(self.endpoint, self.status, self.total)
+
+
+_TEMPLATES = [
+    (re.compile(r'^/t/[^/]+/\d+\.json$'), '/t/{slug}/{id}.json'),
+    (re.compile(r'^/users/(?!hp\.json$)[^/]+?(?=/|\.json$|$)'), '/users/{username}'),
+    (re.compile(r'^/topics/(created-by|private-messages|private-messages-unread)/[^/]+?(?=\.json$)'),
+     r'/topics/\1/{username}'),
+    (re.compile(r'^/admin/users/list/[^/]+?(?=\.json$)'), '/admin/users/list/{filter}'),
+    (re.compile(r'^/admin/site_settings/.+$'), '/admin/site_settings/{setting}'),
+    (re.compile(r'^/category/.+?(?=\.json$)'), '/category/{name}'),
+    (re.compile(r'(?<=/)\d+(?=/|\.json$|$)'), '{id}'),
+]
+
+
+def template(path):
+    """ Replace the ids and names in a Discourse API path with placeholders """
+    for pattern, replacement in _TEMPLATES:
+        path = pattern.sub(replacement, path)
+    return path
+
+
+class Histogram(object):
+    """ Counts of observations in log spaced buckets, percentiles are interpolated """
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, p):
+        if not self.count:
+            return None
+        rank = p / 100.0 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.bounds[i - 1] if i else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.bounds[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.bounds[-1]
+
+
+def log_buckets(start=0.001, factor=1.25, stop=120):
+    bounds = []
+    bound = start
+    while bound < stop:
+        bounds.append(round(bound, 6))
+        bound *= factor
+    return bounds
+
+
+class MetricsCollector(object):
+    """ An after_request callable keeping latency histograms per endpoint """
+    def __init__(self, buckets=None):
+        self.buckets = buckets or log_buckets()
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        with self._lock:
+            stats = self._endpoints.get(event.endpoint)
+            if stats is None:
+                stats = self._endpoints[event.endpoint] = {
+                    'histogram': Histogram(self.buckets), 'errors': 0, 'bytes': 0, 'retries': 0}
+            stats['histogram'].observe(event.total)
+            stats['bytes'] += event.bytes or 0
+            stats['retries'] += event.retries
+            if event.error is not None:
+                stats['errors'] += 1
+
+    def snapshot(self):
+        """ {endpoint: {'count', 'errors', 'bytes', 'retries', 'mean', 'p50', 'p95', 'p99'}} """
+        with self._lock:
+            result = {}
+            for endpoint, stats in self._endpoints.items():
+                histogram = stats['histogram']
+                result[endpoint] = {
+                    'count': histogram.count,
+                    'errors': stats['errors'],
+                    'bytes': stats['bytes'],
+                    'retries': stats['retries'],
+                    'mean': histogram.sum / histogram.count,
+                    'p50': histogram.percentile(50),
+                    'p95': histogram.percentile(95),
+                    'p99': histogram.percentile(99),
+                }
+            return result
+
+    def to_prometheus(self, prefix='pydiscourse'):
+        """ The histograms in the Prometheus text exposition format """
+        name = prefix + '_request_duration_seconds'
+        lines = ['# HELP {0} Duration of Discourse API requests.'.format(name),
+                 '# TYPE {0} histogram'.format(name)]
+        errors = ['# TYPE {0}_request_errors_total counter'.format(prefix)]
+        with self._lock:
+            for endpoint in sorted(self._endpoints):
+                stats = self._endpoints[endpoint]
+                histogram = stats['histogram']
+                verb, path = endpoint.split(' ', 1)
+                labels = u'verb="{0}",path="{1}"'.format(verb, path.replace('"', '\\"'))
+                cumulative = 0
+                for bound, count in zip(self.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(u'{0}_bucket{{{1},le="{2}"}} {3}'.format(name, labels, bound, cumulative))
+                lines.append(u'{0}_bucket{{{1},le="+Inf"}} {2}'.format(name, labels, histogram.count))
+                lines.append(u'{0}_sum{{{1}}} {2}'.format(name, labels, histogram.sum))
+                lines.append(u'{0}_count{{{1}}} {2}'.format(name, labels, histogram.count))
+                errors.append(u'{0}_request_errors_total{{{1}}} {2}'.format(prefix, labels, stats['errors']))
+        return u'\n'.join(lines + errors) + u'\n'
+
+
+_connect = threading.local()
+
+
+def connect_time():
+    """ Seconds this thread spent opening connections since the last reset_connect_time() """
+    return getattr(_connect, 'elapsed', 0.0)
+
+
+def reset_connect_time():
+    _connect.elapsed = 0.0
+
+
+class _TimedConnectMixin(object):
+    def connect(self):
+        start = perf_counter()
+        try:
+            return super(_TimedConnectMixin, self).connect()
+        finally:
+            _connect.elapsed = connect_time() + perf_counter() - start
+
+
+class _TimedHTTPConnection(_TimedConnectMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """ An HTTPAdapter whose connections record how long they took to open """
+    def init_poolmanager(self, *args, **kwargs):
+        super(TimedHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool,
+        }
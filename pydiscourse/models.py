@@ -0,0 +1,143 @@
+"""
+Compact objects for users, topics, posts and categories
+
+A decoded Discourse object is a dict, often holding more dicts and lists. Holding
+hundreds of thousands of them for analysis costs far more memory than their data.
+The models keep the commonly used scalar fields in __slots__ and pack everything else
+into a single JSON encoded bytes value, decoded again only when one of its fields is
+read::
+
+    client = DiscourseClient(host, api_username, api_key, models=True)
+    for post in client.fetch_topic_stream(topic_id):
+        post.username           # a slot
+        post.actions_summary    # decoded from the packed fields on access
+
+Models can also be read like the dicts they replace, post['username'] or
+post.get('reply_to_user'), and turned back into one with to_dict().
+"""
+import json
+
+from pydiscourse.jsonlib import loads
+
+
+class Model(object):
+    """ Base class of the models, subclasses list their slotted fields in __slots__ """
+    __slots__ = ('_packed',)
+    _fields = ()
+
+    def __init__(self, data):
+        packed = dict(data)
+        for key in self._fields:
+            if key in packed and not isinstance(packed[key], (dict, list)):
+                setattr(self, key, packed.pop(key))
+            # else the slot stays empty and reads fall through to the packed fields,
+            # which may not have it either, as the dict didn't
+        self._packed = json.dumps(packed, separators=(',', ':')).encode('utf-8') if packed else None
+
+    @classmethod
+    def many(cls, items):
+        """ A list of models from a list of dicts """
+        return [cls(item) for item in items]
+
+    def _unpacked(self):
+        return loads(self._packed) if self._packed is not None else {}
+
+    def __getattr__(self, name):
+        # only called for names that aren't slots, ie the packed fields
+        if name.startswith('_'):
+            raise AttributeError(name)
+        unpacked = self._unpacked()
+        if name in unpacked:
+            return unpacked[name]
+        raise AttributeError(name)
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def to_dict(self):
+        """ The object as the dict it was made from """
+        data = self._unpacked()
+        data.update(self._slotted())
+        return data
+
+    def _slotted(self):
+        """ The (key, value) of every slot that is set """
+        for key in self._fields:
+            try:
+                yield key, object.__getattribute__(self, key)
+            except AttributeError:
+                pass
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __getstate__(self):
+        state = dict(self._slotted())
+        state['_packed'] = self._packed
+        return state
+
+    def __setstate__(self, state):
+        for key, value in state.items():
+            setattr(self, key, value)
+
+    def __repr__(self):
+        return '<{0} {1}>'.format(type(self).__name__, self.get('id'))
+
+
+_MISSING = object()
+
+
+class User(Model):
+    """ A user, as returned by client.user(), in admin user lists and search results """
+    __slots__ = _fields = (
+        'id', 'username', 'name', 'email', 'active', 'admin', 'moderator', 'trust_level',
+        'created_at', 'last_seen_at', 'last_posted_at', 'post_count', 'avatar_template',
+    )
+
+    def __repr__(self):
+        return '<User {0} {1}>'.format(self.get('id'), self.get('username'))
+
+
+class Topic(Model):
+    """ A topic as listed in topic lists, or as returned by client.topic() """
+    __slots__ = _fields = (
+        'id', 'title', 'slug', 'category_id', 'posts_count', 'reply_count', 'highest_post_number',
+        'created_at', 'bumped_at', 'last_posted_at', 'views', 'like_count', 'pinned', 'closed',
+        'archived', 'visible',
+    )
+
+
+class Post(Model):
+    """ A post from a topic's post stream or a search """
+    __slots__ = _fields = (
+        'id', 'topic_id', 'post_number', 'user_id', 'username', 'created_at', 'updated_at',
+        'cooked', 'raw', 'reply_count', 'reply_to_post_number', 'reads', 'score',
+    )
+
+
+class Category(Model):
+    """ A category from the category list """
+    __slots__ = _fields = (
+        'id', 'name', 'slug', 'color', 'text_color', 'description', 'parent_category_id',
+        'topic_count', 'post_count', 'position',
+    )
+
+    def __repr__(self):
+        return '<Category {0} {1}>'.format(self.get('id'), self.get('slug'))
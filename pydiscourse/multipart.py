@@ -0,0 +1,154 @@
+"""
+multipart/form-data request bodies streamed from disk
+
+requests builds a files= upload in memory before sending it. A MultipartFile is
+iterated instead, reading the file a chunk at a time, and knows its length up front so
+the request is sent with a Content-Length rather than chunked::
+
+    body = MultipartFile('/srv/avatars/sam.png')
+    session.post(url, data=body, headers=body.headers)
+
+Every iteration starts from the beginning of the file again. The body can also be read
+like a file, which is how http.client on Python 2 sends it; seek(0) rewinds it so a
+request that is retried sends the whole body again.
+"""
+import io
+import mimetypes
+import os
+import uuid
+
+# str is bytes on Python 2, where it's taken as a path rather than the content
+_CONTENT_TYPES = (bytearray,) if bytes is str else (bytes, bytearray)
+
+
+class MultipartFile(object):
+    """ A form with one file field and optional text fields
+
+        source: a path, an open binary file (read from its current position) or the
+            content as bytes, a bytearray on Python 2
+        field: the name of the file field
+        filename: sent as the file's name, by default the base name of the path
+        fields: a dict of extra text fields
+    """
+    def __init__(self, source, field='file', filename=None, content_type=None, fields=None, chunk_size=65536):
+        self.source = source
+        self.field = field
+        self.fields = fields or {}
+        self.chunk_size = chunk_size
+
+        if isinstance(source, _CONTENT_TYPES):
+            self.size = len(source)
+            self._offset = 0
+            path = None
+        elif hasattr(source, 'read'):
+            self._offset = source.tell()
+            self.size = _file_size(source) - self._offset
+            path = getattr(source, 'name', None)
+        else:
+            self._offset = 0
+            self.size = os.path.getsize(source)
+            path = source
+
+        if filename is None:
+            filename = os.path.basename(path) if isinstance(path, (str, type(u''))) else field
+        self.filename = filename
+        self.content_type = content_type or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+        self.boundary = uuid.uuid4().hex
+        self._head = self._preamble()
+        self._tail = '\r\n--{0}--\r\n'.format(self.boundary).encode('ascii')
+        self.seek(0)
+
+    @property
+    def headers(self):
+        return {'Content-Type': 'multipart/form-data; boundary={0}'.format(self.boundary)}
+
+    def _preamble(self):
+        parts = []
+        for name, value in sorted(self.fields.items()):
+            parts.append(u'--{0}\r\nContent-Disposition: form-data; name="{1}"\r\n\r\n{2}\r\n'.format(
+                self.boundary, _escape(name), value))
+        parts.append(u'--{0}\r\nContent-Disposition: form-data; name="{1}"; filename="{2}"\r\n'
+                     u'Content-Type: {3}\r\n\r\n'.format(self.boundary, _escape(self.field),
+                                                         _escape(self.filename), self.content_type))
+        return u''.join(parts).encode('utf-8')
+
+    def __len__(self):
+        return len(self._head) + self.size + len(self._tail)
+
+    def __iter__(self):
+        yield self._head
+        for chunk in self.iter_file():
+            yield chunk
+        yield self._tail
+
+    def read(self, size=-1):
+        """ Up to size bytes of the body from the current position, all of it by default """
+        parts = []
+        while size:
+            if self._chunk_offset == len(self._chunk):
+                self._chunk = next(self._chunks, b'')
+                self._chunk_offset = 0
+                if not self._chunk:
+                    break
+            end = len(self._chunk) if size < 0 else min(len(self._chunk), self._chunk_offset + size)
+            parts.append(self._chunk[self._chunk_offset:end])
+            if size > 0:
+                size -= end - self._chunk_offset
+            self._chunk_offset = end
+        data = b''.join(parts)
+        self._position += len(data)
+        return data
+
+    def seek(self, offset, whence=0):
+        """ Only rewinding to the start is supported """
+        if offset or whence:
+            raise io.UnsupportedOperation('a multipart body can only be rewound')
+        chunks = getattr(self, '_chunks', None)
+        if chunks is not None:
+            chunks.close()
+        self._chunks = iter(self)
+        self._chunk = b''
+        self._chunk_offset = 0
+        self._position = 0
+        return 0
+
+    def tell(self):
+        return self._position
+
+    def iter_file(self):
+        """ The file's content, a chunk at a time """
+        if isinstance(self.source, _CONTENT_TYPES):
+            yield bytes(self.source)
+            return
+
+        if hasattr(self.source, 'read'):
+            f = self.source
+            f.seek(self._offset)
+        else:
+            f = open(self.source, 'rb')
+        try:
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            if f is not self.source:
+                f.close()
+
+
+def _file_size(f):
+    try:
+        return os.fstat(f.fileno()).st_size
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        # in memory files have no descriptor
+        position = f.tell()
+        f.seek(0, 2)
+        size = f.tell()
+        f.seek(position)
+        return size
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\r', '%0D').replace('\n', '%0A')
@@ -0,0 +1,132 @@
+"""
+Client side rate limiting and retries for DiscourseClient
+
+Discourse throttles API traffic per key and per IP, answering 429 with a Retry-After
+header once a budget is spent. Rather than failing, a client can pace itself and
+retry transient errors::
+
+    client = DiscourseClient(host, api_username, api_key,
+                             rate_limiter=RateLimiter(), retry=RetryPolicy())
+
+Both objects are thread-safe and can be shared by every thread using the client.
+"""
+import email.utils
+import random
+import threading
+import time
+
+try:  # py3
+    monotonic = time.monotonic
+except AttributeError:
+    monotonic = time.time
+
+
+class TokenBucket(object):
+    """ Allow rate requests per second on average, with bursts of up to capacity """
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self._tokens = self.capacity
+        self._updated = monotonic()
+        self._not_before = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """ Take a token, blocking until one is available """
+        while True:
+            wait = self._take()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """ Hold back every caller for seconds, eg after the server asked us to slow down """
+        with self._lock:
+            self._not_before = max(self._not_before, monotonic() + seconds)
+            self._tokens = 0
+
+    def _take(self):
+        with self._lock:
+            now = monotonic()
+            if now < self._not_before:
+                self._updated = self._not_before
+                return self._not_before - now
+
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+
+class RateLimiter(object):
+    """ Separate token buckets for reads (GET) and writes (everything else)
+
+    The defaults follow Discourse's stock limits of 200 requests a minute per IP and
+    60 admin API requests a minute per key.
+
+        reads_per_minute: budget for GET requests
+        writes_per_minute: budget for POST, PUT and DELETE requests
+        burst: how many requests may be sent back to back before pacing kicks in
+    """
+    def __init__(self, reads_per_minute=200, writes_per_minute=60, burst=10):
+        self.reads = TokenBucket(reads_per_minute / 60.0, burst)
+        self.writes = TokenBucket(writes_per_minute / 60.0, burst)
+
+    def bucket(self, verb):
+        return self.reads if verb == 'GET' else self.writes
+
+    def acquire(self, verb):
+        self.bucket(verb).acquire()
+
+    def pause(self, verb, seconds):
+        self.bucket(verb).pause(seconds)
+
+
+class RetryPolicy(object):
+    """ Decide when and how long to wait before retrying a failed request
+
+    429 responses are always retried, the request was rejected before doing anything.
+    Gateway errors are only retried for idempotent verbs, a POST may already have been
+    applied. Without a Retry-After header the delay is a jittered exponential backoff.
+
+        max_retries: give up and raise after this many retries
+        backoff: base delay in seconds, doubled for every attempt
+        max_backoff: upper bound for a single delay
+    """
+    idempotent = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS')
+
+    def __init__(self, max_retries=5, backoff=0.5, max_backoff=60, statuses=(502, 503, 504)):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.statuses = statuses
+
+    def should_retry(self, verb, response, attempt):
+        if attempt >= self.max_retries:
+            return False
+        if response.status_code == 429:
+            return True
+        return response.status_code in self.statuses and verb in self.idempotent
+
+    def delay(self, response, attempt):
+        retry_after = retry_after_seconds(response.headers.get('Retry-After'))
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+
+def retry_after_seconds(value):
+    """ Parse a Retry-After header, either a number of seconds or an HTTP date """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    parsed = email.utils.parsedate_tz(value)
+    if parsed is None:
+        return None
+    return max(0.0, email.utils.mktime_tz(parsed) - time.time())
@@ -18,50 +18,223 @@ A SSO request handler might look something like
 
         url = sso_redirect_url(nonce, SECRET, request.user.email, request.user.id, request.user.username)
         return redirect('http://discuss.example.com' + url)
+
+An SSOHandler can be kept per secret instead, it keys the HMAC once and returns every
+field of the request payload::
+
+    sso = SSOHandler(SECRET)
+    params = sso.parse(payload, signature)  # {'nonce': ..., 'return_sso_url': ...}
+    url = sso.redirect_url(params['nonce'], email, external_id, username)
+
+To reject replayed payloads, pass a nonce store remembering the nonces already seen.
+NonceStore keeps them in process, RedisNonceStore shares them between servers::
+
+    sso = SSOHandler(SECRET, nonces=NonceStore(ttl=600))
+    nonce = sso_validate(payload, signature, SECRET, nonces=RedisNonceStore(redis.Redis()))
+
+Any object with an add(nonce) method, returning False for a nonce it has already seen,
+can be used instead.
 """
 import base64
+import binascii
+import collections
 import hmac
 import hashlib
+import threading
+import time
 
 try:  # py3
-    from urllib.parse import unquote, urlencode
+    from urllib.parse import parse_qsl, quote_plus, unquote, unquote_plus, urlencode
 except ImportError:
-    from urllib import unquote, urlencode
+    from urllib import quote_plus, unquote, unquote_plus, urlencode
+    from urlparse import parse_qsl
 
 
 from pydiscourse.exceptions import DiscourseError
 
 
-def sso_validate(payload, signature, secret):
+try:  # py2
+    _unicode = unicode
+except NameError:
+    _unicode = str
+
+if bytes is str:  # py2 unquotes to bytes, so the fields are decoded afterwards as py3 does
+    def _parse_qsl(query):
+        return [(name.decode('utf-8', 'replace'), value.decode('utf-8', 'replace'))
+                for name, value in parse_qsl(query.encode('utf-8'), keep_blank_values=True)]
+
+    def _unquote_plus(value):
+        return unquote_plus(value.encode('utf-8')).decode('utf-8', 'replace')
+
+    def _encode_query(fields):
+        # py2 urlencode() can't take unicode values
+        return urlencode([(name, _bytes(value)) for name, value in fields])
+else:
+    def _parse_qsl(query):
+        return parse_qsl(query, keep_blank_values=True)
+
+    _unquote_plus = unquote_plus
+    _encode_query = urlencode
+
+
+class SSOHandler(object):
+    """ Validate SSO requests from Discourse and sign the responses, for one secret
+
+        nonces: an optional NonceStore or RedisNonceStore, payloads whose nonce it has
+            seen before are rejected
+
+    An SSOHandler can be shared between threads.
     """
-        payload: provided by Discourse HTTP call to your SSO endpoint as sso GET param
-        signature: provided by Discourse HTTP call to your SSO endpoint as sig GET param
-        secret: the secret key you entered into Discourse sso secret
+    def __init__(self, secret, nonces=None):
+        if not secret:
+            raise DiscourseError('Invalid secret..')
+        self.nonces = nonces
+        self._hmac = hmac.new(_bytes(secret), digestmod=hashlib.sha256)
 
-        return value: The nonce used by discourse to validate the redirect URL
+    def sign(self, payload):
+        """ The hex HMAC-SHA256 signature of a base64 payload """
+        h = self._hmac.copy()
+        h.update(_bytes(payload))
+        return h.hexdigest()
+
+    def parse(self, payload, signature):
+        """ Check the signature of a request and return its payload as a dict
+
+            payload: provided by Discourse HTTP call to your SSO endpoint as sso GET param
+            signature: provided by Discourse HTTP call to your SSO endpoint as sig GET param
+        """
+        # when a name is repeated the last value wins
+        params = dict(_parse_qsl(self._decode(payload, signature)))
+        if not params.get('nonce'):
+            raise DiscourseError('Invalid payload..')
+        _check_nonce(self.nonces, params['nonce'])
+        return params
+
+    def validate(self, payload, signature):
+        """ Check the signature of a request and return the nonce Discourse expects back """
+        # only the nonce is unquoted, the other fields aren't needed
+        nonce = _field(self._decode(payload, signature), 'nonce')
+        if not nonce:
+            raise DiscourseError('Invalid payload..')
+        _check_nonce(self.nonces, nonce)
+        return nonce
+
+    def _decode(self, payload, signature):
+        """ The query string in a signed payload """
+        if payload is None or signature is None:
+            raise DiscourseError('No SSO payload or signature.')
+
+        payload = unquote(_text(payload))
+        if not payload:
+            raise DiscourseError('Invalid payload..')
+
+        if not hmac.compare_digest(_bytes(self.sign(payload)), _bytes(signature)):
+            raise DiscourseError('Payload does not match signature.')
+
+        try:
+            return base64.b64decode(_bytes(payload)).decode('utf-8')
+        except (binascii.Error, TypeError, UnicodeDecodeError):
+            raise DiscourseError('Invalid payload..')
+
+    def redirect_url(self, nonce, email, external_id, username, **kwargs):
+        """ The path to send the user back to on Discourse, logged in as username
+
+        Extra keyword arguments, eg name or avatar_url, are added to the payload.
+        """
+        kwargs.update({
+            'nonce': nonce,
+            'email': email,
+            'external_id': external_id,
+            'username': username
+        })
+        return_payload = base64.b64encode(_bytes(_encode_query(sorted(kwargs.items())))).decode('ascii')
+        # the signature is hex, only the payload needs quoting
+        return '/session/sso_login?sso={0}&sig={1}'.format(quote_plus(return_payload), self.sign(return_payload))
+
+
+class NonceStore(object):
+    """ The nonces seen in the last ttl seconds, at most maxsize of them, in this process
+
+    Nonces are kept in the order they arrived, which is also the order they expire in,
+    so both the check and the eviction take constant time. When more than maxsize arrive
+    within ttl the oldest are forgotten early.
     """
-    if None in [payload, signature]:
-        raise DiscourseError('No SSO payload or signature.')
+    def __init__(self, ttl=600, maxsize=100000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._expires = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, nonce):
+        """ Remember nonce, returns False if it was already known """
+        now = time.time()
+        with self._lock:
+            expires = self._expires
+            while expires:
+                oldest = next(iter(expires))
+                if expires[oldest] > now and len(expires) < self.maxsize:
+                    break
+                del expires[oldest]
+
+            if nonce in expires:
+                return False
+            expires[nonce] = now + self.ttl
+            return True
+
+    def __len__(self):
+        return len(self._expires)
+
+
+class RedisNonceStore(object):
+    """ Nonces kept in Redis, so every server behind a load balancer sees the same ones
+
+        redis: a redis.Redis client, or anything with its set(name, value, ex=, nx=) method
+        ttl: how long a nonce is remembered, Redis expires it afterwards
+        prefix: prepended to the nonces to make their keys
+    """
+    def __init__(self, redis, ttl=600, prefix='pydiscourse:sso:nonce:'):
+        self.redis = redis
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def add(self, nonce):
+        """ Remember nonce, returns False if it was already known """
+        # SET NX is atomic, only one of several concurrent logins with a nonce wins
+        return bool(self.redis.set(self.prefix + nonce, 1, ex=self.ttl, nx=True))
+
+
+def _check_nonce(nonces, nonce):
+    if nonces is not None and not nonces.add(nonce):
+        raise DiscourseError('Nonce already used.')
+
 
-    if not secret:
-        raise DiscourseError('Invalid secret..')
+_handlers = {}
 
-    payload = unquote(payload)
-    if not payload:
-        raise DiscourseError('Invalid payload..')
 
-    decoded = base64.decodestring(payload)
-    if 'nonce' not in decoded:
-        raise DiscourseError('Invalid payload..')
+def _handler(secret):
+    """ A shared SSOHandler for secret, so the functions below don't key an HMAC per call """
+    handler = _handlers.get(secret)
+    if handler is None:
+        if len(_handlers) >= 16:
+            _handlers.clear()
+        handler = _handlers[secret] = SSOHandler(secret)
+    return handler
 
-    h = hmac.new(secret, payload, digestmod=hashlib.sha256)
-    this_signature = h.hexdigest()
 
-    if this_signature != signature:
-        raise DiscourseError('Payload does not match signature.')
+def sso_validate(payload, signature, secret, nonces=None):
+    """
+        payload: provided by Discourse HTTP call to your SSO endpoint as sso GET param
+        signature: provided by Discourse HTTP call to your SSO endpoint as sig GET param
+        secret: the secret key you entered into Discourse sso secret
+        nonces: an optional NonceStore or RedisNonceStore to reject replayed payloads
 
-    nonce = decoded.split('=')[1]
+        return value: The nonce used by discourse to validate the redirect URL
+    """
+    if None in [payload, signature]:
+        raise DiscourseError('No SSO payload or signature.')
 
+    nonce = _handler(secret).validate(payload, signature)
+    _check_nonce(nonces, nonce)
     return nonce
 
 
@@ -75,15 +248,21 @@ def sso_redirect_url(nonce, secret, email, external_id, username, **kwargs):
 
         return value: URL to redirect users back to discourse, now logged in as user_username
     """
-    kwargs.update({
-        'nonce': nonce,
-        'email': email,
-        'external_id': external_id,
-        'username': username
-    })
-
-    return_payload = base64.encodestring(urlencode(kwargs))
-    h = hmac.new(secret, return_payload, digestmod=hashlib.sha256)
-    query_string = urlencode({'sso': return_payload, 'sig': h.hexdigest()})
-
-    return '/session/sso_login?%s' % query_string
+    return _handler(secret).redirect_url(nonce, email, external_id, username, **kwargs)
+
+
+def _field(query, name):
+    """ The last value of name in a query string, or None, as parse_qsl() would give it """
+    prefix = name + '='
+    for pair in reversed(query.split('&')):
+        if pair.startswith(prefix):
+            return _unquote_plus(pair[len(prefix):])
+    return None
+
+
+def _bytes(value):
+    return value.encode('utf-8') if isinstance(value, _unicode) else value
+
+
+def _text(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
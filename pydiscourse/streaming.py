@@ -0,0 +1,188 @@
+"""
+Incremental decoding of large JSON listings
+
+iter_items() walks a JSON document as it arrives in chunks, skipping everything outside
+the array at the requested path and decoding one array element at a time::
+
+    for user in iter_items(response.iter_content(65536), ()):
+        ...
+    for topic in iter_items(chunks, ('topic_list', 'topics')):
+        ...
+
+Memory use is bounded by the chunk size and the largest single element, not by the size
+of the document.
+"""
+import codecs
+import json
+import re
+
+
+_WHITESPACE = re.compile(r'[^ \t\r\n]')
+_STRUCTURE = re.compile(r'[\[\]{}"]')
+_STRING = re.compile(r'["\\]')
+_SCALAR_END = re.compile(r'[,\]}\s]')
+_DECODER = json.JSONDecoder()
+
+
+class _Scanner(object):
+    """ A cursor over a growing text buffer, consumed text is dropped as chunks arrive """
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buf = u''
+        self.pos = 0
+        self.mark = None
+        self.eof = False
+
+    def fill(self):
+        """ Append the next chunk, returns False once the input is exhausted """
+        if self.eof:
+            return False
+
+        keep = self.pos if self.mark is None else self.mark
+        self.buf = self.buf[keep:]
+        self.pos -= keep
+        if self.mark is not None:
+            self.mark = 0
+
+        for chunk in self._chunks:
+            text = self._decoder.decode(chunk)
+            if text:
+                self.buf += text
+                return True
+
+        self.eof = True
+        self.buf += self._decoder.decode(b'', True)
+        return False
+
+    def peek(self):
+        """ The next non whitespace character, or None at the end of input """
+        while True:
+            m = _WHITESPACE.search(self.buf, self.pos)
+            if m:
+                self.pos = m.start()
+                return self.buf[self.pos]
+            self.pos = len(self.buf)
+            if not self.fill():
+                return None
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError('Expecting {0!r} at {1!r}'.format(char, self.buf[self.pos:self.pos + 20]))
+        self.pos += 1
+
+    def read_value(self):
+        self.peek()
+        try:
+            value, end = _DECODER.raw_decode(self.buf, self.pos)
+        except ValueError:
+            pass
+        else:
+            # a number may continue in the next chunk, raw_decode stops short of a
+            # fraction or exponent that isn't there yet, eg at the . of 1.|5
+            if self.eof or (end < len(self.buf) and
+                            (self.buf[self.pos] in '"[{' or _SCALAR_END.match(self.buf, end))):
+                self.pos = end
+                return value
+
+        # the value is incomplete, find where it ends before decoding it
+        self.mark = self.pos
+        self.skip_value()
+        text = self.buf[self.mark:self.pos]
+        self.mark = None
+        return json.loads(text)
+
+    def skip_value(self):
+        char = self.peek()
+        if char is None:
+            raise ValueError('Unexpected end of input')
+
+        if char == '"':
+            self.pos += 1
+            self._skip_string()
+        elif char in '[{':
+            self.pos += 1
+            self._skip_container()
+        else:
+            self._skip_scalar()
+
+    def _skip_string(self):
+        while True:
+            m = _STRING.search(self.buf, self.pos)
+            if m is None or (m.group() == '\\' and m.end() >= len(self.buf)):
+                # the closing quote or the escaped character is in a later chunk
+                self.pos = m.start() if m else len(self.buf)
+                if not self.fill():
+                    raise ValueError('Unterminated string')
+                continue
+
+            if m.group() == '\\':
+                self.pos = m.end() + 1
+            else:
+                self.pos = m.end()
+                return
+
+    def _skip_container(self):
+        depth = 1
+        while depth:
+            m = _STRUCTURE.search(self.buf, self.pos)
+            if m is None:
+                self.pos = len(self.buf)
+                if not self.fill():
+                    raise ValueError('Unexpected end of input')
+                continue
+
+            self.pos = m.end()
+            char = m.group()
+            if char == '"':
+                self._skip_string()
+            elif char in '[{':
+                depth += 1
+            else:
+                depth -= 1
+
+    def _skip_scalar(self):
+        while True:
+            m = _SCALAR_END.search(self.buf, self.pos)
+            if m:
+                self.pos = m.start()
+                return
+            if not self.fill():
+                self.pos = len(self.buf)
+                return
+
+
+def iter_items(chunks, path=()):
+    """ Yield the elements of the array found by following the object keys in path
+
+    chunks is an iterable of UTF-8 encoded bytes. Raises ValueError for malformed input
+    and KeyError when a key in path is missing.
+    """
+    scanner = _Scanner(chunks)
+    for key in path:
+        _find_key(scanner, key)
+
+    scanner.expect('[')
+    if scanner.peek() == ']':
+        return
+
+    while True:
+        yield scanner.read_value()
+        char = scanner.peek()
+        if char == ']':
+            return
+        scanner.expect(',')
+
+
+def _find_key(scanner, key):
+    """ Move the scanner to the value of key in the object starting at the cursor """
+    scanner.expect('{')
+    while scanner.peek() != '}':
+        name = scanner.read_value()
+        scanner.expect(':')
+        if name == key:
+            return
+        scanner.skip_value()
+        if scanner.peek() == ',':
+            scanner.pos += 1
+    raise KeyError(key)
@@ -0,0 +1,147 @@
+"""
+Incremental mirroring of a forum's topics and posts
+
+ForumSync remembers, per topic, the highest_post_number and bumped_at it last saw and
+the id of the last post it fetched. Each run reads /latest, newest activity first, only
+as far back as the previous run got, and fetches just the posts added since::
+
+    def save(topic, posts):
+        warehouse.write(topic, posts)
+
+    with ForumSync(client, '/var/lib/mirror/discourse.db') as sync:
+        sync.run(save)  # {'topics': 12, 'posts': 31, 'unchanged': 2}
+
+A topic's cursor is stored once the handler has returned for it, so a run that crashes
+is resumed by the next one. A topic the handler was given just before a crash may be
+handed over again, handlers should be idempotent.
+"""
+import collections
+import sqlite3
+import threading
+import time
+
+from pydiscourse.client import _ordered_map
+
+
+TopicCursor = collections.namedtuple('TopicCursor', 'topic_id highest_post_number bumped_at last_post_id')
+
+
+class CursorStore(object):
+    """ High-water marks of synced topics, kept in a SQLite database at path """
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('CREATE TABLE IF NOT EXISTS topics (topic_id INTEGER PRIMARY KEY, '
+                         'highest_post_number INTEGER, bumped_at TEXT, last_post_id INTEGER, synced_at REAL)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)')
+
+    def get(self, topic_id):
+        """ The TopicCursor of a topic, or None if it was never synced """
+        with self._lock:
+            row = self._db.execute('SELECT topic_id, highest_post_number, bumped_at, last_post_id '
+                                   'FROM topics WHERE topic_id = ?', (topic_id,)).fetchone()
+        return TopicCursor(*row) if row is not None else None
+
+    def save(self, cursor):
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO topics VALUES (?, ?, ?, ?, ?)', tuple(cursor) + (time.time(),))
+
+    @property
+    def watermark(self):
+        """ The latest bumped_at seen by the last run that completed """
+        with self._lock:
+            row = self._db.execute("SELECT value FROM state WHERE key = 'watermark'").fetchone()
+        return row[0] if row is not None else None
+
+    @watermark.setter
+    def watermark(self, value):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO state VALUES ('watermark', ?)", (value,))
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM topics').fetchone()[0]
+
+    def close(self):
+        self._db.close()
+
+
+class ForumSync(object):
+    """ Fetch the topics and posts that changed since the previous run
+
+        client: the DiscourseClient to fetch with
+        store: a CursorStore, or the path of its SQLite database
+        workers: how many changed topics are fetched at once
+    """
+    def __init__(self, client, store, workers=4):
+        self.client = client
+        self.store = store if isinstance(store, CursorStore) else CursorStore(store)
+        self.workers = workers
+
+    def run(self, handler):
+        """ Call handler(topic, posts) for every topic with activity since the last run
+
+        topic is the entry from /latest and posts are the posts added since the topic was
+        last synced, in order, which is every post the first time. Returns counts of the
+        topics and posts handed over, and of topics bumped without new posts.
+        """
+        stats = {'topics': 0, 'posts': 0, 'unchanged': 0}
+        watermark = self.store.watermark
+        newest = [watermark]
+        changed = self._changed_topics(watermark, newest)
+
+        for topic, cursor, posts in _ordered_map(self._fetch, changed, self.workers):
+            if posts is None:
+                stats['unchanged'] += 1
+            else:
+                handler(topic, posts)
+                stats['topics'] += 1
+                stats['posts'] += len(posts)
+
+            last_post_id = max([p['id'] for p in posts or []] + [cursor.last_post_id if cursor else 0])
+            self.store.save(TopicCursor(topic['id'], topic['highest_post_number'], topic['bumped_at'],
+                                        last_post_id or None))
+
+        # only a completed run moves the watermark, so a crashed one is scanned again
+        self.store.watermark = newest[0]
+        return stats
+
+    def _changed_topics(self, watermark, newest):
+        """ (topic, cursor) for the topics in /latest that moved on since they were synced
+
+        newest[0] is raised to the latest bumped_at seen along the way.
+        """
+        for topic in self.client.iter_latest_topics(prefetch=True):
+            if watermark is not None and topic['bumped_at'] < watermark:
+                # pinned topics are listed first however long ago they were bumped
+                if topic.get('pinned'):
+                    continue
+                return
+
+            if newest[0] is None or topic['bumped_at'] > newest[0]:
+                newest[0] = topic['bumped_at']
+
+            cursor = self.store.get(topic['id'])
+            if cursor is not None and (cursor.bumped_at, cursor.highest_post_number) == (
+                    topic['bumped_at'], topic['highest_post_number']):
+                continue
+            yield topic, cursor
+
+    def _fetch(self, item):
+        topic, cursor = item
+        if cursor is not None and cursor.highest_post_number == topic['highest_post_number']:
+            # bumped without new posts, eg by an edit or a category change
+            return topic, cursor, None
+
+        after = cursor.last_post_id if cursor is not None else None
+        posts = list(self.client.fetch_topic_stream(topic['id'], workers=1, after=after))
+        return topic, cursor, posts
+
+    def close(self):
+        self.store.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,98 @@
+"""
+Batching of topic read timings
+
+Marking topics as read costs one POST to /topics/timings per topic and user. When the
+same topics are read over and over, most of those requests can be merged::
+
+    with TimingsBatcher(client, max_pending=500, interval=10) as batcher:
+        batcher.add(topic_id, 5000, {1: 2500, 2: 2500}, username='bob')
+        ...
+
+Timings for the same topic and user are summed until the batch is sent, either because
+max_pending topics are waiting, interval seconds have passed or the batcher is closed.
+"""
+import logging
+import threading
+
+
+log = logging.getLogger('pydiscourse.timings')
+
+
+class TimingsBatcher(object):
+    """ Buffer topic_timings calls and send them from a background thread
+
+        client: the DiscourseClient used to send timings
+        max_pending: send as soon as this many (user, topic) pairs are waiting
+        interval: send at least this often, in seconds
+    """
+    def __init__(self, client, max_pending=500, interval=5.0):
+        self.client = client
+        self.max_pending = max_pending
+        self.interval = interval
+        self.added = 0
+        self.sent = 0
+        self.failed = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='pydiscourse-timings')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add(self, topic_id, time, timings, username=None):
+        """ Record time ms spent in a topic and timings {post_number: ms} for username """
+        with self._lock:
+            # checked under the lock so the timing either raises or lands before close()
+            # takes the final batch
+            if self._closed:
+                raise ValueError('TimingsBatcher is closed')
+            self.added += 1
+            entry = self._pending.setdefault((username, topic_id), [0, {}])
+            entry[0] += time
+            for post_number, ms in timings.items():
+                entry[1][post_number] = entry[1].get(post_number, 0) + ms
+            full = len(self._pending) >= self.max_pending
+
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """ Send every pending timing now, returns the number of requests made """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+
+            for (username, topic_id), (time, timings) in pending.items():
+                kwargs = {'api_username': username} if username else {}
+                try:
+                    self.client.topic_timings(topic_id, time, timings, **kwargs)
+                    self.sent += 1
+                except Exception:
+                    self.failed += 1
+                    log.exception('failed to send timings for topic %s', topic_id)
+            return len(pending)
+
+    def close(self):
+        """ Stop the background thread and send whatever is left """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._wakeup.set()
+        self._thread.join()
+        self.flush()
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if not self._closed:
+                self.flush()
@@ -34,7 +34,12 @@ setup(
     author_email=AUTHOR_EMAIL,
     license="BSD",
     url=URL,
-    packages=find_packages(exclude=["tests.*", "tests"]),
+    packages=find_packages(exclude=["tests.*", "tests", "benchmarks.*", "benchmarks"]),
+    extras_require={
+        'async': ['aiohttp'],
+        'speedups': ['orjson'],
+        'export': ['pyarrow'],
+    },
     entry_points={
         'console_scripts': [
             'pydiscoursecli = pydiscourse.main:main'
@@ -0,0 +1,149 @@
+"""
+A tiny local HTTP server that pretends to be Discourse, for tests that need real sockets
+
+    with StubServer({'/latest.json': {'topic_list': {'topics': []}}}) as server:
+        client = DiscourseClient(server.url, 'system', 'key')
+        client.latest_topics()
+        server.connections  # number of TCP connections accepted
+
+Routes map a path (without query string, globs like /users/* are allowed) to either a JSON-serialisable payload or a
+callable taking the StubRequest and returning a payload, a (status, payload) tuple or
+a (status, headers, body) tuple.
+"""
+import fnmatch
+import json
+import threading
+import time
+
+try:  # py3
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+
+JSON_CONTENT = 'application/json; charset=utf-8'
+
+
+class StubRequest(object):
+    def __init__(self, verb, path, query, headers, body):
+        self.verb = verb
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _handle(self):
+        stub = self.server.stub
+        parsed = urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        query = parse_qs(parsed.query, keep_blank_values=True)
+        if body and not self.headers.get('Content-Type', '').startswith('multipart/'):
+            query.update(parse_qs(body.decode('utf-8'), keep_blank_values=True))
+        request = StubRequest(self.command, parsed.path, query, self.headers, body)
+        stub.record(request)
+
+        if stub.delay:
+            time.sleep(stub.delay)
+
+        route = stub.route(parsed.path)
+        if route is None:
+            result = (404, {'errors': ['not found']})
+        elif callable(route):
+            result = route(request)
+        else:
+            result = route
+
+        if not isinstance(result, tuple):
+            result = (200, result)
+        if len(result) == 2:
+            result = (result[0], {}, result[1])
+        status, headers, body = result
+
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+            headers.setdefault('Content-Type', JSON_CONTENT)
+
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        if self.headers.get('Connection', '').lower() == 'close':
+            # say so, or the client may reuse the connection before it sees it closed
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def get_request(self):
+        conn = HTTPServer.get_request(self)
+        self.stub.connected()
+        return conn
+
+
+class StubServer(object):
+    def __init__(self, routes=None, delay=0):
+        self.routes = routes if routes is not None else {}
+        self.delay = delay
+        self.connections = 0
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{0}'.format(self._server.server_address[1])
+
+    def route(self, path):
+        if path in self.routes:
+            return self.routes[path]
+        for pattern, route in self.routes.items():
+            if '*' in pattern and fnmatch.fnmatchcase(path, pattern):
+                return route
+        return None
+
+    def connected(self):
+        with self._lock:
+            self.connections += 1
+
+    def record(self, request):
+        with self._lock:
+            self.requests.append(request)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={'poll_interval': 0.05})
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,119 @@
+import time
+import unittest
+
+try:
+    import asyncio
+    from pydiscourse.async_client import AsyncDiscourseClient
+except (ImportError, SyntaxError):  # py2 or aiohttp missing
+    AsyncDiscourseClient = None
+
+from pydiscourse.exceptions import DiscourseClientError
+from tests.stubserver import StubServer
+
+
+@unittest.skipIf(AsyncDiscourseClient is None, 'requires asyncio and aiohttp')
+class AsyncClientTestCase(unittest.TestCase):
+    routes = {}
+    delay = 0
+
+    def setUp(self):
+        self.server = StubServer(dict(self.routes), delay=self.delay).start()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.client = AsyncDiscourseClient(self.server.url, 'testuser', 'testkey')
+
+    def tearDown(self):
+        self.wait(self.client.close())
+        self.loop.close()
+        asyncio.set_event_loop(None)
+        self.server.stop()
+
+    def wait(self, coro):
+        return self.loop.run_until_complete(coro)
+
+
+class TestWrappers(AsyncClientTestCase):
+    routes = {
+        '/users/someuser.json': {'user': {'username': 'someuser'}},
+        '/users/hp.json': {'challenge': 'abc', 'value': 'xyz'},
+        '/users': {'success': True},
+        '/categories.json': {'category_list': {'categories': [{'id': 7, 'name': 'parent'}]}},
+        '/categories': {'category': {'id': 8}},
+        '/t/22/posts.json': {'post_stream': {'posts': []}},
+        '/users/someuser/preferences/avatar': {'success': 'OK'},
+        '/admin/site_settings.json': {'site_settings': [{'setting': 'title', 'value': 'Forum'},
+                                                        {'setting': 'login_required', 'value': False}]},
+        '/admin/site_settings/*': {},
+    }
+
+    def test_user(self):
+        user = self.wait(self.client.user('someuser'))
+        self.assertEqual(user, {'username': 'someuser'})
+
+        request = self.server.requests[0]
+        self.assertEqual(request.verb, 'GET')
+        self.assertEqual(request.query['api_key'], ['testkey'])
+        self.assertEqual(request.query['api_username'], ['testuser'])
+
+    def test_header_auth(self):
+        self.client.auth = 'header'
+        self.wait(self.client.user('someuser'))
+
+        request = self.server.requests[0]
+        self.assertEqual(request.query, {})
+        self.assertEqual((request.headers['Api-Key'], request.headers['Api-Username']), ('testkey', 'testuser'))
+
+    def test_update_avatar_image(self):
+        self.wait(self.client.update_avatar_image('someuser', b'\x89PNG'))
+
+        request = self.server.requests[0]
+        self.assertEqual(request.verb, 'POST')
+        self.assertEqual(int(request.headers['Content-Length']), len(request.body))
+        self.assertIn(b'name="file"; filename="file"', request.body)
+        self.assertIn(b'\r\n\r\n\x89PNG\r\n', request.body)
+
+    def test_site_settings(self):
+        report = self.wait(self.client.site_settings(title='Forum', login_required=True))
+        self.assertEqual(report.changed, {'login_required': ('false', 'true')})
+        self.assertEqual([r.path for r in self.server.requests],
+                         ['/admin/site_settings.json', '/admin/site_settings/login_required'])
+
+    def test_map(self):
+        users = self.wait(self.client.map('user', ['someuser', 'missing']))
+        self.assertEqual(users[0], {'username': 'someuser'})
+        self.assertIsInstance(users[1], DiscourseClientError)
+
+    def test_create_user(self):
+        self.wait(self.client.create_user('Test User', 'testuser', 'test@example.com', 'notapassword'))
+        hp, create = self.server.requests
+        self.assertEqual(hp.path, '/users/hp.json')
+        self.assertEqual(create.verb, 'POST')
+        self.assertEqual(create.query['challenge'], ['cba'])
+        self.assertEqual(create.query['password_confirmation'], ['xyz'])
+
+    def test_create_category_with_parent(self):
+        self.wait(self.client.create_category('child', 'FF0000', parent='parent'))
+        self.assertEqual(self.server.requests[-1].query['parent_category_id'], ['7'])
+
+    def test_posts_list_params(self):
+        self.wait(self.client.posts(22, [1, 2]))
+        self.assertEqual(self.server.requests[0].query['post_ids[]'], ['1', '2'])
+
+    def test_client_error(self):
+        with self.assertRaises(DiscourseClientError):
+            self.wait(self.client.user('missing'))
+
+
+class TestConcurrency(AsyncClientTestCase):
+    routes = {'/latest.json': {'topic_list': {'topics': []}}}
+    delay = 0.2
+
+    def test_concurrent_requests(self):
+        n = 20
+        start = time.time()
+        results = self.wait(asyncio.gather(*[self.client.latest_topics() for _ in range(n)]))
+        elapsed = time.time() - start
+
+        self.assertEqual(len(results), n)
+        # n requests in flight at once take about as long as one
+        self.assertLess(elapsed, self.delay * 3)
@@ -0,0 +1,233 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import mock
+
+from pydiscourse import bulk, client
+from pydiscourse.exceptions import DiscourseClientError
+from pydiscourse.ratelimit import RateLimiter, RetryPolicy
+from tests.stubserver import StubServer
+
+
+class BulkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.users = {}
+        self.lock = threading.Lock()
+        self.server = StubServer(self.routes()).start()
+        self.client = client.DiscourseClient(self.server.url, 'system', 'testkey')
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def routes(self):
+        return {}
+
+    def requests(self, verb, pattern=''):
+        return [r for r in self.server.requests if r.verb == verb and pattern in r.path]
+
+
+class TestProvisionUsers(BulkTestCase):
+    def routes(self):
+        def create(request):
+            username = request.query['username'][0]
+            if username == 'taken':
+                return {'success': False, 'message': 'Username is not available'}
+            with self.lock:
+                user_id = len(self.users) + 1
+                self.users[username] = user_id
+            return {'success': True, 'active': True, 'user_id': user_id}
+
+        def trust_level(request):
+            if request.query['level'] == ['9']:
+                return (400, {'errors': ['invalid level']})
+            return {'success': 'OK'}
+
+        return {
+            '/users/hp.json': {'challenge': 'abc', 'value': 'xyz'},
+            '/users': create,
+            '/admin/users/*/trust_level': trust_level,
+            '/users/*/preferences/avatar': {'success': 'OK'},
+            '/users/*': {'user': {}},
+        }
+
+    def spec(self, username, **kwargs):
+        kwargs.update(name=username.title(), username=username, email=username + '@example.com',
+                      password='notapassword')
+        return kwargs
+
+    def test_provision(self):
+        specs = [self.spec('user{0}'.format(n), trust_level=1, avatar_url='http://example.com/a.png',
+                           preferences={'title': 'new'}) for n in range(20)]
+        results = list(bulk.provision_users(self.client, specs, workers=4))
+
+        self.assertEqual([r.username for r in results], [s['username'] for s in specs])
+        self.assertTrue(all(r.error is None for r in results))
+        self.assertEqual(sorted(r.user_id for r in results), list(range(1, 21)))
+
+        self.assertEqual(len(self.requests('GET', '/users/hp.json')), 1)
+        self.assertEqual(len(self.requests('PUT', '/trust_level')), 20)
+        self.assertEqual(len(self.requests('POST', '/preferences/avatar')), 20)
+        self.assertEqual(self.requests('POST', '/users')[0].query['challenge'], ['cba'])
+
+    def test_honeypot_per_user(self):
+        specs = [self.spec('user{0}'.format(n)) for n in range(3)]
+        list(bulk.provision_users(self.client, specs, reuse_honeypot=False))
+        self.assertEqual(len(self.requests('GET', '/users/hp.json')), 3)
+
+    def test_failures_are_reported(self):
+        specs = [self.spec('taken', trust_level=1), self.spec('bad', trust_level=9), self.spec('good')]
+        taken, bad, good = bulk.provision_users(self.client, specs)
+
+        self.assertEqual(taken.step, 'create_user')
+        self.assertIsNone(taken.user_id)
+        self.assertEqual(bad.step, 'trust_level')
+        self.assertIsInstance(bad.error, DiscourseClientError)
+        self.assertIsNotNone(bad.user_id)
+        self.assertEqual(good.error, None)
+
+
+class TestUploadAvatars(BulkTestCase):
+    def setUp(self):
+        super(TestUploadAvatars, self).setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.checkpoint = os.path.join(self.tmp, 'avatars.done')
+
+    def tearDown(self):
+        super(TestUploadAvatars, self).tearDown()
+        shutil.rmtree(self.tmp)
+
+    def routes(self):
+        def avatar(request):
+            if b'broken' in request.body:
+                return (422, {'errors': ['invalid image']})
+            return {'success': 'OK'}
+        return {'/users/*/preferences/avatar': avatar}
+
+    def avatars(self, *contents):
+        avatars = []
+        for n, content in enumerate(contents):
+            path = os.path.join(self.tmp, 'user{0}.png'.format(n))
+            with open(path, 'wb') as f:
+                f.write(content)
+            avatars.append(('user{0}'.format(n), path))
+        return avatars
+
+    def test_upload(self):
+        avatars = self.avatars(b'\x89PNG' * 100000, b'\x89PNG')
+        results = list(bulk.upload_avatars(self.client, avatars, workers=2))
+
+        self.assertEqual([(r.username, r.size, r.error) for r in results], [('user0', 400000, None),
+                                                                             ('user1', 4, None)])
+        self.assertTrue(results[0].bytes_per_second > 0)
+        request = self.requests('POST', '/users/user0/')[0]
+        self.assertEqual(int(request.headers['Content-Length']), len(request.body))
+        self.assertIn(b'filename="user0.png"\r\nContent-Type: image/png\r\n\r\n' + b'\x89PNG' * 100000,
+                      request.body)
+
+    def test_retried_upload_sends_whole_body(self):
+        self.client.retry = RetryPolicy(max_retries=1)
+        responses = [(429, {'Retry-After': '0'}, {'errors': ['slow down']})]
+        self.server.routes['/users/*/preferences/avatar'] = lambda request: (
+            responses.pop() if responses else {'success': 'OK'})
+        avatars = self.avatars(b'\x89PNG' * 100000)
+        self.assertIsNone(list(bulk.upload_avatars(self.client, avatars))[0].error)
+
+        first, second = self.requests('POST')
+        self.assertEqual(first.body, second.body)
+        self.assertEqual(int(second.headers['Content-Length']), len(second.body))
+
+    def test_resume(self):
+        avatars = self.avatars(b'one', b'broken', b'three')
+        avatars.append(('missing', os.path.join(self.tmp, 'missing.png')))
+        results = list(bulk.upload_avatars(self.client, avatars, checkpoint=self.checkpoint))
+        self.assertEqual([r.error is None for r in results], [True, False, True, False])
+        self.assertIsInstance(results[1].error, DiscourseClientError)
+        self.assertIsInstance(results[3].error, OSError)
+
+        with open(avatars[1][1], 'wb') as f:
+            f.write(b'fixed')
+        del self.server.requests[:]
+        results = list(bulk.upload_avatars(self.client, avatars[:3], checkpoint=self.checkpoint))
+        self.assertEqual([(r.username, r.error) for r in results], [('user1', None)])
+        self.assertEqual(len(self.requests('POST')), 1)
+
+    def test_truncated_checkpoint(self):
+        with open(self.checkpoint, 'w') as f:
+            f.write('user0\nuse')
+        checkpoint = bulk.UploadCheckpoint(self.checkpoint)
+        self.assertIn('user0', checkpoint)
+        self.assertNotIn('use', checkpoint)
+        checkpoint.add('user1')
+        checkpoint.close()
+        self.assertEqual(len(bulk.UploadCheckpoint(self.checkpoint)), 2)
+
+
+class TestModeration(BulkTestCase):
+    def routes(self):
+        def user(request):
+            if request.path.startswith('/admin/users/13'):
+                return (403, {'errors': ['cannot moderate staff']})
+            return {'success': 'OK'}
+        return {'/admin/users/*': user}
+
+    def test_suspend(self):
+        results = bulk.bulk_suspend(self.client, [11, 12, 13, 11], 365, 'Spam', workers=4)
+        self.assertEqual([(r.user_id, r.action) for r in results], [(11, 'suspend'), (12, 'suspend'),
+                                                                   (13, 'suspend')])
+        self.assertEqual(results[0].result, {'success': 'OK'})
+        self.assertIsInstance(results[2].error, DiscourseClientError)
+        requests = self.requests('PUT', '/suspend')
+        self.assertEqual(len(requests), 3)
+        self.assertEqual(requests[0].query['reason'], ['Spam'])
+
+    def test_delete(self):
+        results = bulk.bulk_delete_users(self.client, [11, 12], block_email=True)
+        self.assertTrue(all(r.error is None for r in results))
+        request = self.requests('DELETE')[0]
+        self.assertEqual((request.query['block_email'], request.query['block_ip']), (['true'], ['false']))
+
+    def test_trust_level(self):
+        bulk.bulk_trust_level(self.client, [11, 12], 0)
+        self.assertEqual([r.query['level'] for r in self.requests('PUT', '/trust_level')], [['0'], ['0']])
+
+    def test_dry_run(self):
+        results = bulk.bulk_delete_users(self.client, [11, 12], dry_run=True)
+        self.assertEqual(results, [bulk.ModerationResult(11, 'delete_user', None, None),
+                                   bulk.ModerationResult(12, 'delete_user', None, None)])
+        self.assertEqual(self.server.requests, [])
+
+    def test_rate_limited(self):
+        self.client.rate_limiter = RateLimiter(writes_per_minute=600, burst=2)
+        start = time.time()
+        bulk.bulk_trust_level(self.client, range(5), 1, workers=5)
+        # two from the burst, then one every 0.1s
+        self.assertGreaterEqual(time.time() - start, 0.25)
+
+    def test_rate_limiter_argument(self):
+        start = time.time()
+        bulk.bulk_suspend(self.client, range(5), 1, 'Spam', workers=5,
+                          rate_limiter=RateLimiter(writes_per_minute=600, burst=2))
+        self.assertGreaterEqual(time.time() - start, 0.25)
+
+    def test_rate_limiter_replaces_clients(self):
+        self.client.rate_limiter = mock.Mock()
+        limiter = RateLimiter(writes_per_minute=600, burst=2)
+        with mock.patch.object(limiter, 'acquire', wraps=limiter.acquire) as acquire:
+            bulk.bulk_delete_users(self.client, range(3), rate_limiter=limiter)
+        self.assertEqual(acquire.call_count, 3)
+        self.assertFalse(self.client.rate_limiter.acquire.called)
+
+    def test_default_rate_limiter(self):
+        with mock.patch('pydiscourse.bulk.RateLimiter') as limiter:
+            bulk.bulk_suspend(self.client, range(3), 1, 'Spam')
+        self.assertEqual(limiter.return_value.acquire.call_count, 3)
+
+        self.client.rate_limiter = RateLimiter()
+        with mock.patch('pydiscourse.bulk.RateLimiter') as limiter:
+            bulk.bulk_suspend(self.client, range(3), 1, 'Spam')
+        self.assertFalse(limiter.called)
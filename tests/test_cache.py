@@ -0,0 +1,199 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from pydiscourse import client
+from pydiscourse.cache import ResponseCache, ConditionalCache, MemoryBackend, DiskBackend, cache_key
+from tests.stubserver import StubServer
+
+
+class BackendTests(object):
+    def test_get_set(self):
+        self.backend.set('a', b'1', 10)
+        self.assertEqual(self.backend.get('a'), (10, b'1'))
+        self.assertIsNone(self.backend.get('b'))
+
+    def test_lru_eviction(self):
+        for key in 'abc':
+            self.backend.set(key, b'x', 10)
+        self.backend.get('a')
+        self.backend.set('d', b'x', 10)
+
+        self.assertEqual(sorted(self.backend.keys()), ['a', 'c', 'd'])
+
+    def test_delete(self):
+        self.backend.set('a', b'1', 10)
+        self.backend.delete(['a', 'missing'])
+        self.assertEqual(len(self.backend), 0)
+
+    def test_invalidate(self):
+        for key, resource in (('a', '/users/bob'), ('b', '/users/bob/summary'), ('c', '/users'),
+                              ('d', '/users/bobby'), ('e', None)):
+            self.backend.set(key, b'x', 10, resource)
+        self.backend.invalidate('/users/bob')
+        self.assertEqual(sorted(self.backend.keys()), ['d', 'e'])
+
+
+class TestMemoryBackend(BackendTests, unittest.TestCase):
+    def setUp(self):
+        self.backend = MemoryBackend(maxsize=3)
+
+
+class TestDiskBackend(BackendTests, unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.backend = DiskBackend(os.path.join(self.dir, 'cache.db'), maxsize=3)
+
+    def tearDown(self):
+        self.backend.close()
+        shutil.rmtree(self.dir)
+
+    def test_lru_eviction(self):
+        # the LRU order is kept with timestamps
+        self.backend.set('a', b'x', 10)
+        time.sleep(0.01)
+        self.backend.set('b', b'x', 10)
+        time.sleep(0.01)
+        self.backend.set('c', b'x', 10)
+        time.sleep(0.01)
+        self.backend.get('a')
+        time.sleep(0.01)
+        self.backend.set('d', b'x', 10)
+
+        self.assertEqual(sorted(self.backend.keys()), ['a', 'c', 'd'])
+
+
+class TestResponseCache(unittest.TestCase):
+    def test_ttls(self):
+        cache = ResponseCache(ttl=5, ttls={'/t/*': 1, '/latest.json': 0})
+        self.assertEqual(cache.ttl_for('/t/slug/1.json'), 1)
+        self.assertEqual(cache.ttl_for('/latest.json'), 0)
+        self.assertEqual(cache.ttl_for('/users/bob.json'), 5)
+
+    def test_expiry(self):
+        cache = ResponseCache(ttl=0.05)
+        cache.set('k', '/x.json', {'a': 1})
+        self.assertEqual(cache.get('k'), (True, {'a': 1}))
+        time.sleep(0.06)
+        self.assertEqual(cache.get('k'), (False, None))
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'size': 1})
+
+    def test_returns_copies(self):
+        cache = ResponseCache(ttl=10)
+        cache.set('k', '/x.json', {'a': [1]})
+        cache.get('k')[1]['a'].append(2)
+        self.assertEqual(cache.get('k')[1], {'a': [1]})
+
+    def test_key_ignores_api_key(self):
+        self.assertEqual(cache_key('/x.json', {'b': 1, 'api_key': 'secret'}, 'bob'),
+                         '/x.json?api_username=bob&b=1')
+
+    def test_only_listed_endpoints(self):
+        cache = ResponseCache(ttls={'/categories.json': 10})
+        cache.set('a', '/categories.json', {})
+        cache.set('b', '/admin/site_settings.json', {})
+        self.assertEqual(cache.backend.keys(), ['a'])
+
+    def test_invalidate(self):
+        cache = ResponseCache(ttl=10)
+        for path in ('/users/bob.json', '/users/bobby.json', '/categories.json', '/users/bob/summary.json'):
+            cache.set(path + '?api_username=system', path, {})
+
+        cache.invalidate('/users/bob/preferences/email')
+        self.assertEqual(sorted(cache.backend.keys()), [
+            '/categories.json?api_username=system',
+            '/users/bob/summary.json?api_username=system',
+            '/users/bobby.json?api_username=system',
+        ])
+
+        cache.invalidate('/categories')
+        cache.invalidate('/users/bob')
+        self.assertEqual(cache.backend.keys(), ['/users/bobby.json?api_username=system'])
+
+
+class TestClientCache(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer({
+            '/categories.json': {'category_list': {'categories': []}},
+            '/categories': {'category': {'id': 9, 'name': 'new', 'slug': 'new'}},
+            '/users/bob.json': {'user': {'username': 'bob'}},
+        }).start()
+        self.cache = ResponseCache(ttls={'/categories.json': 10, '/users/*': 10})
+        self.client = client.DiscourseClient(self.server.url, 'testuser', 'testkey', cache=self.cache)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def test_cached_reads(self):
+        self.client.categories()
+        self.client.categories()
+        self.client.user('bob')
+
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.cache.stats(), {'hits': 1, 'misses': 2, 'size': 2})
+
+    def test_write_invalidates(self):
+        self.client.categories()
+        self.client.create_category('new', 'FFFFFF')
+        self.client.categories()
+
+        self.assertEqual([r.verb for r in self.server.requests], ['GET', 'POST', 'GET'])
+
+    def test_per_user(self):
+        self.client.user('bob')
+        self.client._get('/users/bob.json', api_username='bob')
+        self.assertEqual(len(self.server.requests), 2)
+
+
+class TestConditionalGet(unittest.TestCase):
+    def setUp(self):
+        self.version = 1
+
+        def latest(request):
+            etag = '"v{0}"'.format(self.version)
+            if request.headers.get('If-None-Match') == etag:
+                return (304, {'ETag': etag}, b'')
+            return (200, {'ETag': etag}, {'topic_list': {'topics': [{'id': self.version}]}})
+
+        def modified(request):
+            stamp = 'Wed, 21 Oct 2015 07:28:00 GMT'
+            if request.headers.get('If-Modified-Since') == stamp:
+                return (304, {}, b'')
+            return (200, {'Last-Modified': stamp}, {'category_list': {'categories': []}})
+
+        self.server = StubServer({
+            '/latest.json': latest,
+            '/categories.json': modified,
+            '/users/bob.json': {'user': {}},
+        }).start()
+        self.conditional = ConditionalCache()
+        self.client = client.DiscourseClient(self.server.url, 'testuser', 'testkey', conditional=self.conditional)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def test_etag(self):
+        first = self.client.latest_topics()
+        second = self.client.latest_topics()
+        self.assertEqual(first, second)
+        self.assertEqual(self.conditional.revalidated, 1)
+        self.assertEqual(self.server.requests[1].headers['If-None-Match'], '"v1"')
+
+        self.version = 2
+        self.assertEqual(self.client.latest_topics()['topic_list']['topics'], [{'id': 2}])
+        self.assertEqual(self.conditional.revalidated, 1)
+
+    def test_last_modified(self):
+        self.client.categories()
+        self.client.categories()
+        self.assertEqual(self.conditional.revalidated, 1)
+
+    def test_no_validators(self):
+        self.client.user('bob')
+        self.client.user('bob')
+        self.assertNotIn('If-None-Match', self.server.requests[1].headers)
+        self.assertEqual(len(self.conditional.backend), 0)
@@ -0,0 +1,123 @@
+import unittest
+
+from pydiscourse import client
+from pydiscourse.cache import ResponseCache
+from pydiscourse.categories import CategoryIndex
+from pydiscourse.exceptions import DiscourseClientError
+from tests.stubserver import StubServer
+
+
+CATEGORIES = [
+    {'id': 1, 'name': 'General', 'slug': 'general', 'subcategory_list': [
+        {'id': 3, 'name': 'Help', 'slug': 'help', 'parent_category_id': 1},
+    ]},
+    {'id': 2, 'name': 'Staff Only', 'slug': 'staff', 'subcategory_list': [
+        {'id': 4, 'name': 'Help', 'slug': 'staff-help'},
+    ]},
+]
+
+
+class TestCategoryIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = CategoryIndex(CATEGORIES)
+
+    def test_by_id(self):
+        self.assertEqual(self.index.get(3)['name'], 'Help')
+        self.assertEqual(len(self.index), 4)
+
+    def test_by_name_or_slug(self):
+        self.assertEqual(self.index.find('General')['id'], 1)
+        self.assertEqual(self.index.find('staff only')['id'], 2)
+        self.assertEqual(self.index.find('staff')['id'], 2)
+        self.assertIsNone(self.index.find('missing'))
+
+    def test_nested(self):
+        # ambiguous without a parent
+        self.assertIsNone(self.index.find('Help'))
+        self.assertEqual(self.index.find('Help', parent='General')['id'], 3)
+        self.assertEqual(self.index.find('help', parent=2)['id'], 4)
+        self.assertEqual(self.index.get(4)['parent_category_id'], 2)
+
+    def test_add_replaces(self):
+        self.index.add({'id': 1, 'name': 'Renamed', 'slug': 'renamed'})
+        self.assertIsNone(self.index.find('General'))
+        self.assertEqual(self.index.find('renamed')['id'], 1)
+
+
+class TestClientCategoryIndex(unittest.TestCase):
+    def setUp(self):
+        self.next_id = 10
+        self.categories = [dict(c) for c in CATEGORIES]
+
+        def create(request):
+            self.next_id += 1
+            name = request.query['name'][0]
+            category = {'id': self.next_id, 'name': name, 'slug': name.lower()}
+            if 'parent_category_id' in request.query:
+                category['parent_category_id'] = int(request.query['parent_category_id'][0])
+            self.categories.append(category)
+            return {'category': category}
+
+        self.server = StubServer({
+            '/categories.json': lambda request: {'category_list': {'categories': self.categories}},
+            '/categories': create,
+            '/category/general/help.json': {'category': {'id': 3}},
+            '/category/general/faq.json': {'category': {'id': 21}},
+        }).start()
+        self.client = client.DiscourseClient(self.server.url, 'testuser', 'testkey')
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def paths(self):
+        return [r.path for r in self.server.requests]
+
+    def test_create_category_fetches_index_once(self):
+        for n in range(5):
+            self.client.create_category('Child{0}'.format(n), 'FFFFFF', parent='General')
+
+        self.assertEqual(self.paths().count('/categories.json'), 1)
+        self.assertEqual(self.server.requests[-1].query['parent_category_id'], ['1'])
+
+    def test_created_categories_are_indexed(self):
+        self.client.create_category('Child', 'FFFFFF', parent='General')
+        self.client.create_category('Parent', 'FFFFFF')
+        self.client.create_category('Grandchild', 'FFFFFF', parent='Parent')
+
+        self.assertEqual(self.paths(), ['/categories.json', '/categories', '/categories', '/categories'])
+        self.assertEqual(self.server.requests[-1].query['parent_category_id'], ['12'])
+
+    def test_missing_parent(self):
+        with self.assertRaises(DiscourseClientError):
+            self.client.create_category('Child', 'FFFFFF', parent='Nope')
+        self.assertEqual(self.paths(), ['/categories.json'])
+
+    def test_reload_for_categories_created_elsewhere(self):
+        self.client.create_category('Child', 'FFFFFF', parent='General')
+        self.categories.append({'id': 20, 'name': 'Other', 'slug': 'other'})
+
+        self.client.create_category('Grandchild', 'FFFFFF', parent='Other')
+        self.assertEqual(self.paths(), ['/categories.json', '/categories', '/categories.json', '/categories'])
+        self.assertEqual(self.server.requests[-1].query['parent_category_id'], ['20'])
+
+        with self.assertRaises(DiscourseClientError):
+            self.client.create_category('Child', 'FFFFFF', parent='Nope')
+        self.assertEqual(self.paths().count('/categories.json'), 3)
+
+    def test_category_miss_doesnt_reload(self):
+        for n in range(3):
+            self.assertEqual(self.client.category('faq', parent='general'), {'category': {'id': 21}})
+        self.assertEqual(self.paths(), ['/categories.json'] + ['/category/general/faq.json'] * 3)
+
+    def test_reload_skips_cache(self):
+        self.client.cache = ResponseCache(ttls={'/categories.json': 300})
+        self.client.category('Help', parent='General')
+        self.categories.append({'id': 20, 'name': 'Other', 'slug': 'other'})
+
+        self.client.create_category('Grandchild', 'FFFFFF', parent='Other')
+        self.assertEqual(self.paths().count('/categories.json'), 2)
+        self.assertEqual(self.server.requests[-1].query['parent_category_id'], ['20'])
+
+    def test_category_by_name(self):
+        self.assertEqual(self.client.category('Help', parent='General'), {'category': {'id': 3}})
@@ -1,12 +1,36 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+import os
+import tempfile
+import threading
+import time
 import unittest
 import mock
 
-from pydiscourse import client
+import requests
+from requests.adapters import HTTPAdapter
+
+from pydiscourse import client, jsonlib
+from pydiscourse.cache import ConditionalCache
+from pydiscourse.exceptions import DiscourseClientError, DiscourseServerError
+from pydiscourse.metrics import MetricsCollector
+from tests.stubserver import StubServer
+
+
+RESPONSE = {
+    'user': {'username': 'someuser'},
+    'challenge': 'abc',
+    'value': 'xyz',
+    'topic_list': {'topics': [{'id': 22}]},
+    'category_list': {'categories': [{'id': 7, 'name': 'parent'}]},
+}
 
 
 def prepare_response(request):
     # we need to mocked response to look a little more real
-    request.return_value = mock.MagicMock(headers={'content-type': 'application/json; charset=utf-8'})
+    request.return_value = mock.MagicMock(headers={'content-type': 'application/json; charset=utf-8'},
+                                          content=json.dumps(RESPONSE).encode('utf-8'))
 
 
 class ClientBaseTestCase(unittest.TestCase):
@@ -31,7 +55,7 @@ class ClientBaseTestCase(unittest.TestCase):
         self.assertEqual(kwargs, params)
 
 
-@mock.patch('requests.request')
+@mock.patch('requests.Session.request')
 class TestUser(ClientBaseTestCase):
 
     def test_user(self, request):
@@ -61,8 +85,33 @@ class TestUser(ClientBaseTestCase):
         self.client.update_username('someuser', 'newname')
         self.assertRequestCalled(request, 'PUT', '/users/someuser/preferences/username', username='newname')
 
+    def assertAvatarSent(self, request, filename, content):
+        body = request.call_args[1]['data']
+        data = b''.join(body)
+        self.assertEqual(len(body), len(data))
+        self.assertIn('filename="{0}"'.format(filename).encode('ascii'), data)
+        self.assertIn(b'\r\n\r\n' + content + b'\r\n--', data)
+
+    def test_update_avatar_image_path(self, request):
+        prepare_response(request)
+        fd, path = tempfile.mkstemp(suffix='.png')
+        try:
+            os.write(fd, b'\x89PNG')
+            os.close(fd)
+            self.client.update_avatar_image('someuser', path)
+            self.assertAvatarSent(request, os.path.basename(path), b'\x89PNG')
+        finally:
+            os.remove(path)
+
+    def test_update_avatar_image_file(self, request):
+        prepare_response(request)
+        img = io.BytesIO(b'skip\x89PNG')
+        img.seek(4)
+        self.client.update_avatar_image('someuser', img)
+        self.assertAvatarSent(request, 'file', b'\x89PNG')
 
-@mock.patch('requests.request')
+
+@mock.patch('requests.Session.request')
 class TestTopics(ClientBaseTestCase):
 
     def test_hot_topics(self, request):
@@ -89,7 +138,7 @@ class TestTopics(ClientBaseTestCase):
         prepare_response(request)
         r = self.client.topics_by('someuser')
         self.assertRequestCalled(request, 'GET', '/topics/created-by/someuser.json')
-        self.assertEqual(r, request().json()['topic_list']['topics'])
+        self.assertEqual(r, RESPONSE['topic_list']['topics'])
 
     def invite_user_to_topic(self, request):
         prepare_response(request)
@@ -98,7 +147,7 @@ class TestTopics(ClientBaseTestCase):
         self.assertRequestCalled(request, 'POST', '/t/22/invite.json', email=email, topic_id=22)
 
 
-@mock.patch('requests.request')
+@mock.patch('requests.Session.request')
 class MiscellaneousTests(ClientBaseTestCase):
 
     def test_search(self, request):
@@ -110,9 +159,380 @@ class MiscellaneousTests(ClientBaseTestCase):
         prepare_response(request)
         r = self.client.categories()
         self.assertRequestCalled(request, 'GET', '/categories.json')
-        self.assertEqual(r, request().json()['category_list']['categories'])
+        self.assertEqual(r, RESPONSE['category_list']['categories'])
         
     def test_users(self, request):
         prepare_response(request)
         r = self.client.users()
         self.assertRequestCalled(request, 'GET', '/admin/users/list/active.json')
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer({'/latest.json': {'topic_list': {'topics': []}}}).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_connections_are_reused(self):
+        with client.DiscourseClient(self.server.url, 'testuser', 'testkey') as c:
+            for _ in range(10):
+                c.latest_topics()
+
+        self.assertEqual(len(self.server.requests), 10)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_keep_alive_disabled(self):
+        with client.DiscourseClient(self.server.url, 'testuser', 'testkey', keep_alive=False) as c:
+            for _ in range(3):
+                c.latest_topics()
+
+        self.assertEqual(self.server.connections, 3)
+
+    def test_custom_session_left_open(self):
+        session = mock.MagicMock(wraps=requests.Session())
+        session.headers = {}
+        with client.DiscourseClient(self.server.url, 'testuser', 'testkey', session=session) as c:
+            c.latest_topics()
+
+        self.assertTrue(session.request.called)
+        self.assertFalse(session.close.called)
+
+    def test_custom_session_not_modified(self):
+        session = requests.Session()
+        headers, adapters = dict(session.headers), dict(session.adapters)
+        with client.DiscourseClient(self.server.url, 'testuser', 'testkey', session=session,
+                                    keep_alive=False) as c:
+            c.latest_topics()
+            c.latest_topics()
+
+        self.assertEqual(self.server.connections, 2)
+        self.assertEqual((dict(session.headers), session.adapters), (headers, adapters))
+        self.assertRaises(ValueError, client.DiscourseClient, self.server.url, 'testuser', 'testkey',
+                          session=session, adapter=HTTPAdapter())
+        session.close()
+
+    def test_custom_adapter(self):
+        adapter = HTTPAdapter(pool_maxsize=1)
+        c = client.DiscourseClient(self.server.url, 'testuser', 'testkey', adapter=adapter)
+        self.assertIs(c.session.get_adapter(self.server.url), adapter)
+        c.close()
+
+
+class TestAuth(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer({'/latest.json': {'topic_list': {'topics': []}}}).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_query(self):
+        with client.DiscourseClient(self.server.url, 'testuser', 'testkey') as c:
+            c.latest_topics(page=2)
+
+        request = self.server.requests[0]
+        self.assertEqual(request.query, {'api_key': ['testkey'], 'api_username': ['testuser'], 'page': ['2']})
+        self.assertNotIn('Api-Key', request.headers)
+
+    def test_header(self):
+        with client.DiscourseClient(self.server.url, 'testuser', 'testkey', auth='header') as c:
+            c.latest_topics(page=2)
+            c.latest_topics(api_username='other')
+
+        first, second = self.server.requests
+        self.assertEqual(first.query, {'page': ['2']})
+        self.assertEqual((first.headers['Api-Key'], first.headers['Api-Username']), ('testkey', 'testuser'))
+        self.assertEqual(second.query, {})
+        self.assertEqual(second.headers['Api-Username'], 'other')
+
+    def test_header_with_conditional(self):
+        with client.DiscourseClient(self.server.url, 'testuser', 'testkey', auth='header',
+                                    conditional=ConditionalCache()) as c:
+            c.latest_topics()
+
+        self.assertEqual(self.server.requests[0].headers['Api-Key'], 'testkey')
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, client.DiscourseClient, self.server.url, 'testuser', 'testkey', auth='cookie')
+
+
+class TestThreadSafety(unittest.TestCase):
+    THREADS = 16
+    CALLS = 25
+
+    def setUp(self):
+        def user(request):
+            username = request.path[len('/users/'):-len('.json')]
+            return {'user': {'username': username, 'acting': request.query['api_username'][0]}}
+
+        self.server = StubServer({'/users/*.json': user}, delay=0.001).start()
+        self.client = client.DiscourseClient(self.server.url, 'testuser', 'testkey', pool_maxsize=self.THREADS)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def test_params_not_mutated(self):
+        params = {'term': 'needle'}
+        self.client._request('GET', '/users/bob.json', params)
+        self.assertEqual(params, {'term': 'needle'})
+
+    def test_shared_client(self):
+        metrics = MetricsCollector()
+        self.client.after_request.append(metrics)
+        errors = []
+
+        def worker(n):
+            try:
+                for i in range(self.CALLS):
+                    username = 'user{0}x{1}'.format(n, i)
+                    params = {'api_username': 'admin{0}'.format(n)} if i % 2 else {}
+                    result = self.client._request('GET', '/users/{0}.json'.format(username), params)
+                    self.assertEqual(result['user']['username'], username)
+                    self.assertEqual(result['user']['acting'], params.get('api_username', 'testuser'))
+                    self.assertNotIn('api_key', params)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        total = self.THREADS * self.CALLS
+        self.assertEqual(len(self.server.requests), total)
+        self.assertTrue(all(r.query['api_key'] == ['testkey'] for r in self.server.requests))
+        self.assertEqual(metrics.snapshot()['GET /users/{username}.json']['count'], total)
+        self.assertLessEqual(self.server.connections, self.THREADS)
+
+
+def topic_pages(request):
+    page = int(request.query.get('page', ['0'])[0])
+    topics = [{'id': page * 2 + i} for i in range(2)]
+    topic_list = {'topics': topics}
+    if page < 2:
+        topic_list['more_topics_url'] = '/latest?page={0}'.format(page + 1)
+    return {'topic_list': topic_list}
+
+
+def user_pages(request):
+    page = int(request.query['page'][0])
+    return [{'id': page}] if page <= 3 else []
+
+
+class TestPagination(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer({
+            '/latest.json': topic_pages,
+            '/admin/users/list/active.json': user_pages,
+        }).start()
+        self.client = client.DiscourseClient(self.server.url, 'testuser', 'testkey')
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def test_iter_latest_topics(self):
+        topics = self.client.iter_latest_topics()
+        self.assertEqual(next(topics), {'id': 0})
+        # pages are only fetched as they are needed
+        self.assertEqual(len(self.server.requests), 1)
+
+        self.assertEqual([t['id'] for t in topics], [1, 2, 3, 4, 5])
+        self.assertEqual([r.query.get('page') for r in self.server.requests], [None, ['1'], ['2']])
+
+    def test_iter_latest_topics_prefetch(self):
+        topics = list(self.client.iter_latest_topics(prefetch=True))
+        self.assertEqual([t['id'] for t in topics], [0, 1, 2, 3, 4, 5])
+
+    def test_iter_users(self):
+        users = list(self.client.iter_users())
+        self.assertEqual(users, [{'id': 1}, {'id': 2}, {'id': 3}])
+        self.assertEqual(len(self.server.requests), 4)
+
+
+class TestTopicStream(unittest.TestCase):
+    stream = list(range(1000, 1105))
+    deleted = 1050
+
+    def setUp(self):
+        def topic(request):
+            posts = [{'id': i} for i in self.stream[:20]]
+            return {'post_stream': {'stream': self.stream, 'posts': posts}}
+
+        def posts(request):
+            ids = [int(i) for i in request.query['post_ids[]']]
+            # the server does not promise to keep the requested order
+            return {'post_stream': {'posts': [{'id': i} for i in reversed(ids) if i != self.deleted]}}
+
+        self.server = StubServer({'/t/42.json': topic, '/t/42/posts.json': posts}).start()
+        self.client = client.DiscourseClient(self.server.url, 'testuser', 'testkey')
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def test_fetch_topic_stream(self):
+        posts = list(self.client.fetch_topic_stream(42, chunk_size=10, workers=3))
+
+        expected = [i for i in self.stream if i != self.deleted]
+        self.assertEqual([p['id'] for p in posts], expected)
+
+        chunks = [r.query['post_ids[]'] for r in self.server.requests if 'post_ids[]' in r.query]
+        # the 20 posts sent with the topic are not fetched again
+        self.assertEqual(len(chunks), 9)
+        self.assertTrue(all(len(c) <= 10 for c in chunks))
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        def user(request):
+            username = request.path[len('/users/'):-len('.json')]
+            if username == 'missing':
+                return (404, {'errors': ['not found']})
+            return {'user': {'username': username}}
+
+        self.server = StubServer({'/users/*.json': user, '/t/*': {'post_stream': {}}}, delay=0.1).start()
+        self.client = client.DiscourseClient(self.server.url, 'testuser', 'testkey')
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def test_map(self):
+        names = ['user{0}'.format(i) for i in range(10)]
+        names[3] = 'missing'
+        start = time.time()
+        users = self.client.map('user', names, workers=10)
+
+        self.assertLess(time.time() - start, 0.5)
+        self.assertIsInstance(users[3], DiscourseClientError)
+        self.assertEqual([u['username'] for u in users[:3] + users[4:]], names[:3] + names[4:])
+
+    def test_map_arguments(self):
+        results = self.client.map(self.client.topic, [('welcome', 8), ('faq', 9)], track_visit='true')
+        self.assertEqual(results, [{'post_stream': {}}] * 2)
+        self.assertEqual(sorted(r.path for r in self.server.requests), ['/t/faq/9.json', '/t/welcome/8.json'])
+        self.assertTrue(all(r.query['track_visit'] == ['true'] for r in self.server.requests))
+
+    def test_batch(self):
+        with self.client.batch(workers=4) as batch:
+            user = batch.user('someuser')
+            missing = batch.user('missing')
+            posts = batch.posts(22, [1, 2])
+            self.assertFalse(user.done())
+
+        self.assertEqual(user.result(), {'username': 'someuser'})
+        self.assertIsInstance(missing.exception(), DiscourseClientError)
+        self.assertEqual(batch.results, [{'username': 'someuser'}, missing.exception(), {'post_stream': {}}])
+
+    def test_batch_aborted(self):
+        with self.assertRaises(KeyError):
+            with self.client.batch() as batch:
+                user = batch.user('someuser')
+                raise KeyError()
+
+        self.assertTrue(user.cancelled())
+        self.assertEqual(self.server.requests, [])
+
+    def test_batch_private_methods(self):
+        with self.assertRaises(AttributeError):
+            self.client.batch()._get
+
+
+class TestSiteSettings(unittest.TestCase):
+    def setUp(self):
+        self.settings = {'title': 'Forum', 'login_required': False, 'max_post_length': 32000,
+                         'top_menu': 'latest|new', 'contact_email': ''}
+
+        def listing(request):
+            return {'site_settings': [{'setting': k, 'value': v} for k, v in self.settings.items()]}
+
+        def update(request):
+            name = request.path.rsplit('/', 1)[1]
+            if name == 'max_post_length':
+                return (422, {'errors': ['Value must be between 1 and 65535']})
+            value = request.query[name][0]
+            self.settings[name] = {'true': True, 'false': False}.get(value, value)
+            return {}
+
+        self.server = StubServer({'/admin/site_settings.json': listing, '/admin/site_settings/*': update},
+                                 delay=0.05).start()
+        self.client = client.DiscourseClient(self.server.url, 'testuser', 'testkey')
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def desired(self):
+        return {'title': 'New Forum', 'login_required': True, 'max_post_length': 70000,
+                'top_menu': ['latest', 'top'], 'contact email': 'admin@example.com'}
+
+    def test_sync(self):
+        start = time.time()
+        report = self.client.sync_site_settings(dict(self.desired(), title='Forum'))
+        # one GET then the four PUTs at once
+        self.assertLess(time.time() - start, 0.2)
+
+        self.assertEqual(report.changed, {'login_required': ('false', 'true'), 'top_menu': ('latest|new', 'latest|top'),
+                                          'contact_email': ('', 'admin@example.com')})
+        self.assertEqual(report.unchanged, ['title'])
+        self.assertEqual(list(report.failed), ['max_post_length'])
+        self.assertIsInstance(report.failed['max_post_length'], DiscourseClientError)
+        self.assertEqual([r.verb for r in self.server.requests], ['GET'] + ['PUT'] * 4)
+
+    def test_site_settings_raises(self):
+        with self.assertRaises(DiscourseClientError):
+            self.client.site_settings(**self.desired())
+        # the other settings were still applied
+        self.assertEqual(self.settings['title'], 'New Forum')
+
+    def test_already_configured(self):
+        self.client.sync_site_settings(self.desired())
+        del self.server.requests[:]
+
+        report = self.client.site_settings(**dict(self.desired(), max_post_length=32000))
+        self.assertEqual(report.changed, {})
+        self.assertEqual(self.server.requests[0].path, '/admin/site_settings.json')
+        self.assertEqual(len(self.server.requests), 1)
+
+
+@mock.patch('requests.Session.request')
+class TestResponseHandling(ClientBaseTestCase):
+    @unittest.skipIf(not hasattr(unittest.TestCase, 'assertLogs'), 'assertLogs needs Python 3.4')
+    def test_debug_log_preview(self, request):
+        prepare_response(request)
+        self.client.log_body_size = 10
+        with self.assertLogs('pydiscourse.client', 'DEBUG') as logs:
+            self.client.latest_topics()
+
+        size = len(request.return_value.content)
+        self.assertEqual(logs.output, ["DEBUG:pydiscourse.client:response {0}: '{1}'... ({2} bytes)".format(
+            request.return_value.status_code, json.dumps(RESPONSE)[:10], size)])
+
+    def test_empty_html(self, request):
+        request.return_value = mock.MagicMock(headers={'content-type': 'text/html'}, content=b' ')
+        self.assertIsNone(self.client.update_email('someuser', 'test@example.com'))
+
+    def test_error_messages(self, request):
+        request.return_value = mock.MagicMock(ok=False, status_code=422, content=b'{"errors": ["a", "b"]}')
+        with self.assertRaises(DiscourseClientError) as cm:
+            self.client.latest_topics()
+        self.assertEqual(cm.exception.args[0], 'a,b')
+
+        request.return_value = mock.MagicMock(ok=False, status_code=500, reason='', content=b'<html>')
+        with self.assertRaises(DiscourseServerError) as cm:
+            self.client.latest_topics()
+        self.assertEqual(cm.exception.args[0], '500: <html>')
+
+
+class TestJsonlib(unittest.TestCase):
+    def test_stdlib_loads(self):
+        self.assertEqual(jsonlib._stdlib_loads(b'{"a": "\\u2603"}'), {'a': u'☃'})
+
+    def test_loads_bytes(self):
+        self.assertEqual(jsonlib.loads(b'[1, 2]'), [1, 2])
+        with self.assertRaises(ValueError):
+            jsonlib.loads(b'{')
@@ -0,0 +1,135 @@
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from pydiscourse import export
+from pydiscourse.models import User
+
+
+USERS = [{'id': i, 'username': u'user{0}'.format(i), 'name': None if i % 2 else u'N\xe4me',
+          'badges': [{'id': i}]} for i in range(5)]
+
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def path(self, name):
+        return os.path.join(self.tmp, name)
+
+    def read_csv(self, path):
+        if bytes is str:  # the py2 csv module reads bytes
+            with open(path, 'rb') as f:
+                return [[v.decode('utf-8') for v in row] for row in csv.reader(f)]
+        with io.open(path, newline='', encoding='utf-8') as f:
+            return list(csv.reader(f))
+
+    def test_csv(self):
+        path = self.path('users.csv')
+        columns = ['id', 'username', 'name', 'badges']
+        self.assertEqual(export.export(iter(USERS), path, columns=columns), 5)
+        rows = self.read_csv(path)
+        self.assertEqual(rows[0], ['id', 'username', 'name', 'badges'])
+        self.assertEqual(rows[1], ['0', 'user0', u'N\xe4me', '[{"id":0}]'])
+        self.assertEqual(rows[2], ['1', 'user1', '', '[{"id":1}]'])
+        self.assertEqual(len(rows), 6)
+
+    def test_jsonl(self):
+        path = self.path('users.jsonl')
+        self.assertEqual(export.export(USERS, path, chunk_size=3), 5)
+        with io.open(path, encoding='utf-8') as f:
+            self.assertEqual([json.loads(line) for line in f], USERS)
+
+    def test_columns(self):
+        path = self.path('users.csv')
+        export.export(USERS, path, columns=['username', 'missing'])
+        self.assertEqual(self.read_csv(path)[:2], [['username', 'missing'], ['user0', '']])
+
+    def test_models(self):
+        path = self.path('users.csv')
+        export.export(User.many(USERS), path, columns=['id', 'badges'])
+        self.assertEqual(self.read_csv(path)[1], ['0', '[{"id":0}]'])
+
+        export.export(User.many(USERS), path)
+        self.assertEqual(self.read_csv(path)[0], list(User._fields))
+
+    def test_column_buffer(self):
+        buffer = export.ColumnBuffer(['id', 'score', 'name', 'big'])
+        for item in [{'id': 1, 'score': 1, 'name': None, 'big': 1}, {'id': 2, 'score': 0.5, 'name': u'x', 'big': 2 ** 70}]:
+            buffer.append(item)
+        ids, scores, names, bigs = buffer.take()
+        self.assertEqual((ids.typecode, list(ids)), (export._INT64, [1, 2]))
+        self.assertEqual((scores.typecode, list(scores)), ('d', [1.0, 0.5]))
+        self.assertEqual(names, [None, u'x'])
+        self.assertEqual(bigs, [1, 2 ** 70])
+        self.assertEqual(len(buffer), 0)
+
+    def test_empty(self):
+        path = self.path('users.csv')
+        self.assertEqual(export.export([], path, columns=['id']), 0)
+        self.assertEqual(self.read_csv(path), [['id']])
+
+    def test_format(self):
+        self.assertRaises(ValueError, export.export, USERS, self.path('users.xml'))
+        export.export(USERS, self.path('users.txt'), format='csv')
+        self.assertEqual(len(self.read_csv(self.path('users.txt'))), 6)
+
+    @unittest.skipIf(export.pyarrow is None, 'pyarrow is not installed')
+    def test_parquet(self):
+        import pyarrow.parquet
+        path = self.path('users.parquet')
+        self.assertEqual(export.export(USERS, path, chunk_size=2), 5)
+        table = pyarrow.parquet.read_table(path)
+        self.assertEqual(table.column('id').to_pylist(), [0, 1, 2, 3, 4])
+        self.assertEqual(table.column('name').to_pylist(), [u'N\xe4me', None, u'N\xe4me', None, u'N\xe4me'])
+
+    @unittest.skipIf(export.pyarrow is None, 'pyarrow is not installed')
+    def test_arrow(self):
+        import pyarrow.ipc
+        path = self.path('users.arrow')
+        export.export(USERS, path, chunk_size=2)
+        table = pyarrow.ipc.open_file(path).read_all()
+        self.assertEqual(table.column('username').to_pylist(), [u'user{0}'.format(i) for i in range(5)])
+
+    @unittest.skipIf(export.pyarrow is None, 'pyarrow is not installed')
+    def test_types_drift_across_chunks(self):
+        import pyarrow.ipc
+        import pyarrow.parquet
+        items = [{'score': 1, 'title': None}] * 3 + [{'score': 0.5, 'title': None}, {'score': None, 'title': u'x'}]
+        for name, read in (('p.arrow', lambda p: pyarrow.ipc.open_file(p).read_all()),
+                           ('p.parquet', pyarrow.parquet.read_table)):
+            path = self.path(name)
+            self.assertEqual(export.export(items, path, chunk_size=3), 5)
+            table = read(path)
+            self.assertEqual(table.column('score').to_pylist(), [1.0, 1.0, 1.0, 0.5, None])
+            self.assertEqual(str(table.schema.field('score').type), 'double')
+            self.assertEqual(table.column('title').to_pylist(), [None, None, None, None, u'x'])
+            self.assertFalse(os.path.exists(path + '.narrow'))
+
+    @unittest.skipIf(export.pyarrow is None, 'pyarrow is not installed')
+    def test_type_conflict(self):
+        items = [{'id': 1}, {'id': 2}, {'id': u'three'}]
+        with self.assertRaises(ValueError):
+            export.export(items, self.path('users.parquet'), chunk_size=2)
+
+    @unittest.skipIf(export.pyarrow is None, 'pyarrow is not installed')
+    def test_schema(self):
+        import pyarrow
+        import pyarrow.parquet
+        schema = pyarrow.schema([('id', pyarrow.int32()), ('score', pyarrow.float32())])
+        path = self.path('users.parquet')
+        export.export([{'id': 1, 'score': 1}, {'id': 2, 'score': None}], path, schema=schema)
+        table = pyarrow.parquet.read_table(path)
+        self.assertTrue(table.schema.equals(schema))
+        self.assertEqual(table.column('score').to_pylist(), [1.0, None])
+
+        with self.assertRaises(pyarrow.ArrowInvalid):
+            export.export([{'id': 1, 'score': 1}, {'id': 2.5, 'score': None}], path, schema=schema, chunk_size=1)
+        self.assertRaises(ValueError, export.export, USERS, self.path('users.csv'), schema=schema)
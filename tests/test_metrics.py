@@ -0,0 +1,126 @@
+import unittest
+
+from pydiscourse import client
+from pydiscourse.cache import ResponseCache
+from pydiscourse.exceptions import DiscourseClientError
+from pydiscourse.metrics import Histogram, MetricsCollector, RequestEvent, log_buckets, template
+from pydiscourse.ratelimit import RetryPolicy
+from tests.stubserver import StubServer
+
+
+class TestTemplate(unittest.TestCase):
+    def test_paths(self):
+        for path, expected in [
+            ('/t/some-slug/22.json', '/t/{slug}/{id}.json'),
+            ('/t/22/posts.json', '/t/{id}/posts.json'),
+            ('/users/bob.json', '/users/{username}.json'),
+            ('/users/bob/preferences/avatar', '/users/{username}/preferences/avatar'),
+            ('/users/hp.json', '/users/hp.json'),
+            ('/users', '/users'),
+            ('/admin/users/12/suspend', '/admin/users/{id}/suspend'),
+            ('/admin/users/list/active.json', '/admin/users/list/{filter}.json'),
+            ('/admin/site_settings/title', '/admin/site_settings/{setting}'),
+            ('/topics/created-by/bob.json', '/topics/created-by/{username}.json'),
+            ('/category/parent/child.json', '/category/{name}.json'),
+            ('/posts/12', '/posts/{id}'),
+            ('/latest.json', '/latest.json'),
+        ]:
+            self.assertEqual(template(path), expected)
+
+
+class TestHistogram(unittest.TestCase):
+    def test_percentiles(self):
+        histogram = Histogram(log_buckets(factor=1.05))
+        for ms in range(1, 1001):
+            histogram.observe(ms / 1000.0)
+
+        self.assertAlmostEqual(histogram.percentile(50), 0.5, delta=0.025)
+        self.assertAlmostEqual(histogram.percentile(95), 0.95, delta=0.05)
+        self.assertAlmostEqual(histogram.percentile(99), 0.99, delta=0.05)
+        self.assertIsNone(Histogram([1]).percentile(50))
+
+    def test_collector(self):
+        metrics = MetricsCollector(buckets=[0.1, 1])
+        for total in (0.05, 0.5, 2):
+            event = RequestEvent('GET', '/t/1/posts.json')
+            event.total = total
+            event.bytes = 10
+            metrics(event)
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(list(snapshot), ['GET /t/{id}/posts.json'])
+        self.assertEqual(snapshot['GET /t/{id}/posts.json']['count'], 3)
+        self.assertEqual(snapshot['GET /t/{id}/posts.json']['bytes'], 30)
+
+        text = metrics.to_prometheus()
+        self.assertIn('pydiscourse_request_duration_seconds_bucket{verb="GET",path="/t/{id}/posts.json",le="0.1"} 1', text)
+        self.assertIn('pydiscourse_request_duration_seconds_bucket{verb="GET",path="/t/{id}/posts.json",le="1"} 2', text)
+        self.assertIn('pydiscourse_request_duration_seconds_count{verb="GET",path="/t/{id}/posts.json"} 3', text)
+
+
+class TestClientHooks(unittest.TestCase):
+    def setUp(self):
+        self.failures = []
+
+        def latest(request):
+            if self.failures:
+                return self.failures.pop(0)
+            return {'topic_list': {'topics': []}}
+
+        self.server = StubServer({'/latest.json': latest, '/t/1/posts.json': {'post_stream': {}}}).start()
+        self.client = client.DiscourseClient(self.server.url, 'testuser', 'testkey')
+        self.events = []
+        self.client.after_request.append(self.events.append)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def test_events(self):
+        before = []
+        self.client.before_request.append(lambda *args: before.append(args))
+        self.client.posts(1)
+        self.client.posts(1)
+
+        self.assertEqual(before[0][:2], ('GET', '/t/1/posts.json'))
+        first, second = self.events
+        self.assertEqual(first.endpoint, 'GET /t/{id}/posts.json')
+        self.assertEqual(first.status, 200)
+        self.assertEqual(first.bytes, len(b'{"post_stream": {}}'))
+        self.assertGreater(first.connect, 0)
+        # the second request reuses the pooled connection
+        self.assertEqual(second.connect, 0)
+        for event in self.events:
+            self.assertGreater(event.server, 0)
+            self.assertGreaterEqual(event.decode, 0)
+            self.assertGreaterEqual(event.total, event.connect + event.server + event.transfer + event.decode)
+
+    def test_retries_and_errors(self):
+        self.client.retry = RetryPolicy(backoff=0.01)
+        self.failures = [(503, {'errors': ['down']}), (404, {'errors': ['gone']})]
+        with self.assertRaises(DiscourseClientError):
+            self.client.latest_topics()
+
+        event = self.events[0]
+        self.assertEqual((event.status, event.retries), (404, 1))
+        self.assertIsInstance(event.error, DiscourseClientError)
+
+    def test_cache_hits(self):
+        self.client.cache = ResponseCache(ttls={'/latest.json': 10})
+        self.client.latest_topics()
+        self.client.latest_topics()
+        self.assertEqual([e.status for e in self.events], [200, None])
+
+    def test_streams(self):
+        collector = MetricsCollector()
+        self.client.after_request.append(collector)
+        self.assertEqual(list(self.client.stream_latest_topics()), [])
+        self.failures = [(404, {'errors': ['gone']})]
+        with self.assertRaises(DiscourseClientError):
+            list(self.client.stream_latest_topics())
+
+        ok, failed = self.events
+        self.assertEqual((ok.endpoint, ok.status, ok.bytes, ok.error), ('GET /latest.json', 200, None, None))
+        self.assertGreater(ok.server, 0)
+        self.assertIsInstance(failed.error, DiscourseClientError)
+        self.assertEqual(sum(s['count'] for s in collector.snapshot().values()), 2)
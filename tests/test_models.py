@@ -0,0 +1,116 @@
+import pickle
+import unittest
+
+from pydiscourse import client
+from pydiscourse.models import Post, Topic, User
+from tests.stubserver import StubServer
+
+
+POST = {
+    'id': 101, 'topic_id': 7, 'post_number': 1, 'username': 'sam', 'cooked': '<p>hi</p>',
+    'actions_summary': [{'id': 2, 'count': 3}], 'reply_to_user': {'username': 'bob'},
+    'user_title': None,
+}
+
+
+class TestModel(unittest.TestCase):
+    def test_fields(self):
+        post = Post(POST)
+        self.assertEqual(post.id, 101)
+        self.assertEqual(post.username, 'sam')
+        self.assertEqual(post.actions_summary, [{'id': 2, 'count': 3}])
+        self.assertIsNone(post.user_title)
+        self.assertRaises(AttributeError, getattr, post, 'raw')
+        self.assertRaises(AttributeError, getattr, post, 'missing')
+
+    def test_missing_slotted_fields(self):
+        user = User({'id': 1, 'email': None})
+        self.assertNotIn('username', user)
+        self.assertEqual(user.get('username', 'default'), 'default')
+        self.assertRaises(KeyError, lambda: user['username'])
+        self.assertIn('email', user)
+        self.assertIsNone(user.get('email', 'default'))
+        self.assertEqual(user.to_dict(), {'id': 1, 'email': None})
+        self.assertEqual(pickle.loads(pickle.dumps(user)).to_dict(), {'id': 1, 'email': None})
+        self.assertEqual(repr(User({})), '<User None None>')
+
+    def test_dict_access(self):
+        post = Post(POST)
+        self.assertEqual(post['reply_to_user'], {'username': 'bob'})
+        self.assertEqual(post.get('missing', 'default'), 'default')
+        self.assertRaises(KeyError, lambda: post['missing'])
+        self.assertIn('cooked', post)
+        self.assertNotIn('missing', post)
+
+    def test_to_dict(self):
+        self.assertEqual(Post(POST).to_dict(), POST)
+        self.assertEqual(Post(POST), Post(POST))
+        self.assertNotEqual(Post(POST), Post(dict(POST, id=102)))
+
+    def test_nested_slot_value_is_packed(self):
+        topic = Topic({'id': 1, 'title': {'unexpected': True}})
+        self.assertEqual(topic.title, {'unexpected': True})
+
+    def test_packed_fields_are_copies(self):
+        post = Post(POST)
+        post.actions_summary.append({'id': 5})
+        self.assertEqual(len(post.actions_summary), 1)
+
+    def test_pickle(self):
+        post = pickle.loads(pickle.dumps(Post(POST)))
+        self.assertEqual(post, Post(POST))
+        self.assertEqual(post.reply_to_user, {'username': 'bob'})
+
+    def test_no_instance_dict(self):
+        self.assertFalse(hasattr(User({'id': 1}), '__dict__'))
+
+    def test_many(self):
+        users = User.many([{'id': 1, 'username': 'a'}, {'id': 2, 'username': 'b'}])
+        self.assertEqual([u.username for u in users], ['a', 'b'])
+        self.assertEqual(repr(users[0]), '<User 1 a>')
+
+
+class TestClientModels(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer({
+            '/users/*.json': {'user': {'id': 1, 'username': 'sam', 'badges': []}},
+            '/admin/users/list/*.json': [{'id': 1, 'username': 'sam'}],
+            '/latest.json': {'topic_list': {'topics': [{'id': 22, 'title': 'hello'}]}},
+            '/categories.json': {'category_list': {'categories': [
+                {'id': 7, 'name': 'Parent', 'slug': 'parent'},
+                {'id': 8, 'name': 'Child', 'slug': 'child', 'parent_category_id': 7}]}},
+            '/category/parent/child.json': {'category': {'id': 8}},
+            '/t/22/posts.json': {'post_stream': {'posts': [{'id': 5, 'username': 'sam'}]}},
+            '/t/hello/22.json': {'id': 22, 'title': 'hello', 'post_stream': {'stream': [5]}},
+            '/search.json': {'posts': [{'id': 5}], 'topics': [{'id': 22}], 'users': [{'id': 1}]},
+        }).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_models(self):
+        with client.DiscourseClient(self.server.url, 'system', 'testkey', models=True) as c:
+            user = c.user('sam')
+            self.assertIsInstance(user, User)
+            self.assertEqual(user.badges, [])
+            self.assertIsInstance(c.users()[0], User)
+            self.assertEqual([t.title for t in c.iter_latest_topics()], ['hello'])
+            self.assertEqual(c.categories()[0].name, 'Parent')
+            # the category index keeps working on dicts
+            self.assertEqual(c.category('Child'), {'category': {'id': 8}})
+
+    def test_every_read(self):
+        with client.DiscourseClient(self.server.url, 'system', 'testkey', models=True) as c:
+            self.assertIsInstance(c.list_users('active')[0], User)
+            self.assertEqual(c.latest_topics()['topic_list']['topics'][0].title, 'hello')
+            self.assertEqual(c.posts(22, [5])['post_stream']['posts'][0].username, 'sam')
+            self.assertIsInstance(c.topic_posts(22)['post_stream']['posts'][0], Post)
+            topic = c.topic('hello', 22)
+            self.assertIsInstance(topic, Topic)
+            self.assertEqual(topic.post_stream, {'stream': [5]})
+            results = c.search('hello')
+            self.assertEqual([type(results[k][0]) for k in ('posts', 'topics', 'users')], [Post, Topic, User])
+
+    def test_dicts_by_default(self):
+        with client.DiscourseClient(self.server.url, 'system', 'testkey') as c:
+            self.assertEqual(c.user('sam'), {'id': 1, 'username': 'sam', 'badges': []})
@@ -0,0 +1,127 @@
+import threading
+import time
+import unittest
+
+import mock
+import requests
+
+from pydiscourse import client
+from pydiscourse.exceptions import DiscourseClientError, DiscourseServerError
+from pydiscourse.ratelimit import TokenBucket, RateLimiter, RetryPolicy, retry_after_seconds
+from tests.stubserver import StubServer
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_then_paced(self):
+        bucket = TokenBucket(rate=50, capacity=5)
+        start = time.time()
+        for _ in range(10):
+            bucket.acquire()
+        elapsed = time.time() - start
+
+        # 5 immediately, then 5 more at 50 per second
+        self.assertGreater(elapsed, 0.08)
+        self.assertLess(elapsed, 0.5)
+
+    def test_shared_between_threads(self):
+        bucket = TokenBucket(rate=100, capacity=1)
+        threads = [threading.Thread(target=lambda: [bucket.acquire() for _ in range(5)]) for _ in range(4)]
+        start = time.time()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertGreater(time.time() - start, 0.18)
+
+    def test_pause(self):
+        bucket = TokenBucket(rate=1000, capacity=10)
+        bucket.pause(0.1)
+        start = time.time()
+        bucket.acquire()
+        self.assertGreater(time.time() - start, 0.09)
+
+    def test_separate_read_write_budgets(self):
+        limiter = RateLimiter(reads_per_minute=60, writes_per_minute=60, burst=1)
+        start = time.time()
+        limiter.acquire('GET')
+        limiter.acquire('POST')
+        self.assertLess(time.time() - start, 0.1)
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def response(self, status, **headers):
+        return mock.Mock(status_code=status, headers=headers)
+
+    def test_retry_after(self):
+        self.assertEqual(retry_after_seconds('5'), 5)
+        self.assertEqual(retry_after_seconds('Wed, 21 Oct 2015 07:28:00 GMT'), 0)
+        self.assertIsNone(retry_after_seconds('soon'))
+        self.assertIsNone(retry_after_seconds(None))
+
+    def test_should_retry(self):
+        policy = RetryPolicy(max_retries=2)
+        self.assertTrue(policy.should_retry('POST', self.response(429), 0))
+        self.assertTrue(policy.should_retry('GET', self.response(503), 1))
+        self.assertFalse(policy.should_retry('POST', self.response(503), 0))
+        self.assertFalse(policy.should_retry('GET', self.response(404), 0))
+        self.assertFalse(policy.should_retry('GET', self.response(429), 2))
+
+    def test_delay(self):
+        policy = RetryPolicy(backoff=1, max_backoff=10)
+        self.assertEqual(policy.delay(self.response(429, **{'Retry-After': '3'}), 0), 3)
+        for attempt in range(8):
+            self.assertLessEqual(policy.delay(self.response(503), attempt), 10)
+
+
+class TestClientRetries(unittest.TestCase):
+    def setUp(self):
+        self.failures = []
+
+        def flaky(request):
+            if self.failures:
+                return self.failures.pop(0)
+            return {'topic_list': {'topics': []}}
+
+        self.server = StubServer({'/latest.json': flaky, '/posts': flaky}).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def make_client(self, **kwargs):
+        c = client.DiscourseClient(self.server.url, 'testuser', 'testkey', **kwargs)
+        self.addCleanup(c.close)
+        return c
+
+    def test_retries_429(self):
+        self.failures = [(429, {'Retry-After': '0.05'}, {'errors': ['slow down']})] * 2
+        c = self.make_client(rate_limiter=RateLimiter(), retry=RetryPolicy(backoff=0.01))
+        c.latest_topics()
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_gives_up(self):
+        self.failures = [(503, {'errors': ['down']})] * 5
+        c = self.make_client(retry=RetryPolicy(max_retries=2, backoff=0.01))
+        with self.assertRaises(DiscourseServerError):
+            c.latest_topics()
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_retried_responses_are_closed(self):
+        self.failures = [(503, {'errors': ['down']})] * 2
+        c = self.make_client(retry=RetryPolicy(backoff=0.01))
+        close = requests.Response.close
+        with mock.patch.object(requests.Response, 'close', autospec=True, side_effect=close) as closed:
+            self.assertEqual(list(c.stream_latest_topics()), [])
+        self.assertEqual(closed.call_count, 3)
+
+    def test_post_not_retried_on_server_error(self):
+        self.failures = [(503, {'errors': ['down']})]
+        c = self.make_client(retry=RetryPolicy(backoff=0.01))
+        with self.assertRaises(DiscourseServerError):
+            c.create_post('hello', topic_id=1)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_no_retry_by_default(self):
+        self.failures = [(429, {'errors': ['slow down']})]
+        with self.assertRaises(DiscourseClientError):
+            self.make_client().latest_topics()
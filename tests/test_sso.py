@@ -1,4 +1,6 @@
 import base64
+import threading
+import time
 
 try:  # py26
     import unittest2 as unittest
@@ -65,7 +67,7 @@ class Test_sso_redirect_url(SSOTestCase):
         sso.sso_validate(payload, params['sig'][0], self.secret)
 
         # check the params have all the data we expect
-        payload = base64.decodestring(payload)
+        payload = base64.b64decode(payload).decode('utf-8')
         payload = unquote(payload)
         payload = dict((p.split('=') for p in payload.split('&')))
 
@@ -76,3 +78,118 @@ class Test_sso_redirect_url(SSOTestCase):
             'name': self.name,
             'email': self.email
         })
+
+
+class TestSSOHandler(SSOTestCase):
+    def setUp(self):
+        super(TestSSOHandler, self).setUp()
+        self.handler = sso.SSOHandler(self.secret)
+
+    def test_parse(self):
+        params = self.handler.parse(self.payload, self.signature)
+        self.assertEqual(params, {'nonce': self.nonce})
+
+    def test_bytes(self):
+        params = self.handler.parse(self.payload.encode('ascii'), self.signature.encode('ascii'))
+        self.assertEqual(params, {'nonce': self.nonce})
+        self.assertEqual(sso.SSOHandler(self.secret.encode('ascii')).sign(unquote(self.payload)), self.signature)
+
+    def test_validate_matches_parse(self):
+        for query in (b'return_sso_url=x%26nonce%3Dwrong&nonce=a+b%2B', b'nonce=first&nonce=last', b'xnonce=1&nonce=2'):
+            payload = base64.b64encode(query).decode('ascii')
+            signature = self.handler.sign(payload)
+            self.assertEqual(self.handler.validate(payload, signature), self.handler.parse(payload, signature)['nonce'])
+
+        payload = base64.b64encode(b'xnonce=1&nonce=').decode('ascii')
+        with self.assertRaises(DiscourseError):
+            self.handler.validate(payload, self.handler.sign(payload))
+
+    def test_invalid(self):
+        with self.assertRaises(DiscourseError):
+            sso.SSOHandler('')
+        with self.assertRaises(DiscourseError):
+            self.handler.parse(self.payload, self.signature[:-1] + u'\xe9')
+
+        payload = base64.b64encode(b'return_sso_url=http%3A%2F%2Fexample.com').decode('ascii')
+        with self.assertRaises(DiscourseError):
+            self.handler.parse(payload, self.handler.sign(payload))
+
+    def test_round_trip(self):
+        url = self.handler.redirect_url(self.nonce, self.email, self.external_id, self.username,
+                                        name=u'S\xe4m', admin='false')
+        params = parse_qs(urlparse(url).query)
+        payload = self.handler.parse(params['sso'][0], params['sig'][0])
+
+        self.assertEqual(payload, {
+            'nonce': self.nonce,
+            'email': self.email,
+            'external_id': self.external_id,
+            'username': self.username,
+            'name': u'S\xe4m',
+            'admin': 'false',
+        })
+
+
+class TestNonceStore(SSOTestCase):
+    def test_replay_rejected(self):
+        handler = sso.SSOHandler(self.secret, nonces=sso.NonceStore())
+        self.assertEqual(handler.validate(self.payload, self.signature), self.nonce)
+        with self.assertRaises(DiscourseError):
+            handler.validate(self.payload, self.signature)
+
+    def test_sso_validate(self):
+        nonces = sso.NonceStore()
+        sso.sso_validate(self.payload, self.signature, self.secret, nonces=nonces)
+        with self.assertRaises(DiscourseError):
+            sso.sso_validate(self.payload, self.signature, self.secret, nonces=nonces)
+        # without a store there is no replay check
+        sso.sso_validate(self.payload, self.signature, self.secret)
+
+    def test_expiry(self):
+        nonces = sso.NonceStore(ttl=0.05)
+        self.assertTrue(nonces.add('a'))
+        self.assertFalse(nonces.add('a'))
+        time.sleep(0.06)
+        self.assertTrue(nonces.add('b'))
+        self.assertEqual(len(nonces), 1)
+        self.assertTrue(nonces.add('a'))
+
+    def test_bounded(self):
+        nonces = sso.NonceStore(maxsize=3)
+        for nonce in 'abcd':
+            self.assertTrue(nonces.add(nonce))
+        self.assertEqual(len(nonces), 3)
+        self.assertFalse(nonces.add('d'))
+        self.assertTrue(nonces.add('a'))
+
+    def test_concurrent(self):
+        nonces = sso.NonceStore()
+        accepted = []
+
+        def login():
+            accepted.extend(n for n in range(1000) if nonces.add(str(n)))
+
+        threads = [threading.Thread(target=login) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(accepted), list(range(1000)))
+
+    def test_redis(self):
+        class FakeRedis(object):
+            def __init__(self):
+                self.data = {}
+
+            def set(self, name, value, ex=None, nx=False):
+                if nx and name in self.data:
+                    return None
+                self.data[name] = (value, ex)
+                return True
+
+        redis = FakeRedis()
+        handler = sso.SSOHandler(self.secret, nonces=sso.RedisNonceStore(redis, ttl=60))
+        handler.validate(self.payload, self.signature)
+        with self.assertRaises(DiscourseError):
+            handler.validate(self.payload, self.signature)
+        self.assertEqual(redis.data, {'pydiscourse:sso:nonce:' + self.nonce: (1, 60)})
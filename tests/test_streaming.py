@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+import json
+import unittest
+
+try:
+    import tracemalloc
+except ImportError:  # py2
+    tracemalloc = None
+
+from pydiscourse import client
+from pydiscourse.exceptions import DiscourseError, DiscourseClientError
+from pydiscourse.streaming import iter_items
+from tests.stubserver import StubServer
+
+
+def chunked(document, size=1):
+    data = json.dumps(document).encode('utf-8')
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class TestIterItems(unittest.TestCase):
+    document = {
+        'users': [{'id': 1}],
+        'primary_groups': [],
+        'topic_list': {
+            'can_create_topic': True,
+            'more_topics_url': '/latest?page=1',
+            'draft': None,
+            'per_page': 30,
+            'topics': [
+                {'id': 1, 'title': u'caf\xe9 ☃ "quoted" \\ [brackets] {braces}', 'posters': [[], {}]},
+                {'id': 2, 'title': u'\U0001f600', 'score': -1.5e3, 'pinned': False},
+                3,
+                'four',
+                None,
+            ],
+        },
+    }
+
+    def test_byte_at_a_time(self):
+        items = list(iter_items(chunked(self.document), ('topic_list', 'topics')))
+        self.assertEqual(items, self.document['topic_list']['topics'])
+
+    def test_chunk_sizes(self):
+        for size in (2, 3, 7, 64, 4096):
+            items = list(iter_items(chunked(self.document, size), ('topic_list', 'topics')))
+            self.assertEqual(items, self.document['topic_list']['topics'])
+
+    def test_top_level_array(self):
+        self.assertEqual(list(iter_items(chunked([{'a': 1}, [2], 3]))), [{'a': 1}, [2], 3])
+        self.assertEqual(list(iter_items(chunked([]))), [])
+
+    def test_numbers_split_anywhere(self):
+        data = b'[1.5, -20e3,1.5e10 , 0.25E-2,7,true,null]'
+        expected = [1.5, -20e3, 1.5e10, 0.25e-2, 7, True, None]
+        for i in range(1, len(data)):
+            for j in range(i, len(data)):
+                self.assertEqual(list(iter_items([data[:i], data[i:j], data[j:]])), expected)
+
+    def test_whitespace(self):
+        data = [b' { "a" : [ 1 ,\n 2 ] } ']
+        self.assertEqual(list(iter_items(data, ('a',))), [1, 2])
+
+    def test_missing_key(self):
+        with self.assertRaises(KeyError):
+            list(iter_items(chunked(self.document), ('topic_list', 'posts')))
+
+    def test_malformed(self):
+        with self.assertRaises(ValueError):
+            list(iter_items([b'{"a": [1, 2'], ('a',)))
+        with self.assertRaises(ValueError):
+            list(iter_items([b'{"a": {}}'], ('a',)))
+
+
+class TestClientStreaming(unittest.TestCase):
+    count = 20000
+
+    def setUp(self):
+        users = [{'id': i, 'username': 'user{0}'.format(i), 'bio': 'x' * 200} for i in range(self.count)]
+        self.body = json.dumps(users).encode('utf-8')
+
+        self.server = StubServer({
+            '/admin/users/list/active.json': (200, {'Content-Type': client.JSON_CONTENT}, self.body),
+            '/latest.json': {'topic_list': {'topics': [{'id': 1}, {'id': 2}]}},
+        }).start()
+        self.client = client.DiscourseClient(self.server.url, 'testuser', 'testkey')
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    @unittest.skipIf(tracemalloc is None, 'tracemalloc needs Python 3.4')
+    def test_stream_users_bounded_memory(self):
+        tracemalloc.start()
+        try:
+            count = 0
+            for user in self.client.stream_users():
+                self.assertEqual(user['id'], count)
+                count += 1
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(count, self.count)
+        # the stub server builds its response in this process too, so compare with a margin
+        self.assertLess(peak, len(self.body) / 4)
+
+    def test_stream_latest_topics(self):
+        self.assertEqual(list(self.client.stream_latest_topics()), [{'id': 1}, {'id': 2}])
+
+    def test_errors(self):
+        with self.assertRaises(DiscourseClientError):
+            list(self.client._stream('/missing.json', (), {}))
+
+        with self.assertRaises(DiscourseError):
+            list(self.client._stream('/latest.json', ('posts',), {}))
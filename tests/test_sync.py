@@ -0,0 +1,138 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from pydiscourse import client
+from pydiscourse.sync import CursorStore, ForumSync, TopicCursor
+from tests.stubserver import StubServer
+
+
+class Forum(object):
+    """ Topics with post ids, listed in /latest by bumped_at, two per page """
+    def __init__(self):
+        self.topics = {}
+        self.clock = 0
+        self.next_post = 100
+
+    def add_topic(self, topic_id, posts, pinned=False):
+        self.topics[topic_id] = {'id': topic_id, 'posts': [], 'pinned': pinned}
+        self.reply(topic_id, posts)
+
+    def reply(self, topic_id, posts=1):
+        self.clock += 1
+        topic = self.topics[topic_id]
+        topic['bumped_at'] = '2014-04-01T12:00:{0:02d}.000Z'.format(self.clock)
+        for _ in range(posts):
+            self.next_post += 1
+            topic['posts'].append(self.next_post)
+
+    def listing(self):
+        by_activity = sorted(self.topics.values(), key=lambda t: t['bumped_at'], reverse=True)
+        return [t for t in by_activity if t['pinned']] + [t for t in by_activity if not t['pinned']]
+
+    def routes(self):
+        def latest(request):
+            page = int(request.query.get('page', ['0'])[0])
+            topics = [{'id': t['id'], 'bumped_at': t['bumped_at'], 'pinned': t['pinned'],
+                       'highest_post_number': len(t['posts'])} for t in self.listing()]
+            topic_list = {'topics': topics[page * 2:page * 2 + 2]}
+            if page * 2 + 2 < len(topics):
+                topic_list['more_topics_url'] = '/latest?page={0}'.format(page + 1)
+            return {'topic_list': topic_list}
+
+        def topic(request):
+            stream = self.topics[int(request.path[3:-5])]['posts']
+            return {'post_stream': {'stream': stream, 'posts': [self.post(i) for i in stream[:2]]}}
+
+        def posts(request):
+            return {'post_stream': {'posts': [self.post(int(i)) for i in request.query['post_ids[]']]}}
+
+        return {'/latest.json': latest, '/t/*/posts.json': posts, '/t/*.json': topic}
+
+    def post(self, post_id):
+        return {'id': post_id}
+
+
+class TestForumSync(unittest.TestCase):
+    def setUp(self):
+        self.forum = Forum()
+        self.forum.add_topic(1, 3)
+        self.forum.add_topic(2, 5)
+        self.forum.add_topic(3, 1)
+        self.forum.add_topic(4, 2)
+        self.server = StubServer(self.forum.routes()).start()
+        self.client = client.DiscourseClient(self.server.url, 'system', 'testkey')
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'sync.db')
+        self.handled = []
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+        shutil.rmtree(self.tmp)
+
+    def handler(self, topic, posts):
+        self.handled.append((topic['id'], [p['id'] for p in posts]))
+
+    def sync(self, handler=None):
+        del self.handled[:]
+        del self.server.requests[:]
+        with ForumSync(self.client, self.path, workers=2) as sync:
+            return sync.run(handler or self.handler)
+
+    def topic_requests(self):
+        return [r.path for r in self.server.requests if r.path.startswith('/t/')]
+
+    def test_first_run(self):
+        stats = self.sync()
+        self.assertEqual(stats, {'topics': 4, 'posts': 11, 'unchanged': 0})
+        self.assertEqual(self.handled, [(4, [110, 111]), (3, [109]), (2, [104, 105, 106, 107, 108]),
+                                        (1, [101, 102, 103])])
+
+        store = CursorStore(self.path)
+        self.assertEqual(store.get(2), TopicCursor(2, 5, '2014-04-01T12:00:02.000Z', 108))
+        self.assertEqual(store.watermark, '2014-04-01T12:00:04.000Z')
+        store.close()
+
+    def test_incremental(self):
+        self.sync()
+        self.assertEqual(self.sync(), {'topics': 0, 'posts': 0, 'unchanged': 0})
+        self.assertEqual(self.topic_requests(), [])
+
+        self.forum.reply(1, 2)
+        self.assertEqual(self.sync(), {'topics': 1, 'posts': 2, 'unchanged': 0})
+        self.assertEqual(self.handled, [(1, [112, 113])])
+        # the first posts come with the topic, only new ones beyond them are requested
+        self.assertEqual(self.topic_requests(), ['/t/1.json', '/t/1/posts.json'])
+        chunk = [r for r in self.server.requests if r.path == '/t/1/posts.json'][0]
+        self.assertEqual(chunk.query['post_ids[]'], ['112', '113'])
+
+    def test_bumped_without_posts(self):
+        self.sync()
+        self.forum.topics[3]['bumped_at'] = '2014-04-01T12:00:09.000Z'
+        self.assertEqual(self.sync(), {'topics': 0, 'posts': 0, 'unchanged': 1})
+        self.assertEqual(self.topic_requests(), [])
+
+    def test_pinned_topics_do_not_stop_the_scan(self):
+        self.forum.add_topic(5, 1, pinned=True)
+        self.forum.topics[5]['bumped_at'] = '2014-04-01T12:00:00.000Z'
+        self.sync()
+        self.forum.reply(2)
+        self.sync()
+        self.assertEqual(self.handled, [(2, [113])])
+
+    def test_resume_after_crash(self):
+        def crash(topic, posts):
+            if topic['id'] == 2:
+                raise RuntimeError('killed')
+            self.handler(topic, posts)
+
+        self.assertRaises(RuntimeError, self.sync, crash)
+        store = CursorStore(self.path)
+        self.assertIsNone(store.watermark)
+        self.assertEqual(len(store), 2)
+        store.close()
+
+        self.sync()
+        self.assertEqual([topic_id for topic_id, _ in self.handled], [2, 1])
@@ -0,0 +1,84 @@
+import itertools
+import threading
+import time
+import unittest
+
+import mock
+
+from pydiscourse.exceptions import DiscourseServerError
+from pydiscourse.timings import TimingsBatcher
+
+
+class TestTimingsBatcher(unittest.TestCase):
+    def setUp(self):
+        self.client = mock.Mock()
+
+    def test_merges_same_topic(self):
+        with TimingsBatcher(self.client, interval=60) as batcher:
+            batcher.add(1, 1000, {1: 500, 2: 500})
+            batcher.add(1, 2000, {2: 1000, 3: 1000})
+            batcher.add(1, 100, {1: 100}, username='bob')
+            batcher.add(2, 100, {1: 100})
+
+        self.assertEqual(self.client.topic_timings.call_count, 3)
+        self.client.topic_timings.assert_any_call(1, 3000, {1: 500, 2: 1500, 3: 1000})
+        self.client.topic_timings.assert_any_call(1, 100, {1: 100}, api_username='bob')
+        self.assertEqual((batcher.added, batcher.sent), (4, 3))
+
+    def test_flush_on_size(self):
+        batcher = TimingsBatcher(self.client, max_pending=3, interval=60)
+        for topic_id in range(3):
+            batcher.add(topic_id, 100, {1: 100})
+
+        for _ in range(100):
+            if self.client.topic_timings.call_count == 3:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.client.topic_timings.call_count, 3)
+        batcher.close()
+
+    def test_flush_on_interval(self):
+        batcher = TimingsBatcher(self.client, interval=0.05)
+        batcher.add(1, 100, {1: 100})
+        time.sleep(0.2)
+        self.assertEqual(self.client.topic_timings.call_count, 1)
+        batcher.close()
+        self.assertEqual(self.client.topic_timings.call_count, 1)
+
+    def test_failures_do_not_stop_the_batch(self):
+        self.client.topic_timings.side_effect = [DiscourseServerError('boom'), None]
+        batcher = TimingsBatcher(self.client, interval=60)
+        batcher.add(1, 100, {1: 100})
+        batcher.add(2, 100, {1: 100})
+        batcher.close()
+
+        self.assertEqual((batcher.sent, batcher.failed), (1, 1))
+
+    def test_closed(self):
+        batcher = TimingsBatcher(self.client)
+        batcher.close()
+        with self.assertRaises(ValueError):
+            batcher.add(1, 100, {})
+
+    def test_add_racing_close(self):
+        batcher = TimingsBatcher(self.client, interval=60)
+        topic_ids = itertools.count()
+
+        def add():
+            try:
+                while True:
+                    batcher.add(next(topic_ids), 100, {1: 100})
+            except ValueError:
+                pass
+
+        threads = [threading.Thread(target=add) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.01)
+        batcher.close()
+        for thread in threads:
+            thread.join()
+
+        # every timing accepted was sent, each to a different topic
+        self.assertEqual(batcher.sent, batcher.added)
+        self.assertEqual(batcher._pending, {})